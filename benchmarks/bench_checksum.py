@@ -0,0 +1,25 @@
+from protohdr import *
+
+from numpy import arange, full
+from os import urandom
+from timeit import timeit
+
+
+if __name__ == "__main__":
+    COUNT = 10_000
+    ROUNDS = 10
+
+    for size in (40, 60, 200, 1400):
+        segments = [urandom(size) for _ in range(COUNT)]
+        buf = b"".join(segments)
+        offsets = arange(0, len(buf), size)
+        lengths = full(COUNT, size)
+
+        loop = timeit(lambda: [inet_checksum(s) for s in segments], number=ROUNDS)
+        batch = timeit(lambda: inet_checksum_batch(segments), number=ROUNDS)
+        flat = timeit(lambda: inet_checksum_batch(buf, offsets, lengths), number=ROUNDS)
+
+        print(f"{COUNT} x {size:>4} bytes: "
+              f"loop {loop / ROUNDS * 1e3:7.2f} ms, "
+              f"batch(list) {batch / ROUNDS * 1e3:6.2f} ms ({loop / batch:4.1f}x), "
+              f"batch(offsets) {flat / ROUNDS * 1e3:6.2f} ms ({loop / flat:4.1f}x)")
@@ -0,0 +1,39 @@
+from protohdr import *
+
+from dataclasses import replace
+from socket import AF_INET6, IPPROTO_TCP, inet_pton
+from timeit import timeit
+
+
+if __name__ == "__main__":
+    NUMBER = 100_000
+
+    ip4 = IPHeader(version=4, header_len=20, tos=0, total_len=0, identifier=0x1234,
+                   flags=IPFlag.DONT_FRAG, frag_offset=0, ttl=64, protocol=IPPROTO_TCP,
+                   checksum=0, src_addr="10.0.0.1", dst_addr="10.0.0.2")
+    ip6 = IPv6Header(version=6, traffic_class=0, flow_label=0x12345, payload_len=0,
+                     next_header=IPPROTO_TCP, hop_limit=64,
+                     src_addr="2001:db8::1", dst_addr="2001:db8:ffff:1234::abcd")
+    tcp = TCPHeader(src_port=0x1234, dst_port=80, seq_num=0x12345678, ack_num=0,
+                    data_offset=32, flags=TCPFlag.SYN, window=0xffff, checksum=0,
+                    urg_ptr=0, options=TCPOption.nop() * 2 + TCPOption.ts(1, 2))
+
+    addr = ip6.dst_addr
+    assert inet_pack_addr(addr, 6) == inet_pton(AF_INET6, addr)
+    old = timeit(lambda: inet_pton(AF_INET6, addr), number=NUMBER) / NUMBER
+    new = timeit(lambda: inet_pack_addr(addr, 6), number=NUMBER) / NUMBER
+    print(f"IPv6 address: inet_pton {old * 1e9:6.0f} ns, cached {new * 1e9:6.0f} ns")
+
+    for ip, dsts in ((ip4, ["10.1.%d.%d" % (i >> 8, i & 0xFF) for i in range(1024)]),
+                     (ip6, ["2001:db8::%x" % i for i in range(1024)])):
+        tcp_ = replace(tcp)
+        buf = bytearray(len(ip) + len(tcp_))
+        packet = Packet(ip, tcp_)
+        packet.pack_into(buf)
+        t = timeit(lambda: packet.pack_into(buf), number=NUMBER) / NUMBER
+        print(f"{type(ip).__name__:>10}: Packet.pack_into {1 / t:9.0f} pps")
+
+        template = PacketTemplate(ip, tcp_, ("dst_addr",), ("dst_port", "seq_num"))
+        rows = [(dst, 443, i) for i, dst in enumerate(dsts)] * (NUMBER // len(dsts))
+        t = timeit(lambda: sum(1 for _ in template.packets(rows)), number=1) / len(rows)
+        print(f"{type(ip).__name__:>10}: PacketTemplate   {1 / t:9.0f} pps")
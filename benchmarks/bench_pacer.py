@@ -0,0 +1,17 @@
+from protohdr import *
+
+from time import perf_counter
+
+
+if __name__ == "__main__":
+    PACKET = bytes(64)
+
+    for pps in (1_000, 10_000, 100_000, 250_000):
+        pacer = Pacer(pps=pps)
+        start = perf_counter()
+        count = sum(len(batch) for batch in pacer.batches(PACKET for _ in range(pps)))
+        achieved = count / (perf_counter() - start)
+        stats = pacer.stats
+        print(f"{pps:>7} pps target: {achieved:10.0f} pps "
+              f"({(achieved - pps) / pps:+.2%}), {stats.batches} batches, "
+              f"lateness {stats.lateness * 1e6:.0f} us, jitter {stats.jitter * 1e6:.0f} us")
@@ -0,0 +1,27 @@
+from protohdr import *
+
+from ipaddress import IPv4Network
+from os import cpu_count
+from socket import IPPROTO_TCP
+from time import perf_counter
+
+
+if __name__ == "__main__":
+    TARGETS = IPv4Network("10.0.0.0/14")
+    PORTS = [80]
+
+    ip = IPHeader(version=4, header_len=20, tos=0, total_len=0, identifier=0,
+                  flags=0, frag_offset=0, ttl=64, protocol=IPPROTO_TCP,
+                  checksum=0, src_addr="10.255.0.1", dst_addr="0.0.0.0")
+    tcp = TCPHeader(src_port=40000, dst_port=0, seq_num=0, ack_num=0,
+                    data_offset=32, flags=TCPFlag.SYN, window=1024,
+                    checksum=0, urg_ptr=0)
+
+    workers = 1
+    while workers <= (cpu_count() or 1):
+        with PacketPipeline(ip, tcp, TARGETS, PORTS, workers=workers) as pipe:
+            start = perf_counter()
+            count = sum(len(batch) for batch in pipe.batches())
+            elapsed = perf_counter() - start
+        print(f"{workers:>2} workers: {count} packets, {count / elapsed:10.0f} pps")
+        workers *= 2
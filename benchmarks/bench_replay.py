@@ -0,0 +1,32 @@
+from protohdr import *
+
+from os import urandom
+from socket import IPPROTO_TCP
+from tempfile import NamedTemporaryFile
+from time import perf_counter
+
+
+if __name__ == "__main__":
+    COUNT = 500_000
+
+    ip = IPHeader(version=4, header_len=20, tos=0, total_len=0, identifier=0,
+                  flags=0, frag_offset=0, ttl=64, protocol=IPPROTO_TCP,
+                  checksum=0, src_addr="10.0.0.1", dst_addr="10.0.0.2")
+    tcp = TCPHeader(src_port=40000, dst_port=80, seq_num=0, ack_num=0,
+                    data_offset=32, flags=TCPFlag.SYN, window=1024,
+                    checksum=0, urg_ptr=0, data=urandom(64))
+    pkt = bytes(ip / tcp)
+
+    rewriter = Rewriter(src_addr="192.168.0.1", dst_addr={"10.0.0.2": "192.168.0.2"},
+                        dst_port={80: 8080}, ttl=lambda ttl: ttl - 1)
+
+    with NamedTemporaryFile(suffix=".pcap") as file:
+        with PcapWriter(file.name) as writer:
+            writer.write_many(pkt for _ in range(COUNT))
+
+        for name, rw in (("copy only", None), ("rewrite", rewriter)):
+            with PcapReader(file.name) as reader:
+                start = perf_counter()
+                stats = replay(reader.ip_packets(), lambda batch: None, rw)
+                elapsed = perf_counter() - start
+            print(f"{name:>10}: {stats.packets} packets, {stats.packets / elapsed:10.0f} pps")
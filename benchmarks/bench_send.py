@@ -0,0 +1,45 @@
+from protohdr import *
+
+from socket import AF_INET, IPPROTO_UDP, SOCK_DGRAM, socket
+from time import perf_counter
+
+
+if __name__ == "__main__":
+    COUNT = 100_000
+
+    # Loopback UDP: datagrams the receiver cannot keep up with are dropped,
+    # so only the sending side is measured.
+    rx = socket(AF_INET, SOCK_DGRAM)
+    rx.bind(("127.0.0.1", 0))
+    address = rx.getsockname()
+    tx = socket(AF_INET, SOCK_DGRAM)
+
+    ip = IPHeader(version=4, header_len=20, tos=0, total_len=0, identifier=0,
+                  flags=0, frag_offset=0, ttl=64, protocol=IPPROTO_UDP,
+                  checksum=0, src_addr="127.0.0.1", dst_addr="127.0.0.1")
+    udp = UDPHeader(src_port=1024, dst_port=address[1], header_len=0,
+                    checksum=0, data=b"\x00" * 32)
+    template = PacketTemplate(ip, udp, ["identifier"])
+    packets = [template.build(i & 0xFFFF) for i in range(COUNT)]
+    rows = [(i & 0xFFFF,) for i in range(COUNT)]
+
+    start = perf_counter()
+    for pkt in packets:
+        tx.sendto(pkt, address)
+    loop = COUNT / (perf_counter() - start)
+    print(f"sendto loop:          {loop:10.0f} pps")
+
+    start = perf_counter()
+    for values in rows:
+        tx.sendto(template.build(*values), address)
+    build = COUNT / (perf_counter() - start)
+    print(f"build + sendto loop:  {build:10.0f} pps")
+
+    for batch_size in (16, 64, 256):
+        sender = Sender(tx, address, batch_size)
+        stats = sender.send(packets)
+        print(f"send({batch_size:>3}):            {stats.pps:10.0f} pps ({stats.pps / loop:4.1f}x), "
+              f"{stats.calls} calls, {stats.partial} partial")
+        stats = sender.send_template(template, rows)
+        print(f"send_template({batch_size:>3}):   {stats.pps:10.0f} pps ({stats.pps / build:4.1f}x), "
+              f"{stats.calls} calls, {stats.partial} partial")
@@ -0,0 +1,84 @@
+from protohdr import *
+
+from socket import IPPROTO_TCP, inet_aton
+from timeit import timeit
+
+
+def legacy_ip(h: IPHeader) -> bytes:
+    """ `IPHeader.__bytes__` as built with `i2bb` concatenation. """
+    header = b""
+    header += i2bb(8, (h.version << 4) | (h.header_len // 4))
+    header += i2bb(8, h.tos)
+    header += i2bb(16, h.total_len)
+    header += i2bb(16, h.identifier)
+    header += i2bb(16, (h.flags << 13) | h.frag_offset)
+    header += i2bb(8, h.ttl)
+    header += i2bb(8, h.protocol)
+    header += i2bb(16, h.checksum)
+    header += inet_aton(h.src_addr)
+    header += inet_aton(h.dst_addr)
+    return header
+
+
+def legacy_tcp(h: TCPHeader) -> bytes:
+    header = b""
+    header += i2bb(16, h.src_port)
+    header += i2bb(16, h.dst_port)
+    header += i2bb(32, h.seq_num)
+    header += i2bb(32, h.ack_num)
+    header += i2bb(16, ((h.data_offset // 4) << 12) | h.flags)
+    header += i2bb(16, h.window)
+    header += i2bb(16, h.checksum)
+    header += i2bb(16, h.urg_ptr)
+    header += h.options
+    while len(header) < 32:
+        header += b"\x00"
+    header += h.data
+    return header
+
+
+def legacy_udp(h: UDPHeader) -> bytes:
+    header = b""
+    header += i2bb(16, h.src_port)
+    header += i2bb(16, h.dst_port)
+    header += i2bb(16, h.header_len)
+    header += i2bb(16, h.checksum)
+    header += h.data
+    return header
+
+
+def legacy_icmp(h: ICMPHeader) -> bytes:
+    header = b""
+    header += i2bb(8, h.type)
+    header += i2bb(8, h.code)
+    header += i2bb(16, h.checksum)
+    header += i2bb(16, h.identifier)
+    header += i2bb(16, h.seq_num)
+    header += h.data
+    return header
+
+
+if __name__ == "__main__":
+    NUMBER = 100_000
+
+    ip = IPHeader(version=4, header_len=20, tos=0, total_len=60, identifier=0x1234,
+                  flags=IPFlag.DONT_FRAG, frag_offset=0, ttl=64, protocol=IPPROTO_TCP,
+                  checksum=0, src_addr="10.0.0.1", dst_addr="10.0.0.2")
+    tcp = TCPHeader(src_port=0x1234, dst_port=80, seq_num=0x12345678, ack_num=0,
+                    data_offset=32, flags=TCPFlag.SYN, window=0xffff, checksum=0,
+                    urg_ptr=0, options=TCPOption.nop() * 2 + TCPOption.ts(1, 2))
+    udp = UDPHeader(src_port=0x1234, dst_port=53, header_len=8 + 32, checksum=0,
+                    data=b"A" * 32)
+    icmp = ICMPHeader(type=ICMPMessage.ECHO, code=0, checksum=0, identifier=1,
+                      seq_num=1, data=ICMPPayload.echo(b"A" * 56))
+
+    for hdr, legacy in ((ip, legacy_ip), (tcp, legacy_tcp), (udp, legacy_udp), (icmp, legacy_icmp)):
+        assert bytes(hdr) == legacy(hdr)
+        fields = {name: getattr(hdr, name) for name in hdr.__dataclass_fields__}
+        old = timeit(lambda: legacy(hdr), number=NUMBER) / NUMBER
+        new = timeit(lambda: (hdr.invalidate(), bytes(hdr)), number=NUMBER) / NUMBER
+        memo = timeit(lambda: bytes(hdr), number=NUMBER) / NUMBER
+        build = timeit(lambda: type(hdr)(**fields), number=NUMBER) / NUMBER
+        print(f"{type(hdr).__name__:>10}: concat {old * 1e9:6.0f} ns, "
+              f"struct {new * 1e9:6.0f} ns ({old / new:.1f}x), "
+              f"memoized {memo * 1e9:6.0f} ns, construction {build * 1e9:6.0f} ns")
@@ -0,0 +1,26 @@
+from protohdr import *
+
+from socket import AF_INET, IP_HDRINCL, IPPROTO_ICMP, IPPROTO_IP, SOCK_RAW, SOL_SOCKET, socket
+
+
+SO_RCVBUFFORCE = 33
+
+
+if __name__ == "__main__":
+    COUNT = 50_000
+
+    # Loopback answers echo requests to all of 127.0.0.0/8, so every
+    # address is a live host. Needs root (CAP_NET_RAW, CAP_NET_ADMIN).
+    sock = socket(AF_INET, SOCK_RAW, IPPROTO_ICMP)
+    sock.setsockopt(IPPROTO_IP, IP_HDRINCL, 1)
+    sock.setsockopt(SOL_SOCKET, SO_RCVBUFFORCE, 1 << 24)
+    targets = range(0x7F010000, 0x7F010000 + COUNT)
+
+    for pps in (2_000, 20_000, None):
+        pacer = Pacer(pps=pps) if pps is not None else None
+        sweeper = EchoSweeper(sock, timeout=0.5, retries=1, pacer=pacer)
+        rtts = sorted(r.rtt for r in sweeper.sweep(targets[:pps or COUNT]) if r.rtt is not None)
+        stats = sweeper.stats
+        print(f"rate {pps or 'unpaced':>8}: {stats.hosts_per_second * 60:10.0f} hosts/min, "
+              f"{stats.replies} replies, {stats.timeouts} timeouts, {stats.retries} retries, "
+              f"median RTT {rtts[len(rtts) // 2] * 1e6:6.0f} us")
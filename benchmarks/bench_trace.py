@@ -0,0 +1,34 @@
+from protohdr import *
+
+from socket import (
+    AF_INET, IP_HDRINCL, IPPROTO_ICMP, IPPROTO_TCP, IPPROTO_UDP, IPPROTO_IP, SOCK_RAW,
+    SOL_SOCKET, socket,
+)
+
+
+SO_RCVBUFFORCE = 33
+
+
+if __name__ == "__main__":
+    COUNT = 2_000
+    MAX_TTL = 30
+
+    # Every 127.0.0.0/8 address answers on loopback at TTL 1, and the
+    # probes of the higher TTLs are answered by it as well, so all
+    # COUNT * MAX_TTL probes are sent and answered. Needs root.
+    sock = socket(AF_INET, SOCK_RAW, IPPROTO_ICMP)
+    sock.setsockopt(IPPROTO_IP, IP_HDRINCL, 1)
+    sock.setsockopt(SOL_SOCKET, SO_RCVBUFFORCE, 1 << 24)
+    tcp = socket(AF_INET, SOCK_RAW, IPPROTO_TCP)
+    tcp.setsockopt(SOL_SOCKET, SO_RCVBUFFORCE, 1 << 24)
+    targets = range(0x7F020000, 0x7F020000 + COUNT)
+
+    for protocol in (IPPROTO_UDP, IPPROTO_TCP, IPPROTO_ICMP):
+        tracer = Tracer(sock, protocol, listen=(tcp,), max_ttl=MAX_TTL, timeout=1.0)
+        for _ in tracer.trace(targets):
+            pass
+        stats = tracer.stats
+        reached = sum(route.reached is not None for route in tracer.routes.values())
+        print(f"protocol {protocol:>2}: {COUNT} paths in {stats.elapsed:5.2f} s, "
+              f"{stats.sent / stats.elapsed:8.0f} probes/s, {reached} reached, "
+              f"{stats.timeouts} timeouts")
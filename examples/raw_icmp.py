@@ -28,7 +28,6 @@ if __name__ == "__main__":
         src_addr    = "127.0.0.1",
         dst_addr    = TARGET_IP
     )
-    ip.header_len = len(ip)
 
     # Create ICMP header.
     icmp = ICMPHeader(
@@ -39,13 +38,9 @@ if __name__ == "__main__":
         seq_num     = randint(0x1000, 0xffff),
         data        = ICMPPayload.echo(b"A" * 64)
     )
-    icmp.checksum = inet_checksum(bytes(icmp))
 
-    # Finalize IP packet.
-    ip.total_len = ip.header_len + len(icmp)
-    ip.checksum = inet_checksum(bytes(ip))
-
-    pkt = bytes(ip) + bytes(icmp)
+    # Fill in lengths and checksums.
+    pkt = bytes(ip / icmp)
 
     # Create raw ICMP socket.
     s = socket(AF_INET, SOCK_RAW, IPPROTO_ICMP)
@@ -29,7 +29,6 @@ if __name__ == "__main__":
         src_addr    = "1.2.3.4",
         dst_addr    = TARGET_IP
     )
-    ip.header_len = len(ip)
 
     # Create TCP header.
     tcp = TCPHeader(
@@ -44,13 +43,9 @@ if __name__ == "__main__":
         urg_ptr     = 0x0000,
         options     = TCPOption.nop() + TCPOption.nop() + TCPOption.ts(0xFFFFFFFF, 0xFFFFFFFF),
     )
-    tcp.checksum = inet_checksum(bytes(tcp))
 
-    # Finalize IP header.
-    ip.total_len = ip.header_len + len(tcp)
-    ip.checksum = inet_checksum(bytes(ip))
-
-    pkt = bytes(ip) + bytes(tcp)
+    # Fill in lengths and checksums.
+    pkt = bytes(ip / tcp)
 
     # Create raw TCP socket.
     s = socket(AF_INET, SOCK_RAW, IPPROTO_TCP)
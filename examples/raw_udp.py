@@ -29,7 +29,6 @@ if __name__ == "__main__":
         src_addr    = "1.2.3.4",
         dst_addr    = TARGET_IP
     )
-    ip.header_len = len(ip)
 
     # Create UDP header.
     udp = UDPHeader(
@@ -39,14 +38,9 @@ if __name__ == "__main__":
         checksum    = 0x0000,
         data        = b'\n0MG 1m 4 UDP p4ck3t !!!'
     )
-    udp.header_len = len(udp)
-    udp.checksum = inet_checksum(bytes(udp))
 
-    # Finalize IP packet.
-    ip.total_len = ip.header_len + udp.header_len
-    ip.checksum = inet_checksum(bytes(ip))
-
-    pkt = bytes(ip) + bytes(udp)
+    # Fill in lengths and checksums.
+    pkt = bytes(ip / udp)
 
     # Create raw UDP socket.
     s = socket(AF_INET, SOCK_RAW, IPPROTO_UDP)
@@ -17,6 +17,21 @@
 from ._inet import *
 from ._header import *
 from ._headers import *
+from ._packet import *
+from ._template import *
+from ._batch import *
+from ._sender import *
+from ._aio import *
+from ._pipeline import *
+from ._probe import *
+from ._pacer import *
+from ._pcap import *
+from ._replay import *
+from ._bpf import *
+from ._fragment import *
+from ._wheel import *
+from ._sweep import *
+from ._trace import *
 
 
 __version__ = "1.0"
@@ -0,0 +1,276 @@
+#  This file is part of protohdr-python3
+#  Copyright (C) 2022 ecriminal
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+
+from asyncio import (
+    AbstractEventLoop, DatagramProtocol, DatagramTransport, get_running_loop,
+)
+from collections import deque
+from socket import (
+    AF_INET, IP_HDRINCL, IPPROTO_ICMP, IPPROTO_IP, SOCK_RAW, inet_ntoa, socket,
+)
+from typing import Any, Callable
+
+from ._header import *
+from ._headers import *
+from ._packet import *
+from ._sender import _includes_header
+
+
+__all__ = (
+    "RawProtocol",
+    "RawTransport",
+    "create_raw_connection",
+)
+
+
+_MAX_PACKET = 0x10000
+""" Receive buffer size, enough for any IPv4 packet. """
+
+_MAX_READS = 64
+""" Packets read per readiness event before yielding to the loop. """
+
+_DST_OFFSET = 16
+""" Offset of the destination address in an IPv4 header. """
+
+
+class RawProtocol(DatagramProtocol):
+    """ Protocol for `RawTransport` receiving decoded packets.
+
+        datagram_received() decodes every packet with `decode_packet` and
+        passes the headers to packet_received(). Packets that fail to
+        decode are reported to error_received() with the ValueError.
+        Override datagram_received() to handle raw bytes instead.
+    """
+
+    def datagram_received(self, data: bytes, addr: tuple[str, int]) -> None:
+        try:
+            ip, transport = decode_packet(data)
+        except ValueError as exc:
+            self.error_received(exc)
+            return
+        self.packet_received(ip, transport, addr)
+
+    def packet_received(self, ip: IPHeader, transport: Header | None,
+                        addr: tuple[str, int]) -> None:
+        """ Called with the headers of every received packet. Transport
+            options and data are memoryview slices of the packet. """
+
+
+class RawTransport(DatagramTransport):
+    """ Event loop driven transport over a non-blocking raw socket.
+
+        sendto() accepts bytes-like objects as well as `Header` and
+        `Packet` objects, which are serialized with bytes(). Without an
+        address, packets sent on an AF_INET raw socket with IP_HDRINCL
+        set go to the destination in their IPv4 header, and other
+        sockets must be connected. Packets are sent right away while the socket accepts
+        them and buffered otherwise; the protocol is paused once the
+        buffer exceeds the high watermark and resumed once it drains
+        below the low watermark.
+    """
+
+    def __init__(self, loop: AbstractEventLoop, sock: socket,
+                 protocol: DatagramProtocol, extra: dict[str, Any] | None = None) -> None:
+        super().__init__(extra)
+        self._extra["socket"] = sock
+        self._loop = loop
+        self._sock = sock
+        self._fileno = sock.fileno()
+        self._protocol = protocol
+        self._per_packet_dst = sock.family == AF_INET and _includes_header(sock)
+        self._buffer = deque()
+        self._buffer_size = 0
+        self._high_water = 0
+        self._low_water = 0
+        self._paused = False
+        self._closing = False
+        self.set_write_buffer_limits()
+        sock.setblocking(False)
+        loop.call_soon(protocol.connection_made, self)
+        # Only reads once the protocol knows its transport.
+        loop.call_soon(self._add_reader)
+
+    def get_protocol(self) -> DatagramProtocol:
+        return self._protocol
+
+    def set_protocol(self, protocol: DatagramProtocol) -> None:
+        self._protocol = protocol
+
+    def is_closing(self) -> bool:
+        return self._closing
+
+    def get_write_buffer_size(self) -> int:
+        return self._buffer_size
+
+    def get_write_buffer_limits(self) -> tuple[int, int]:
+        return self._low_water, self._high_water
+
+    def set_write_buffer_limits(self, high: int | None = None, low: int | None = None) -> None:
+        """ Set the flow control watermarks in bytes, by default 64 KiB
+            and a quarter of `high`. """
+        if high is None:
+            high = 0x10000 if low is None else 4 * low
+        if low is None:
+            low = high // 4
+        if not high >= low >= 0:
+            raise ValueError(f"high ({high}) must be >= low ({low}) must be >= 0")
+        self._high_water = high
+        self._low_water = low
+        self._maybe_pause_protocol()
+
+    def sendto(self, data: bytes | bytearray | memoryview | Header | Packet,
+               addr: tuple[str, int] | None = None) -> None:
+        if isinstance(data, (Header, Packet)):
+            data = bytes(data)
+        if self._closing:
+            raise RuntimeError("cannot send on a closing transport")
+        if addr is None and self._per_packet_dst:
+            if len(data) < _DST_OFFSET + 4:
+                raise ValueError(f"packet of {len(data)} bytes has no IPv4 destination address")
+            addr = (inet_ntoa(data[_DST_OFFSET:_DST_OFFSET + 4]), 0)
+        if not self._buffer:
+            try:
+                self._send(data, addr)
+                return
+            except (BlockingIOError, InterruptedError):
+                self._loop.add_writer(self._fileno, self._write_ready)
+            except OSError as exc:
+                self._protocol.error_received(exc)
+                return
+        # Buffered data must not change under us.
+        self._buffer.append((bytes(data), addr))
+        self._buffer_size += len(data)
+        self._maybe_pause_protocol()
+
+    def close(self) -> None:
+        if self._closing:
+            return
+        self._closing = True
+        self._loop.remove_reader(self._fileno)
+        if not self._buffer:
+            self._loop.call_soon(self._call_connection_lost, None)
+
+    def abort(self) -> None:
+        self._force_close(None)
+
+    def _send(self, data: bytes | bytearray | memoryview, addr: tuple[str, int] | None) -> None:
+        if addr is None:
+            self._sock.send(data)
+        else:
+            self._sock.sendto(data, addr)
+
+    def _write_ready(self) -> None:
+        while self._buffer:
+            data, addr = self._buffer[0]
+            try:
+                self._send(data, addr)
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError as exc:
+                self._protocol.error_received(exc)
+            self._buffer.popleft()
+            self._buffer_size -= len(data)
+        self._maybe_resume_protocol()
+        if not self._buffer:
+            self._loop.remove_writer(self._fileno)
+            if self._closing:
+                self._call_connection_lost(None)
+
+    def _add_reader(self) -> None:
+        if not self._closing:
+            self._loop.add_reader(self._fileno, self._read_ready)
+
+    def _read_ready(self) -> None:
+        for _ in range(_MAX_READS):
+            if self._closing:
+                return
+            try:
+                data, addr = self._sock.recvfrom(_MAX_PACKET)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as exc:
+                self._protocol.error_received(exc)
+                return
+            self._protocol.datagram_received(data, addr)
+
+    def _maybe_pause_protocol(self) -> None:
+        if self._paused or self._buffer_size <= self._high_water:
+            return
+        self._paused = True
+        self._protocol_call(self._protocol.pause_writing)
+
+    def _maybe_resume_protocol(self) -> None:
+        if not self._paused or self._buffer_size > self._low_water:
+            return
+        self._paused = False
+        self._protocol_call(self._protocol.resume_writing)
+
+    def _protocol_call(self, callback: Callable[[], None]) -> None:
+        try:
+            callback()
+        except (SystemExit, KeyboardInterrupt):
+            raise
+        except BaseException as exc:
+            self._loop.call_exception_handler({
+                "message": f"{callback.__name__}() failed",
+                "exception": exc,
+                "transport": self,
+                "protocol": self._protocol,
+            })
+
+    def _force_close(self, exc: BaseException | None) -> None:
+        if self._buffer:
+            self._buffer.clear()
+            self._buffer_size = 0
+            self._loop.remove_writer(self._fileno)
+        if not self._closing:
+            self._closing = True
+            self._loop.remove_reader(self._fileno)
+        self._loop.call_soon(self._call_connection_lost, exc)
+
+    def _call_connection_lost(self, exc: BaseException | None) -> None:
+        if self._sock is None:
+            return
+        try:
+            self._protocol.connection_lost(exc)
+        finally:
+            self._sock.close()
+            self._sock = None
+
+
+async def create_raw_connection(protocol_factory: Callable[[], DatagramProtocol],
+                                proto: int = IPPROTO_ICMP, *, hdrincl: bool = True,
+                                sock: socket | None = None) -> tuple[RawTransport, DatagramProtocol]:
+    """ Open a raw socket for `proto` on the running event loop.
+
+        With `hdrincl`, IP_HDRINCL is set so that packets include their
+        own IP header. An existing socket can be passed as `sock` instead,
+        e.g. one end of a socketpair() for testing.
+    """
+    loop = get_running_loop()
+    if sock is None:
+        sock = socket(AF_INET, SOCK_RAW, proto)
+        try:
+            if hdrincl:
+                sock.setsockopt(IPPROTO_IP, IP_HDRINCL, 1)
+        except OSError:
+            sock.close()
+            raise
+    protocol = protocol_factory()
+    transport = RawTransport(loop, sock, protocol)
+    return transport, protocol
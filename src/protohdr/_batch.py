@@ -0,0 +1,308 @@
+#  This file is part of protohdr-python3
+#  Copyright (C) 2022 ecriminal
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+
+from numpy import (
+    arange      as np_arange,
+    asarray     as np_asarray,
+    dtype       as np_dtype,
+    empty       as np_empty,
+    frombuffer  as np_frombuffer,
+    full        as np_full,
+    ndarray     as np_ndarray,
+    uint8       as np_uint8,
+    uint16      as np_uint16,
+    uint64      as np_uint64,
+)
+
+from socket import IPPROTO_UDP, inet_aton
+from typing import TYPE_CHECKING, Any, ClassVar, Self
+
+from ._header import *
+from ._headers import *
+from ._inet import *
+
+if TYPE_CHECKING:
+    from numpy.typing import ArrayLike, NDArray
+
+
+__all__ = (
+    "HeaderBatch",
+    "IPHeaderBatch",
+    "TCPHeaderBatch",
+    "UDPHeaderBatch",
+    "ICMPHeaderBatch",
+    "pack_batches",
+)
+
+
+def _fold(sums: NDArray) -> NDArray:
+    """ Fold one's complement sums of up to 48 bits down to 16 bits. """
+    for _ in range(3):
+        sums = (sums >> 16) + (sums & 0xFFFF)
+    return sums
+
+
+def _addr_column(values: Any) -> Any:
+    """ Convert dotted-quad address(es) to their 32-bit wire value. """
+    if isinstance(values, str):
+        return int.from_bytes(inet_aton(values), "big")
+    if isinstance(values, np_ndarray):
+        return values
+    values = list(values)
+    if values and isinstance(values[0], str):
+        return [int.from_bytes(inet_aton(v), "big") for v in values]
+    return values
+
+
+class HeaderBatch:
+    """ Columnar batch of protocol headers backed by a NumPy structured
+        array whose rows are laid out exactly as on the wire.
+
+        Columns carry the field names of the matching `Header` class and
+        are read and assigned with `batch["field"]`; bit-packed fields are
+        derived from the word holding them. Addresses are 32-bit integers
+        in network order and may be assigned as dotted-quad strings.
+        Options and data are fixed per batch and stored in every row.
+        `batch[i]` decodes a single row into a full header.
+    """
+    __slots__ = ("_array",)
+
+    _header: ClassVar[type[Header]]
+    """ Header class of a single row. """
+
+    _fields: ClassVar[list[tuple[str, str]]]
+    """ Fixed part of the row dtype. """
+
+    _bitfields: ClassVar[dict[str, tuple[str, int, int, int]]] = {}
+    """ Field name -> (storage column, shift, mask, scale). """
+
+    _addr_fields: ClassVar[tuple[str, ...]] = ()
+    """ Columns holding IPv4 addresses. """
+
+    def __init__(self, array: NDArray) -> None:
+        self._array = array
+
+    @classmethod
+    def _row_dtype(cls, header: Header) -> np_dtype:
+        return np_dtype(cls._fields)
+
+    @classmethod
+    def from_header(cls, header: Header, count: int) -> Self:
+        """ Create a batch of `count` copies of `header`. """
+        dtype = cls._row_dtype(header)
+        array = np_empty(count, dtype)
+        array[:] = np_frombuffer(bytes(header), dtype)[0]
+        return cls(array)
+
+    @property
+    def array(self) -> NDArray:
+        """ Underlying structured array. """
+        return self._array
+
+    @property
+    def row_size(self) -> int:
+        """ Wire size of a single row. """
+        return self._array.dtype.itemsize
+
+    def __len__(self) -> int:
+        return len(self._array)
+
+    def __getitem__(self, key: str | int) -> Any:
+        if not isinstance(key, str):
+            return self._header.from_bytes(self._array[key:key + 1 or None].tobytes())
+        if key in self._bitfields:
+            storage, shift, mask, scale = self._bitfields[key]
+            return ((self._array[storage] >> shift) & mask) * scale
+        return self._array[key]
+
+    def __setitem__(self, key: str, values: ArrayLike) -> None:
+        if key in self._addr_fields:
+            values = _addr_column(values)
+        if key in self._bitfields:
+            storage, shift, mask, scale = self._bitfields[key]
+            column = self._array[storage]
+            values = (np_asarray(values, column.dtype) // scale) & mask
+            column &= ~(mask << shift) & ((1 << (8 * column.itemsize)) - 1)
+            column |= values << shift
+        else:
+            self._array[key] = values
+
+    def __bytes__(self) -> bytes:
+        return self._array.tobytes()
+
+    def pack_into(self, buffer: bytearray | memoryview, offset: int = 0) -> int:
+        """ Write all rows back to back into `buffer` at `offset`. """
+        size = self._array.nbytes
+        check_room(buffer, offset, size)
+        memoryview(buffer)[offset:offset + size] = self._array.view(np_uint8)
+        return size
+
+    def _sums(self) -> NDArray:
+        """ Folded one's complement sum of every row. """
+        n = len(self._array)
+        data = self._array.view(np_uint8)
+        checksums = inet_checksum_batch(data, np_arange(n) * self.row_size, np_full(n, self.row_size))
+        return 0xFFFF - checksums.astype(np_uint64)
+
+
+class IPHeaderBatch(HeaderBatch):
+    """ Columnar batch of `IPHeader` rows. """
+    __slots__ = ()
+
+    _header = IPHeader
+    _fields = [
+        ("_vhl",        "u1"),
+        ("tos",         "u1"),
+        ("total_len",   ">u2"),
+        ("identifier",  ">u2"),
+        ("_flags_off",  ">u2"),
+        ("ttl",         "u1"),
+        ("protocol",    "u1"),
+        ("checksum",    ">u2"),
+        ("src_addr",    ">u4"),
+        ("dst_addr",    ">u4"),
+    ]
+    _bitfields = {
+        "version":      ("_vhl", 4, 0xF, 1),
+        "header_len":   ("_vhl", 0, 0xF, 4),
+        "flags":        ("_flags_off", 13, 0x7, 1),
+        "frag_offset":  ("_flags_off", 0, 0x1FFF, 1),
+    }
+    _addr_fields = ("src_addr", "dst_addr")
+
+    def fill_lengths(self, transport: HeaderBatch) -> None:
+        """ Set header and total length for `transport` rows as payload. """
+        self["header_len"] = self.row_size
+        self._array["total_len"] = self.row_size + transport.row_size
+
+    def fill_checksums(self) -> None:
+        self._array["checksum"] = 0
+        self._array["checksum"] = 0xFFFF - self._sums()
+
+
+class _TransportBatch(HeaderBatch):
+    """ Batch of headers whose rows end in per-batch options and data. """
+    __slots__ = ()
+
+    @classmethod
+    def _row_dtype(cls, header: Header) -> np_dtype:
+        size = np_dtype(cls._fields).itemsize
+        tail = len(header) - size
+        return np_dtype(cls._fields + ([("_tail", f"V{tail}")] if tail else []))
+
+
+class TCPHeaderBatch(_TransportBatch):
+    """ Columnar batch of `TCPHeader` rows. """
+    __slots__ = ()
+
+    _header = TCPHeader
+    _fields = [
+        ("src_port",    ">u2"),
+        ("dst_port",    ">u2"),
+        ("seq_num",     ">u4"),
+        ("ack_num",     ">u4"),
+        ("_off_flags",  ">u2"),
+        ("window",      ">u2"),
+        ("checksum",    ">u2"),
+        ("urg_ptr",     ">u2"),
+    ]
+    _bitfields = {
+        "data_offset":  ("_off_flags", 12, 0xF, 4),
+        "flags":        ("_off_flags", 0, 0xFFF, 1),
+    }
+
+    def fill_checksums(self, ip: IPHeaderBatch) -> None:
+        """ Compute checksums over the pseudo-headers of the `ip` rows. """
+        _fill_transport_checksums(self, ip)
+
+
+class UDPHeaderBatch(_TransportBatch):
+    """ Columnar batch of `UDPHeader` rows. """
+    __slots__ = ()
+
+    _header = UDPHeader
+    _fields = [
+        ("src_port",    ">u2"),
+        ("dst_port",    ">u2"),
+        ("header_len",  ">u2"),
+        ("checksum",    ">u2"),
+    ]
+
+    def fill_lengths(self) -> None:
+        self._array["header_len"] = self.row_size
+
+    def fill_checksums(self, ip: IPHeaderBatch) -> None:
+        """ Compute checksums over the pseudo-headers of the `ip` rows. """
+        _fill_transport_checksums(self, ip)
+
+
+class ICMPHeaderBatch(_TransportBatch):
+    """ Columnar batch of `ICMPHeader` rows. """
+    __slots__ = ()
+
+    _header = ICMPHeader
+    _fields = [
+        ("type",        "u1"),
+        ("code",        "u1"),
+        ("checksum",    ">u2"),
+        ("identifier",  ">u2"),
+        ("seq_num",     ">u2"),
+    ]
+
+    def fill_checksums(self) -> None:
+        self._array["checksum"] = 0
+        self._array["checksum"] = 0xFFFF - self._sums()
+
+
+def _fill_transport_checksums(batch: HeaderBatch, ip: IPHeaderBatch) -> None:
+    """ Vectorized `inet_transport_checksum` over matching rows. """
+    if len(batch) != len(ip):
+        raise ValueError(f"batch sizes differ ({len(batch)} != {len(ip)})")
+    batch.array["checksum"] = 0
+    src = ip.array["src_addr"].astype(np_uint64)
+    dst = ip.array["dst_addr"].astype(np_uint64)
+    size = batch.row_size
+    sums = batch._sums() + src + dst + ip.array["protocol"] + size
+    if size & 1:
+        # inet_checksum adds an odd tail byte as the low-order byte of a
+        # word, while the wire pads it with zero to the high-order byte.
+        sums += batch.array.view(np_uint8)[size - 1::size].astype(np_uint64) * 0xFF
+    checksums = (0xFFFF - _fold(sums)).astype(np_uint16)
+    # A zero UDP checksum means "no checksum" and is sent as all ones.
+    checksums[(checksums == 0) & (ip.array["protocol"] == IPPROTO_UDP)] = 0xFFFF
+    batch.array["checksum"] = checksums
+
+
+def pack_batches(*batches: HeaderBatch) -> bytes:
+    """ Serialize batches side by side, one packet per row.
+
+        Row i of the result is row i of every batch, in order, e.g.
+        `pack_batches(ip, tcp)` gives one IP+TCP packet per row.
+    """
+    if not batches:
+        raise ValueError("no batches to pack")
+    count = len(batches[0])
+    if any(len(b) != count for b in batches):
+        raise ValueError("batch sizes differ")
+    width = sum(b.row_size for b in batches)
+    out = np_empty((count, width), np_uint8)
+    at = 0
+    for b in batches:
+        out[:, at:at + b.row_size] = b.array.view(np_uint8).reshape(count, b.row_size)
+        at += b.row_size
+    return out.tobytes()
@@ -0,0 +1,575 @@
+#  This file is part of protohdr-python3
+#  Copyright (C) 2022 ecriminal
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+
+from abc import ABC, abstractmethod
+from ctypes import Structure, c_ushort, c_void_p, addressof, create_string_buffer
+from ipaddress import IPv4Address
+from socket import IPPROTO_ICMP, IPPROTO_TCP, IPPROTO_UDP, SOL_SOCKET, inet_aton, socket
+from struct import Struct
+from types import SimpleNamespace
+from typing import Any, Iterable, Sequence
+
+from ._header import *
+from ._headers import *
+
+
+__all__ = (
+    "FilterField",
+    "PacketFilter",
+    "attach_filter",
+    "detach_filter",
+    "filter_fields",
+)
+
+
+_SO_ATTACH_FILTER = 26
+_SO_DETACH_FILTER = 27
+""" Linux socket options, not exported by the socket module. """
+
+# Classic BPF opcodes (linux/bpf_common.h).
+_LD_B_ABS   = 0x30
+_LD_H_ABS   = 0x28
+_LD_W_ABS   = 0x20
+_LD_B_IND   = 0x50
+_LD_H_IND   = 0x48
+_LD_W_IND   = 0x40
+_LDX_B_MSH  = 0xB1
+_ALU_AND_K  = 0x54
+_ALU_LSH_K  = 0x64
+_ALU_RSH_K  = 0x74
+_JMP_JEQ_K  = 0x15
+_JMP_JGT_K  = 0x25
+_JMP_JGE_K  = 0x35
+_RET_K      = 0x06
+
+_LOADS = {
+    1: (_LD_B_ABS, _LD_B_IND),
+    2: (_LD_H_ABS, _LD_H_IND),
+    4: (_LD_W_ABS, _LD_W_IND),
+}
+
+_ACCEPT = 0x40000
+""" Bytes of an accepted packet passed on, more than any IP packet. """
+
+_INSN = Struct("HBBI")
+""" struct sock_filter. """
+
+
+class _sock_fprog(Structure):
+    _fields_ = [
+        ("len", c_ushort),
+        ("filter", c_void_p),
+    ]
+
+
+class _Truncated(Exception):
+    """ A field lies beyond the end of the packet. """
+
+
+# Per header: field name -> (offset, size, mask, shift, scale), with the
+# value read in network byte order as ((word & mask) >> shift) * scale.
+_FIELDS = {
+    IPHeader: {
+        "version":      (0,  1, 0xF0,   4, 1),
+        "header_len":   (0,  1, 0x0F,   0, 4),
+        "tos":          (1,  1, None,   0, 1),
+        "total_len":    (2,  2, None,   0, 1),
+        "identifier":   (4,  2, None,   0, 1),
+        "flags":        (6,  1, 0xE0,   5, 1),
+        "frag_offset":  (6,  2, 0x1FFF, 0, 1),
+        "ttl":          (8,  1, None,   0, 1),
+        "protocol":     (9,  1, None,   0, 1),
+        "checksum":     (10, 2, None,   0, 1),
+        "src_addr":     (12, 4, None,   0, 1),
+        "dst_addr":     (16, 4, None,   0, 1),
+    },
+    TCPHeader: {
+        "src_port":     (0,  2, None,   0, 1),
+        "dst_port":     (2,  2, None,   0, 1),
+        "seq_num":      (4,  4, None,   0, 1),
+        "ack_num":      (8,  4, None,   0, 1),
+        "data_offset":  (12, 1, 0xF0,   4, 4),
+        "flags":        (12, 2, 0x0FFF, 0, 1),
+        "window":       (14, 2, None,   0, 1),
+        "checksum":     (16, 2, None,   0, 1),
+        "urg_ptr":      (18, 2, None,   0, 1),
+    },
+    UDPHeader: {
+        "src_port":     (0,  2, None,   0, 1),
+        "dst_port":     (2,  2, None,   0, 1),
+        "header_len":   (4,  2, None,   0, 1),
+        "checksum":     (6,  2, None,   0, 1),
+    },
+    ICMPHeader: {
+        "type":         (0,  1, None,   0, 1),
+        "code":         (1,  1, None,   0, 1),
+        "checksum":     (2,  2, None,   0, 1),
+        "identifier":   (4,  2, None,   0, 1),
+        "seq_num":      (6,  2, None,   0, 1),
+    },
+}
+
+_PROTOCOLS = {
+    TCPHeader: IPPROTO_TCP,
+    UDPHeader: IPPROTO_UDP,
+    ICMPHeader: IPPROTO_ICMP,
+}
+
+
+class _Codegen:
+    """ Classic BPF emitter with forward jumps to symbolic labels. """
+    __slots__ = (
+        "insns",
+        "labels",
+    )
+
+    def __init__(self) -> None:
+        self.insns = []
+        self.labels = {}
+
+    def label(self) -> object:
+        return object()
+
+    def place(self, label: object) -> None:
+        self.labels[label] = len(self.insns)
+
+    def emit(self, code: int, k: int = 0) -> None:
+        self.insns.append((code, None, None, k))
+
+    def jump(self, code: int, k: int, jt: object, jf: object) -> None:
+        self.insns.append((code, jt, jf, k))
+
+    def resolve(self) -> list[tuple[int, int, int, int]]:
+        program = []
+        for i, (code, jt, jf, k) in enumerate(self.insns):
+            if jt is not None:
+                jt = self.labels[jt] - i - 1
+                jf = self.labels[jf] - i - 1
+                if not (0 <= jt <= 0xFF and 0 <= jf <= 0xFF):
+                    raise ValueError("filter too large for classic BPF jumps")
+            program.append((code, jt or 0, jf or 0, k))
+        return program
+
+
+class PacketFilter(ABC):
+    """ Predicate on the fields of IPv4 packets.
+
+        Filters are built from `FilterField` comparisons and combined
+        with `&`, `|` and `~` (`and`, `or` and `not` cannot be
+        overloaded and raise TypeError). compile() translates a filter
+        into a classic BPF program for attach_filter(), so the kernel
+        drops non-matching packets before they reach the socket.
+        match() evaluates the same filter in Python, with the same
+        result: packets too short for a field the filter reads are
+        rejected as a whole, like BPF does, so conditions are evaluated
+        left to right with short-circuiting.
+    """
+    __slots__ = ()
+
+    def __and__(self, other: Any) -> PacketFilter:
+        return _And(self, _predicate(other))
+
+    def __rand__(self, other: Any) -> PacketFilter:
+        return _And(_predicate(other), self)
+
+    def __or__(self, other: Any) -> PacketFilter:
+        return _Or(self, _predicate(other))
+
+    def __ror__(self, other: Any) -> PacketFilter:
+        return _Or(_predicate(other), self)
+
+    def __invert__(self) -> PacketFilter:
+        return _Not(self)
+
+    def __bool__(self) -> bool:
+        raise TypeError("use &, | and ~ to combine filters")
+
+    def compile(self, offset: int = 0) -> list[tuple[int, int, int, int]]:
+        """ Classic BPF program as (code, jt, jf, k) instructions, for
+            packets whose IP header starts at `offset`, e.g. 0 for raw
+            and 14 for Ethernet (AF_PACKET, SOCK_RAW) sockets. """
+        gen = _Codegen()
+        accept, reject = gen.label(), gen.label()
+        self._gen(gen, offset, accept, reject)
+        gen.place(accept)
+        gen.emit(_RET_K, _ACCEPT)
+        gen.place(reject)
+        gen.emit(_RET_K, 0)
+        return gen.resolve()
+
+    def match(self, packet: bytes | bytearray | memoryview, offset: int = 0) -> bool:
+        """ Whether the packet with its IP header at `offset` passes. """
+        try:
+            return self._eval(packet, offset)
+        except _Truncated:
+            return False
+
+    @abstractmethod
+    def _gen(self, gen: _Codegen, offset: int, true: object, false: object) -> None:
+        """ Emit code jumping to `true` if the packet passes, else to
+            `false`. """
+
+    @abstractmethod
+    def _eval(self, packet: bytes | bytearray | memoryview, offset: int) -> bool:
+        """ Whether the packet passes; raises _Truncated if it is too
+            short for a field. """
+
+
+class _And(PacketFilter):
+    __slots__ = ("left", "right")
+
+    def __init__(self, left: PacketFilter, right: PacketFilter) -> None:
+        self.left = left
+        self.right = right
+
+    def _gen(self, gen: _Codegen, offset: int, true: object, false: object) -> None:
+        right = gen.label()
+        self.left._gen(gen, offset, right, false)
+        gen.place(right)
+        self.right._gen(gen, offset, true, false)
+
+    def _eval(self, packet: bytes | bytearray | memoryview, offset: int) -> bool:
+        return self.left._eval(packet, offset) and self.right._eval(packet, offset)
+
+
+class _Or(PacketFilter):
+    __slots__ = ("left", "right")
+
+    def __init__(self, left: PacketFilter, right: PacketFilter) -> None:
+        self.left = left
+        self.right = right
+
+    def _gen(self, gen: _Codegen, offset: int, true: object, false: object) -> None:
+        right = gen.label()
+        self.left._gen(gen, offset, true, right)
+        gen.place(right)
+        self.right._gen(gen, offset, true, false)
+
+    def _eval(self, packet: bytes | bytearray | memoryview, offset: int) -> bool:
+        return self.left._eval(packet, offset) or self.right._eval(packet, offset)
+
+
+class _Not(PacketFilter):
+    __slots__ = ("operand",)
+
+    def __init__(self, operand: PacketFilter) -> None:
+        self.operand = operand
+
+    def _gen(self, gen: _Codegen, offset: int, true: object, false: object) -> None:
+        self.operand._gen(gen, offset, false, true)
+
+    def _eval(self, packet: bytes | bytearray | memoryview, offset: int) -> bool:
+        return not self.operand._eval(packet, offset)
+
+
+class _Compare(PacketFilter):
+    """ Comparison of a (masked) field with constants. """
+    __slots__ = ("field", "mask", "op", "values")
+
+    # op -> (jump, swap targets); "in" tests each value in turn.
+    _JUMPS = {
+        "==": (_JMP_JEQ_K, False),
+        "!=": (_JMP_JEQ_K, True),
+        ">":  (_JMP_JGT_K, False),
+        "<=": (_JMP_JGT_K, True),
+        ">=": (_JMP_JGE_K, False),
+        "<":  (_JMP_JGE_K, True),
+    }
+
+    def __init__(self, field: FilterField, mask: int | None, op: str,
+                 values: tuple[int, ...]) -> None:
+        self.field = field
+        self.mask = mask
+        self.op = op
+        self.values = values
+
+    def _gen(self, gen: _Codegen, offset: int, true: object, false: object) -> None:
+        self.field._load(gen, offset, self.mask)
+        if self.op == "in":
+            for value in self.values[:-1]:
+                miss = gen.label()
+                gen.jump(_JMP_JEQ_K, value, true, miss)
+                gen.place(miss)
+            gen.jump(_JMP_JEQ_K, self.values[-1], true, false)
+            return
+        code, swap = self._JUMPS[self.op]
+        if swap:
+            true, false = false, true
+        gen.jump(code, self.values[0], true, false)
+
+    def _eval(self, packet: bytes | bytearray | memoryview, offset: int) -> bool:
+        value = self.field._read(packet, offset, self.mask)
+        op, k = self.op, self.values[0]
+        if op == "in":
+            return value in self.values
+        if op == "==":
+            return value == k
+        if op == "!=":
+            return value != k
+        if op == ">":
+            return value > k
+        if op == "<=":
+            return value <= k
+        if op == ">=":
+            return value >= k
+        return value < k
+
+
+class _Value(ABC):
+    """ Field value, optionally masked, to compare with constants. Used
+        as a filter on its own, it tests for a non-zero value. """
+    __slots__ = ()
+
+    @abstractmethod
+    def _field_mask(self) -> tuple[FilterField, int | None]: ...
+
+    def _compare(self, op: str, *values: Any) -> PacketFilter:
+        field, mask = self._field_mask()
+        values = tuple(map(field._encode, values))
+        if op == "in" and not values:
+            raise ValueError(f"no values to compare {field} with")
+        return _Compare(field, mask, op, values)
+
+    def _guard(self, test: PacketFilter) -> PacketFilter:
+        header = self._field_mask()[0].header
+        if header is IPHeader:
+            return test
+        # Transport fields only exist in unfragmented packets (or first
+        # fragments) of their protocol.
+        return _And(_Compare(_IP_PROTOCOL, None, "==", (_PROTOCOLS[header],)),
+                    _And(_Compare(_IP_FRAG_OFFSET, None, "==", (0,)), test))
+
+    def __eq__(self, value: Any) -> PacketFilter:  # type: ignore[override]
+        return self._guard(self._compare("==", value))
+
+    def __ne__(self, value: Any) -> PacketFilter:  # type: ignore[override]
+        return self._guard(self._compare("!=", value))
+
+    def __gt__(self, value: Any) -> PacketFilter:
+        return self._guard(self._compare(">", value))
+
+    def __ge__(self, value: Any) -> PacketFilter:
+        return self._guard(self._compare(">=", value))
+
+    def __lt__(self, value: Any) -> PacketFilter:
+        return self._guard(self._compare("<", value))
+
+    def __le__(self, value: Any) -> PacketFilter:
+        return self._guard(self._compare("<=", value))
+
+    __hash__ = None
+
+    def isin(self, values: Iterable[Any]) -> PacketFilter:
+        """ Whether the value is one of `values`. A range of step 1 is
+            tested by its bounds. """
+        if isinstance(values, range) and values.step == 1:
+            if not values:
+                raise ValueError(f"empty range {values}")
+            return self.between(values.start, values.stop - 1)
+        return self._guard(self._compare("in", *dict.fromkeys(values)))
+
+    def between(self, low: Any, high: Any) -> PacketFilter:
+        """ Whether `low <= value <= high`. """
+        return self._guard(_And(self._compare(">=", low), self._compare("<=", high)))
+
+    def __and__(self, other: Any) -> Any:
+        if isinstance(other, int):
+            field, mask = self._field_mask()
+            return _Masked(field, other if mask is None else mask & other)
+        return _predicate(self) & other
+
+    def __rand__(self, other: Any) -> Any:
+        if isinstance(other, int):
+            return self & other
+        return _predicate(other) & _predicate(self)
+
+    def __or__(self, other: Any) -> PacketFilter:
+        return _predicate(self) | other
+
+    def __ror__(self, other: Any) -> PacketFilter:
+        return _predicate(other) | _predicate(self)
+
+    def __invert__(self) -> PacketFilter:
+        return ~_predicate(self)
+
+    def __bool__(self) -> bool:
+        raise TypeError("use &, | and ~ to combine filters")
+
+    def compile(self, offset: int = 0) -> list[tuple[int, int, int, int]]:
+        return _predicate(self).compile(offset)
+
+    def match(self, packet: bytes | bytearray | memoryview, offset: int = 0) -> bool:
+        return _predicate(self).match(packet, offset)
+
+
+class _Masked(_Value):
+    __slots__ = ("field", "mask")
+
+    def __init__(self, field: FilterField, mask: int) -> None:
+        self.field = field
+        self.mask = mask
+
+    def _field_mask(self) -> tuple[FilterField, int | None]:
+        return self.field, self.mask
+
+    def __repr__(self) -> str:
+        return f"({self.field} & {self.mask:#x})"
+
+
+class FilterField(_Value):
+    """ Header field in a `PacketFilter`.
+
+        Compare it with ==, !=, <, <=, > and >=, isin() and between(), or
+        mask it with `& mask` first. A field (or masked field) on its own
+        tests for a non-zero value, e.g. `tcp.flags & TCPFlag.SYN`.
+        Addresses compare with strings or `IPv4Address` objects.
+
+        Conditions on TCP, UDP and ICMP fields include that the packet
+        is of that protocol and not a later fragment, so
+        `~(tcp.dst_port == 80)` also matches UDP.
+    """
+    __slots__ = (
+        "header",
+        "name",
+        "_offset",
+        "_size",
+        "_mask",
+        "_shift",
+        "_scale",
+    )
+
+    def __init__(self, header: type[Header], name: str) -> None:
+        try:
+            spec = _FIELDS[header][name]
+        except KeyError:
+            raise ValueError(f"{getattr(header, '__name__', header)}.{name} "
+                             f"cannot be filtered on") from None
+        self.header = header
+        self.name = name
+        self._offset, self._size, self._mask, self._shift, self._scale = spec
+
+    def __repr__(self) -> str:
+        return f"{self.header.__name__}.{self.name}"
+
+    def _field_mask(self) -> tuple[FilterField, int | None]:
+        return self, None
+
+    def _encode(self, value: Any) -> int:
+        if isinstance(value, (str, IPv4Address)) and self._size == 4:
+            value = int.from_bytes(inet_aton(str(value)), "big")
+        if not isinstance(value, int):
+            raise TypeError(f"cannot compare {self} with {type(value).__name__}")
+        if not 0 <= value <= 0xFFFFFFFF:
+            raise ValueError(f"{value} out of range for {self}")
+        return int(value)
+
+    def _load(self, gen: _Codegen, offset: int, mask: int | None) -> None:
+        """ Emit code loading the (masked) value into the accumulator. """
+        absolute, indirect = _LOADS[self._size]
+        if self.header is IPHeader:
+            gen.emit(absolute, offset + self._offset)
+        else:
+            gen.emit(_LDX_B_MSH, offset)
+            gen.emit(indirect, offset + self._offset)
+        if self._mask is not None:
+            gen.emit(_ALU_AND_K, self._mask)
+        if self._shift:
+            gen.emit(_ALU_RSH_K, self._shift)
+        if self._scale != 1:
+            gen.emit(_ALU_LSH_K, self._scale.bit_length() - 1)
+        if mask is not None:
+            gen.emit(_ALU_AND_K, mask)
+
+    def _read(self, packet: bytes | bytearray | memoryview, offset: int,
+              mask: int | None) -> int:
+        """ The (masked) value, as loaded by `_load`. """
+        at = offset + self._offset
+        if self.header is not IPHeader:
+            if offset >= len(packet):
+                raise _Truncated
+            at += (packet[offset] & 0x0F) * 4
+        if at + self._size > len(packet):
+            raise _Truncated
+        value = int.from_bytes(packet[at:at + self._size], "big")
+        if self._mask is not None:
+            value &= self._mask
+        value = (value >> self._shift) * self._scale
+        return value if mask is None else value & mask
+
+
+_IP_PROTOCOL = FilterField(IPHeader, "protocol")
+_IP_FRAG_OFFSET = FilterField(IPHeader, "frag_offset")
+
+
+def _predicate(value: Any) -> PacketFilter:
+    if isinstance(value, PacketFilter):
+        return value
+    if isinstance(value, _Value):
+        return value != 0
+    raise TypeError(f"not a filter: {value!r}")
+
+
+def filter_fields(header: type[Header]) -> SimpleNamespace:
+    """ The `FilterField`s of an `IPHeader`, `TCPHeader`, `UDPHeader` or
+        `ICMPHeader` as attributes, e.g.
+
+            ip, tcp = filter_fields(IPHeader), filter_fields(TCPHeader)
+            syn_ack = ((tcp.flags & (TCPFlag.SYN | TCPFlag.ACK))
+                       & tcp.dst_port.isin(range(32768, 61000)))
+    """
+    if header not in _FIELDS:
+        raise TypeError(f"unsupported header {getattr(header, '__name__', header)}")
+    return SimpleNamespace(**{name: FilterField(header, name) for name in _FIELDS[header]})
+
+
+def attach_filter(sock: socket, program: PacketFilter | Sequence[tuple[int, int, int, int]],
+                  offset: int = 0, *, drain: bool = True) -> None:
+    """ Attach a filter (compiled for `offset`) or BPF program to `sock`
+        with SO_ATTACH_FILTER (Linux).
+
+        Packets queued before the filter is attached did not go through
+        it; with `drain`, a drop-all filter is attached first and the
+        queue is emptied before attaching the real one.
+    """
+    if isinstance(program, (PacketFilter, _Value)):
+        program = _predicate(program).compile(offset)
+    if drain:
+        _set_filter(sock, [(_RET_K, 0, 0, 0)])
+        timeout = sock.gettimeout()
+        sock.setblocking(False)
+        try:
+            while True:
+                sock.recv(1)
+        except (BlockingIOError, InterruptedError):
+            pass
+        finally:
+            sock.settimeout(timeout)
+    _set_filter(sock, program)
+
+
+def detach_filter(sock: socket) -> None:
+    """ Remove the filter of `sock`. """
+    sock.setsockopt(SOL_SOCKET, _SO_DETACH_FILTER, 0)
+
+
+def _set_filter(sock: socket, program: Sequence[tuple[int, int, int, int]]) -> None:
+    if not 0 < len(program) <= 0xFFFF:
+        raise ValueError(f"invalid BPF program length {len(program)}")
+    insns = create_string_buffer(b"".join(_INSN.pack(*insn) for insn in program))
+    fprog = _sock_fprog(len(program), addressof(insns))
+    sock.setsockopt(SOL_SOCKET, _SO_ATTACH_FILTER, bytes(fprog))
@@ -0,0 +1,268 @@
+#  This file is part of protohdr-python3
+#  Copyright (C) 2022 ecriminal
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+
+from bisect import bisect_left
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from time import monotonic
+
+from ._inet import *
+from ._header import *
+from ._headers import *
+
+
+__all__ = (
+    "Reassembler",
+    "ReassemblyStats",
+    "fragment",
+)
+
+
+_MAX_DATAGRAM = 0xFFFF
+""" Largest IPv4 datagram, header included. """
+
+_FRAGMENT_COST = 64
+""" Bookkeeping bytes charged per stored fragment on top of its data, so
+    floods of tiny fragments hit the memory caps too. """
+
+
+def fragment(ip: IPHeader, payload: bytes | bytearray | memoryview,
+             mtu: int) -> list[tuple[IPHeader, memoryview]]:
+    """ Split the IP payload `payload` of `ip` into fragments of at most
+        `mtu` bytes.
+
+        Every fragment is a copy of `ip` with `total_len`, `flags`,
+        `frag_offset` and `checksum` filled in, and a memoryview slice of
+        `payload`, which is never copied. The payload usually comes from a
+        packed `Packet`, so the transport checksum covers all of it:
+
+            pkt = bytes(ip / udp)
+            frags = fragment(ip, memoryview(pkt)[len(ip):], 1500)
+            sender.send((bytes(hdr), data) for hdr, data in frags)
+
+        A payload that fits yields a single unfragmented packet. An `ip`
+        that is itself a fragment is split further, its offset and its
+        MORE_FRAGS flag carried over to the last piece (RFC 791).
+    """
+    header_len = len(ip)
+    view = memoryview(payload)
+    step = (mtu - header_len) // 8 * 8
+    if step < 8:
+        raise ValueError(f"MTU {mtu} too small for fragments of a {header_len} byte header")
+    base = ip.frag_offset * 8
+    if base + header_len + len(view) > _MAX_DATAGRAM:
+        raise ValueError(f"{len(view)} byte payload at offset {base} exceeds the "
+                         f"largest IPv4 datagram")
+    if ip.flags & IPFlag.DONT_FRAG and len(view) > step:
+        raise ValueError(f"{header_len + len(view)} byte packet exceeds MTU {mtu} "
+                         f"but must not be fragmented")
+
+    flags = ip.flags & ~IPFlag.MORE_FRAGS
+    last = ip.flags & IPFlag.MORE_FRAGS
+    frags = []
+    for at in range(0, max(len(view), 1), step):
+        data = view[at:at + step]
+        more = IPFlag.MORE_FRAGS if at + step < len(view) else last
+        hdr = replace(ip, header_len=header_len, total_len=header_len + len(data),
+                      flags=flags | more, frag_offset=(base + at) // 8, checksum=0)
+        hdr.checksum = inet_checksum(bytes(hdr))
+        frags.append((hdr, data))
+    return frags
+
+
+@dataclass(slots=True)
+class ReassemblyStats:
+    """ Counters of a `Reassembler`. """
+    reassembled: int = 0
+    """ Datagrams completed. """
+
+    duplicates: int = 0
+    """ Fragments ignored as exact duplicates. """
+
+    invalid: int = 0
+    """ Datagrams discarded for overlapping, inconsistent or oversized
+        fragments. """
+
+    timeouts: int = 0
+    """ Datagrams discarded as incomplete after the timeout. """
+
+    evicted: int = 0
+    """ Datagrams discarded to stay below the global memory cap. """
+
+
+class _Datagram:
+    """ Fragments of one datagram, as disjoint intervals sorted by offset. """
+    __slots__ = (
+        "starts",
+        "ends",
+        "data",
+        "size",
+        "cost",
+        "total",
+        "first",
+        "created",
+    )
+
+    def __init__(self, created: float) -> None:
+        self.starts = []
+        self.ends = []
+        self.data = []
+        self.size = 0
+        self.cost = 0
+        self.total = None
+        self.first = None
+        self.created = created
+
+
+class Reassembler:
+    """ Reassembly of fragmented IPv4 datagrams.
+
+        Fragments are grouped by source, destination, protocol and
+        identifier (RFC 791). Each datagram keeps its fragments as
+        disjoint intervals in offset order, so a fragment is placed with
+        a binary search and checked against its two neighbours only.
+        Exact duplicates are ignored; any other overlap discards the
+        datagram (as Linux does and RFC 5722 requires for IPv6) rather
+        than rescanning it. Storing a fragment shifts the list entries
+        after it, O(n) in the fragments held, but the memory cap bounds n
+        to `max_datagram_bytes` / 72 and the shift is a memmove of
+        pointers.
+
+        Memory is capped per datagram (`max_datagram_bytes`) and overall
+        (`max_bytes`, evicting the oldest datagrams), counting the stored
+        data plus a fixed overhead per fragment. Datagrams still
+        incomplete `timeout` seconds after their first fragment are
+        dropped. Stored fragment data is copied, so receive buffers can
+        be reused.
+    """
+    __slots__ = (
+        "_datagrams",
+        "_bytes",
+        "timeout",
+        "max_datagram_bytes",
+        "max_bytes",
+        "stats",
+    )
+
+    def __init__(self, timeout: float = 30.0, max_datagram_bytes: int = 0x40000,
+                 max_bytes: int = 4 << 20) -> None:
+        self._datagrams = OrderedDict()
+        self._bytes = 0
+        self.timeout = timeout
+        self.max_datagram_bytes = max_datagram_bytes
+        self.max_bytes = max_bytes
+        self.stats = ReassemblyStats()
+
+    def __len__(self) -> int:
+        """ Number of incomplete datagrams held. """
+        return len(self._datagrams)
+
+    @property
+    def nbytes(self) -> int:
+        """ Memory charged to the held fragments. """
+        return self._bytes
+
+    def add(self, ip: IPHeader | IPView, payload: bytes | bytearray | memoryview,
+            now: float | None = None) -> tuple[IPHeader, bytes] | None:
+        """ Add the fragment with header `ip` and IP payload `payload`.
+
+            Returns the header of the first fragment, with lengths, flags,
+            offset and checksum of the whole datagram, and the reassembled
+            payload once the last missing fragment arrives, None until
+            then. Packets that are not fragments are returned as they are.
+            `now` is the time on the `time.monotonic` clock.
+        """
+        if now is None:
+            now = monotonic()
+        self.expire(now)
+        more = ip.flags & IPFlag.MORE_FRAGS
+        start = ip.frag_offset * 8
+        if not more and not start:
+            return ip if isinstance(ip, IPHeader) else ip.to_header(), bytes(payload)
+
+        key = (ip.src_addr, ip.dst_addr, ip.protocol, ip.identifier)
+        dgram = self._datagrams.get(key)
+        if dgram is None:
+            dgram = self._datagrams[key] = _Datagram(now)
+        end = start + len(payload)
+        if (more and (not payload or len(payload) % 8)
+                or end + ip.header_len > _MAX_DATAGRAM
+                or dgram.total is not None and end > dgram.total
+                or not more and (dgram.total not in (None, end)
+                                 or dgram.ends and dgram.ends[-1] > end)):
+            self._discard(key)
+            self.stats.invalid += 1
+            return None
+
+        starts, ends = dgram.starts, dgram.ends
+        i = bisect_left(starts, start)
+        if i < len(starts) and starts[i] == start and ends[i] == end:
+            self.stats.duplicates += 1
+            return None
+        cost = len(payload) + _FRAGMENT_COST
+        if (i and ends[i - 1] > start or i < len(starts) and starts[i] < end
+                or dgram.cost + cost > self.max_datagram_bytes):
+            self._discard(key)
+            self.stats.invalid += 1
+            return None
+
+        starts.insert(i, start)
+        ends.insert(i, end)
+        dgram.data.insert(i, bytes(payload))
+        dgram.size += len(payload)
+        dgram.cost += cost
+        self._bytes += cost
+        if not more:
+            dgram.total = end
+        if not start:
+            dgram.first = ip if isinstance(ip, IPHeader) else ip.to_header()
+
+        # Disjoint intervals within [0, total) cover it when their sizes
+        # add up to it.
+        if dgram.size == dgram.total:
+            self._discard(key)
+            self.stats.reassembled += 1
+            first = dgram.first
+            hdr = replace(first, total_len=first.header_len + dgram.total,
+                          flags=first.flags & ~IPFlag.MORE_FRAGS, frag_offset=0, checksum=0)
+            hdr.checksum = inet_checksum(bytes(hdr))
+            return hdr, b"".join(dgram.data)
+
+        while self._bytes > self.max_bytes:
+            self._discard(next(iter(self._datagrams)))
+            self.stats.evicted += 1
+        return None
+
+    def expire(self, now: float | None = None) -> int:
+        """ Drop the datagrams that timed out. Returns how many. """
+        if now is None:
+            now = monotonic()
+        count = 0
+        deadline = now - self.timeout
+        # Datagrams are kept in the order they were started.
+        while self._datagrams:
+            key, dgram = next(iter(self._datagrams.items()))
+            if dgram.created > deadline:
+                break
+            self._discard(key)
+            count += 1
+        self.stats.timeouts += count
+        return count
+
+    def _discard(self, key: tuple) -> None:
+        self._bytes -= self._datagrams.pop(key).cost
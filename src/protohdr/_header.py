@@ -17,10 +17,18 @@
 from __future__ import annotations
 
 from abc import ABC, abstractmethod
+from operator import attrgetter
+from struct import Struct
+from typing import Any, Callable, ClassVar, Self
+
+from ._inet import inet_checksum_update
 
 
 __all__ = (
     "Header",
+    "HeaderView",
+    "check_avail",
+    "check_room",
 )
 
 
@@ -35,11 +43,157 @@ class Header(ABC):
 
         __len__() is supposed to return the total byte length of the
         protocol header.
+
+        pack_into() writes the binary representation into a writable
+        buffer (bytearray, memoryview, ...) at the given offset and
+        returns the number of bytes written. The default implementation
+        copies `bytes(self)`; headers override it to pack in place.
+
+        from_buffer() and from_bytes() decode a header at the given
+        offset. from_buffer() returns variable-length fields (options,
+        data) as memoryview slices of the buffer, from_bytes() as bytes.
+
+        Headers with a `checksum` field list the fixed-width fields it
+        covers in `_checksum_fields`. update() assigns those fields on a
+        header whose checksum is valid and updates the checksum
+        incrementally instead of requiring a new
+        `inet_checksum(bytes(hdr))`. Variable-length fields (options,
+        data) are not covered.
+
+        Headers whose serialization costs more than comparing their field
+        values (TCP, IPv6 and its extension headers other than the fragment
+        header) memoize it: repeated `bytes(hdr)` return the same object
+        until a field is assigned a different value. The values are
+        compared on every call instead of hooking assignments, which would
+        slow down every construction. IPv4, UDP and ICMP headers pack
+        faster than that comparison and are not memoized. In-place changes
+        to mutable field values of memoized headers (e.g. a bytearray
+        payload, or the buffer behind a header decoded with from_buffer())
+        are not seen; call invalidate() after making them.
    """
-    __slots__ = ()
+    __slots__ = ("_cache",)
+
+    _checksum_fields: ClassVar[dict[str, tuple[int, Callable[[Any], int]]]] = {}
+    """ Field name -> (bit width, wire value) of the 16-bit aligned word(s)
+        holding the field. Fields sharing a word map to the same word. """
+
+    _field_offsets: ClassVar[dict[str, tuple[int, Struct, Callable[[Any], Any] | None]]] = {}
+    """ Byte-aligned field name -> (offset, wire format, converter applied
+        to the value before packing). Used to patch serialized headers. """
+
+    def update(self, **fields: Any) -> None:
+        """ Assign `fields` and update `checksum` incrementally (RFC 1624)
+            to match. The checksum must be valid before; only fields
+            listed in `_checksum_fields` can be updated this way. """
+        covered = self._checksum_fields
+        for name in fields:
+            if name not in covered:
+                raise ValueError(f"{type(self).__name__}.{name} is not covered by "
+                                 f"incremental checksum updates")
+        checksum = self.checksum
+        for name, value in fields.items():
+            bits, word = covered[name]
+            old = word(self)
+            setattr(self, name, value)
+            checksum = inet_checksum_update(checksum, old, word(self), bits)
+        self.checksum = checksum
+
+    def invalidate(self) -> None:
+        """ Drop the memoized serialized form. """
+        self._cache = None
 
     @abstractmethod
     def __bytes__(self) -> bytes: ...
 
     @abstractmethod
     def __len__(self) -> int: ...
+
+    def pack_into(self, buffer: bytearray | memoryview, offset: int = 0) -> int:
+        data = bytes(self)
+        check_room(buffer, offset, len(data))
+        buffer[offset:offset + len(data)] = data
+        return len(data)
+
+    @classmethod
+    def from_buffer(cls, buffer: bytes | bytearray | memoryview, offset: int = 0) -> Self:
+        return cls._decode(memoryview(buffer), offset)
+
+    @classmethod
+    def from_bytes(cls, data: bytes | bytearray | memoryview, offset: int = 0) -> Self:
+        return cls._decode(data if type(data) is bytes else bytes(data), offset)
+
+    @classmethod
+    def _decode(cls, buf: bytes | memoryview, offset: int) -> Self:
+        """ Decode header from `buf` at `offset`. Slicing `buf` decides
+            whether variable-length fields are copied or not. """
+        raise NotImplementedError(f"{cls.__name__} does not support decoding")
+
+
+class HeaderView:
+    """ Read-only view of a protocol header inside a buffer.
+
+        Fields carry the same names as on the matching `Header` class but
+        are decoded from the buffer only when accessed, which makes views
+        cheap to create for filtering received packets. Variable-length
+        fields are memoryview slices of the buffer. to_header() decodes
+        every field into a full header.
+    """
+    __slots__ = ("_buf", "_off")
+
+    _header: ClassVar[type[Header]]
+    """ Header class the view decodes to. """
+
+    _size: ClassVar[int]
+    """ Minimum number of bytes the view needs. """
+
+    def __init__(self, buffer: bytes | bytearray | memoryview, offset: int = 0) -> None:
+        self._buf = buffer
+        self._off = offset
+        if offset < 0 or offset + self._size > len(buffer):
+            check_avail(buffer, offset, self._size, self._header.__name__)
+
+    def to_header(self) -> Header:
+        return self._header.from_buffer(self._buf, self._off)
+
+    def _slice(self, start: int, stop: int | None = None) -> memoryview:
+        """ Zero-copy slice of the buffer relative to the header. """
+        return memoryview(self._buf)[self._off + start:None if stop is None else self._off + stop]
+
+
+def _cached(serialize: Callable[[Header], bytes]) -> Callable[[Header], bytes]:
+    """ Memoize a `__bytes__` implementation while the field values stay
+        the same. """
+    # Header class -> getter of all its dataclass fields, made on first
+    # use as the fields are not known when the class body is run.
+    getters = {}
+
+    def __bytes__(self: Header) -> bytes:
+        cls = type(self)
+        values = getters.get(cls)
+        if values is None:
+            values = getters[cls] = attrgetter(*cls.__dataclass_fields__)
+        key = values(self)
+        cache = getattr(self, "_cache", None)
+        if cache is not None and cache[0] == key:
+            return cache[1]
+        data = serialize(self)
+        self._cache = key, data
+        return data
+    __bytes__.__doc__ = serialize.__doc__
+    return __bytes__
+
+
+def check_avail(buffer: bytes | memoryview, offset: int, size: int, name: str) -> None:
+    """ Ensure `size` bytes can be read from `buffer` at `offset`, or
+        raise ValueError naming the truncated `name`. For decoders. """
+    if offset < 0 or offset + size > len(buffer):
+        raise ValueError(f"truncated {name}: need {size} bytes at offset "
+                         f"{offset} of {len(buffer)}")
+
+
+def check_room(buffer: bytearray | memoryview, offset: int, size: int) -> None:
+    """ Ensure `size` bytes fit into `buffer` at `offset`, or raise
+        ValueError. For pack_into() implementations. """
+    if offset < 0 or offset + size > len(buffer):
+        raise ValueError(f"{size} bytes do not fit into buffer of "
+                         f"{len(buffer)} bytes at offset {offset}")
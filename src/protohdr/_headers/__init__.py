@@ -15,6 +15,7 @@
 #  along with this program. If not, see <http://www.gnu.org/licenses/>.
 
 from ._ip import *
+from ._ipv6 import *
 from ._udp import *
 from ._tcp import *
 from ._icmp import *
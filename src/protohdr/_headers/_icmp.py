@@ -18,6 +18,7 @@ from __future__ import annotations
 
 from dataclasses import dataclass
 from enum import IntEnum
+from struct import Struct
 
 from .._header import *
 from .._inet import *
@@ -31,10 +32,12 @@ if TYPE_CHECKING:
 __all__ = (
     "ICMPHeader",
     "ICMPMessage",
+    "ICMPv6Message",
     "ICMPCodeDU",
     "ICMPCodeTE",
     "ICMPCodeRD",
     "ICMPPayload",
+    "ICMPView",
 )
 
 
@@ -53,6 +56,20 @@ class ICMPMessage(IntEnum):
     INFORMATION_REPLY       = 16
 
 
+class ICMPv6Message(IntEnum):
+    """ ICMPv6 message types. ICMPv6 messages share the `ICMPHeader`
+        layout, but their checksum covers the IPv6 pseudo-header.
+
+        https://www.rfc-editor.org/rfc/rfc4443
+    """
+    DESTINATION_UNREACHABLE = 1
+    PACKET_TOO_BIG          = 2
+    TIME_EXCEEDED           = 3
+    PARAMETER_PROBLEM       = 4
+    ECHO                    = 128
+    ECHO_REPLY              = 129
+
+
 class ICMPCodeDU(IntEnum):
     """ Codes for `ICMPMessage.DESTINATION_UNREACHABLE` message. """
     NET_UNREACHABLE = 0
@@ -87,7 +104,10 @@ class ICMPCodeRD(IntEnum):
     """ Redirect datagrams for the Type of Service and Host. """
 
 
-@dataclass(kw_only=True)
+_icmp_type_code = lambda h: (h.type << 8) | h.code
+
+
+@dataclass(kw_only=True, slots=True)
 class ICMPHeader(Header):
     """ Internet Control Message Protocol header.
 
@@ -111,18 +131,79 @@ class ICMPHeader(Header):
     data: bytes = b""
     """ ICMP message payload: <65507 bits """
 
-    def __bytes__(self):
-        header = b"" # Big endianess?
-        header += i2bb(8, self.type)
-        header += i2bb(8, self.code)
-        header += i2bb(16, self.checksum)
-        header += i2bb(16, self.identifier)
-        header += i2bb(16, self.seq_num)
-        header += self.data
-        return header
+    _checksum_fields = {
+        "type":         (16, _icmp_type_code),
+        "code":         (16, _icmp_type_code),
+        "identifier":   (16, lambda h: h.identifier),
+        "seq_num":      (16, lambda h: h.seq_num),
+    }
+
+    _layout = Struct(">BBHHH")
+    """ Type, code, checksum, identifier and sequence number. """
+
+    _field_offsets = {
+        "type":         (0,  Struct("B"),   None),
+        "code":         (1,  Struct("B"),   None),
+        "checksum":     (2,  Struct(">H"),  None),
+        "identifier":   (4,  Struct(">H"),  None),
+        "seq_num":      (6,  Struct(">H"),  None),
+    }
+
+    def __bytes__(self) -> bytes:
+        return self._layout.pack(
+            self.type,
+            self.code,
+            self.checksum,
+            self.identifier,
+            self.seq_num,
+        ) + self.data
+
+    def pack_into(self, buffer: bytearray | memoryview, offset: int = 0) -> int:
+        start = offset + self._layout.size
+        end = start + len(self.data)
+        check_room(buffer, offset, end - offset)
+        self._layout.pack_into(
+            buffer,
+            offset,
+            self.type,
+            self.code,
+            self.checksum,
+            self.identifier,
+            self.seq_num,
+        )
+        buffer[start:end] = self.data
+        return end - offset
+
+    @classmethod
+    def _decode(cls, buf: bytes | memoryview, offset: int) -> ICMPHeader:
+        check_avail(buf, offset, cls._layout.size, "ICMP header")
+        type, code, checksum, identifier, seq_num = cls._layout.unpack_from(buf, offset)
+        return cls(
+            type        = type,
+            code        = code,
+            checksum    = checksum,
+            identifier  = identifier,
+            seq_num     = seq_num,
+            data        = buf[offset + cls._layout.size:],
+        )
 
     def __len__(self) -> int:
-        return len(bytes(self))
+        return self._layout.size + len(self.data)
+
+
+class ICMPView(HeaderView):
+    """ Lazily decoded `ICMPHeader` inside a buffer. """
+    __slots__ = ()
+
+    _header = ICMPHeader
+    _size = ICMPHeader._layout.size
+
+    type        = property(lambda self: self._buf[self._off])
+    code        = property(lambda self: self._buf[self._off + 1])
+    checksum    = property(lambda self: self._buf[self._off + 2] << 8 | self._buf[self._off + 3])
+    identifier  = property(lambda self: self._buf[self._off + 4] << 8 | self._buf[self._off + 5])
+    seq_num     = property(lambda self: self._buf[self._off + 6] << 8 | self._buf[self._off + 7])
+    data        = property(lambda self: self._slice(8))
 
 
 class ICMPPayload:
@@ -18,7 +18,8 @@ from __future__ import annotations
 
 from dataclasses import dataclass
 from enum import IntEnum
-from socket import inet_aton
+from socket import inet_ntoa
+from struct import Struct
 
 from .._inet import *
 from .._header import *
@@ -29,6 +30,7 @@ __all__ = (
     "IPFlag",
     "IPVersion",
     "IPHeader",
+    "IPView",
 )
 
 
@@ -54,10 +56,18 @@ class IPVersion(IntEnum):
     IPV6 = 6
 
 
-@dataclass(kw_only=True)
+_ip_vhl_tos   = lambda h: ((h.version << 4 | h.header_len // 4) << 8) | h.tos
+_ip_flags_off = lambda h: (h.flags << 13) | h.frag_offset
+_ip_ttl_proto = lambda h: (h.ttl << 8) | h.protocol
+
+
+@dataclass(kw_only=True, slots=True)
 class IPHeader(Header):
     """ Internet Protocol header.
 
+        Fields are packed and decoded in network byte order, as on the
+        wire.
+
         https://www.rfc-editor.org/rfc/rfc791
     """
     version: int
@@ -101,20 +111,108 @@ class IPHeader(Header):
     dst_addr: str
     """ Destination address: 32 (IPv4) / 128 (IPv6) bits """
 
+    _checksum_fields = {
+        "version":      (16, _ip_vhl_tos),
+        "header_len":   (16, _ip_vhl_tos),
+        "tos":          (16, _ip_vhl_tos),
+        "total_len":    (16, lambda h: h.total_len),
+        "identifier":   (16, lambda h: h.identifier),
+        "flags":        (16, _ip_flags_off),
+        "frag_offset":  (16, _ip_flags_off),
+        "ttl":          (16, _ip_ttl_proto),
+        "protocol":     (16, _ip_ttl_proto),
+        "src_addr":     (32, lambda h: int.from_bytes(inet_pack_addr(h.src_addr), "big")),
+        "dst_addr":     (32, lambda h: int.from_bytes(inet_pack_addr(h.dst_addr), "big")),
+    }
+
+    _layout = Struct(">BBHHHBBH4s4s")
+    """ Version/IHL, TOS, total length, identifier, flags/fragment offset,
+        TTL, protocol, checksum, source and destination address. """
+
+    _field_offsets = {
+        "tos":          (1,  Struct("B"),   None),
+        "total_len":    (2,  Struct(">H"),  None),
+        "identifier":   (4,  Struct(">H"),  None),
+        "ttl":          (8,  Struct("B"),   None),
+        "protocol":     (9,  Struct("B"),   None),
+        "checksum":     (10, Struct(">H"),  None),
+        "src_addr":     (12, Struct("4s"),  inet_pack_addr),
+        "dst_addr":     (16, Struct("4s"),  inet_pack_addr),
+    }
+
     def __bytes__(self) -> bytes:
-        header = b""
-        header += i2bb(8, (self.version << 4) | (self.header_len // 4))
-        header += i2bl(8, self.tos)
-        header += i2bl(16, self.total_len)
-        header += i2bl(16, self.identifier)
-        header += i2bl(16, (self.flags << 13) | self.frag_offset) # LE?
-        header += i2bl(8, self.ttl)
-        header += i2bl(8, self.protocol)
-        header += i2bl(16, self.checksum)
-        header += inet_aton(self.src_addr)
-        header += inet_aton(self.dst_addr)
-        return header
+        return self._layout.pack(
+            (self.version << 4) | (self.header_len // 4),
+            self.tos,
+            self.total_len,
+            self.identifier,
+            (self.flags << 13) | self.frag_offset,
+            self.ttl,
+            self.protocol,
+            self.checksum,
+            inet_pack_addr(self.src_addr),
+            inet_pack_addr(self.dst_addr),
+        )
+
+    def pack_into(self, buffer: bytearray | memoryview, offset: int = 0) -> int:
+        check_room(buffer, offset, self._layout.size)
+        self._layout.pack_into(
+            buffer,
+            offset,
+            (self.version << 4) | (self.header_len // 4),
+            self.tos,
+            self.total_len,
+            self.identifier,
+            (self.flags << 13) | self.frag_offset,
+            self.ttl,
+            self.protocol,
+            self.checksum,
+            inet_pack_addr(self.src_addr),
+            inet_pack_addr(self.dst_addr),
+        )
+        return self._layout.size
+
+    @classmethod
+    def _decode(cls, buf: bytes | memoryview, offset: int) -> IPHeader:
+        check_avail(buf, offset, cls._layout.size, "IP header")
+        (vhl, tos, total_len, identifier, flags_off, ttl, protocol, checksum,
+         src_addr, dst_addr) = cls._layout.unpack_from(buf, offset)
+        return cls(
+            version     = vhl >> 4,
+            header_len  = (vhl & 0xF) * 4,
+            tos         = tos,
+            total_len   = total_len,
+            identifier  = identifier,
+            flags       = flags_off >> 13,
+            frag_offset = flags_off & 0x1FFF,
+            ttl         = ttl,
+            protocol    = protocol,
+            checksum    = checksum,
+            src_addr    = inet_ntoa(src_addr),
+            dst_addr    = inet_ntoa(dst_addr),
+        )
 
     def __len__(self) -> bytes:
         addr_len = 128 if self.version == 6 else 32 # IPv4
         return ((96 + (2 * addr_len) ) // 8)
+
+
+class IPView(HeaderView):
+    """ Lazily decoded `IPHeader` inside a buffer. """
+    __slots__ = ()
+
+    _header = IPHeader
+    _size = IPHeader._layout.size
+
+    version     = property(lambda self: self._buf[self._off] >> 4)
+    header_len  = property(lambda self: (self._buf[self._off] & 0xF) * 4)
+    tos         = property(lambda self: self._buf[self._off + 1])
+    total_len   = property(lambda self: self._buf[self._off + 2] << 8 | self._buf[self._off + 3])
+    identifier  = property(lambda self: self._buf[self._off + 4] << 8 | self._buf[self._off + 5])
+    flags       = property(lambda self: self._buf[self._off + 6] >> 5)
+    frag_offset = property(lambda self: (self._buf[self._off + 6] & 0x1F) << 8 | self._buf[self._off + 7])
+    ttl         = property(lambda self: self._buf[self._off + 8])
+    protocol    = property(lambda self: self._buf[self._off + 9])
+    checksum    = property(lambda self: self._buf[self._off + 10] << 8 | self._buf[self._off + 11])
+    src_addr    = property(lambda self: inet_ntoa(self._slice(12, 16)))
+    dst_addr    = property(lambda self: inet_ntoa(self._slice(16, 20)))
@@ -0,0 +1,331 @@
+#  This file is part of protohdr-python3
+#  Copyright (C) 2022 ecriminal
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from enum import IntEnum
+from socket import AF_INET6, inet_ntop
+from struct import Struct
+
+from .._inet import *
+from .._header import *
+from .._header import _cached
+
+
+__all__ = (
+    "IPv6ExtType",
+    "IPv6Header",
+    "IPv6ExtHeader",
+    "IPv6FragmentHeader",
+    "IPv6View",
+)
+
+
+class IPv6ExtType(IntEnum):
+    """ IPv6 extension header types (next header values). """
+    HOP_BY_HOP      = 0
+    ROUTING         = 43
+    FRAGMENT        = 44
+    NO_NEXT         = 59
+    DEST_OPTIONS    = 60
+
+
+_ipv6_pack_addr = lambda addr: inet_pack_addr(addr, 6)
+
+_ext_len = Struct(">BB")
+""" Next header and length of an extension header. """
+
+
+@dataclass(kw_only=True, slots=True)
+class IPv6ExtHeader(Header):
+    """ IPv6 extension header with options or routing data.
+
+        `data` is padded to the next multiple of 8 bytes (less the two
+        leading bytes): options headers with Pad1/PadN options, others
+        with zeros. Fragment headers have their own class,
+        `IPv6FragmentHeader`.
+
+        https://www.rfc-editor.org/rfc/rfc8200#section-4
+    """
+    ext_type: int
+    """ Extension header type, the next header value naming it. Not part
+        of the header itself. """
+
+    next_header: int
+    """ Next header: 8 bits """
+
+    data: bytes = b""
+    """ Options or type-specific data: 8n+6 bytes once padded """
+
+    _field_offsets = {
+        "next_header":  (0,  Struct("B"),   None),
+    }
+
+    def _padding(self) -> bytes:
+        pad = -(len(self.data) + 2) % 8
+        if pad < 2 or self.ext_type not in (IPv6ExtType.HOP_BY_HOP, IPv6ExtType.DEST_OPTIONS):
+            return bytes(pad)
+        return bytes((1, pad - 2)) + bytes(pad - 2)
+
+    @_cached
+    def __bytes__(self) -> bytes:
+        return _ext_len.pack(self.next_header, (len(self.data) + 2 - 1) // 8) \
+            + self.data + self._padding()
+
+    def __len__(self) -> int:
+        return (len(self.data) + 2 + 7) // 8 * 8
+
+
+@dataclass(kw_only=True, slots=True)
+class IPv6FragmentHeader(Header):
+    """ IPv6 fragment extension header.
+
+        https://www.rfc-editor.org/rfc/rfc8200#section-4.5
+    """
+    next_header: int
+    """ Next header: 8 bits """
+
+    frag_offset: int
+    """ Fragment offset in 8 byte units: 13 bits """
+
+    more_frags: int
+    """ More fragments: 1 bit """
+
+    identification: int
+    """ Identification: 32 bits """
+
+    _layout = Struct(">BBHI")
+    """ Next header, reserved, fragment offset/flags and identification. """
+
+    _field_offsets = {
+        "next_header":      (0,  Struct("B"),   None),
+        "identification":   (4,  Struct(">I"),  None),
+    }
+
+    @property
+    def ext_type(self) -> int:
+        return IPv6ExtType.FRAGMENT
+
+    def __bytes__(self) -> bytes:
+        return self._layout.pack(
+            self.next_header,
+            0,
+            (self.frag_offset << 3) | bool(self.more_frags),
+            self.identification,
+        )
+
+    def pack_into(self, buffer: bytearray | memoryview, offset: int = 0) -> int:
+        check_room(buffer, offset, self._layout.size)
+        self._layout.pack_into(
+            buffer,
+            offset,
+            self.next_header,
+            0,
+            (self.frag_offset << 3) | bool(self.more_frags),
+            self.identification,
+        )
+        return self._layout.size
+
+    @classmethod
+    def _decode(cls, buf: bytes | memoryview, offset: int) -> IPv6FragmentHeader:
+        check_avail(buf, offset, cls._layout.size, "IPv6 fragment header")
+        next_header, _, off_flags, identification = cls._layout.unpack_from(buf, offset)
+        return cls(
+            next_header     = next_header,
+            frag_offset     = off_flags >> 3,
+            more_frags      = off_flags & 1,
+            identification  = identification,
+        )
+
+    def __len__(self) -> int:
+        return self._layout.size
+
+
+def _ipv6_chain(buf: bytes | bytearray | memoryview, offset: int) -> tuple[int, int, int]:
+    """ Walk the extension headers of the IPv6 header at `offset`.
+        Returns the upper-layer protocol, the length of the header chain
+        and the fragment offset (0 if not fragmented). """
+    protocol = buf[offset + 6]
+    at = offset + 40
+    frag_offset = 0
+    while protocol in _EXT_TYPES:
+        check_avail(buf, at, 8, "IPv6 extension header")
+        if protocol == IPv6ExtType.FRAGMENT:
+            frag_offset = (buf[at + 2] << 8 | buf[at + 3]) >> 3
+            size = 8
+        else:
+            size = (buf[at + 1] + 1) * 8
+        protocol = buf[at]
+        at += size
+    check_avail(buf, offset, at - offset, "IPv6 extension headers")
+    return protocol, at - offset, frag_offset
+
+
+_EXT_TYPES = frozenset((IPv6ExtType.HOP_BY_HOP, IPv6ExtType.ROUTING,
+                        IPv6ExtType.FRAGMENT, IPv6ExtType.DEST_OPTIONS))
+""" Extension headers walked to find the upper-layer header. """
+
+
+@dataclass(kw_only=True, slots=True)
+class IPv6Header(Header):
+    """ Internet Protocol version 6 header and its extension headers.
+
+        `extensions` are packed after the fixed header in order; `Packet`
+        links their `next_header` fields into a chain ending at the
+        transport header. `protocol` is the upper-layer protocol at the
+        end of that chain, as needed for the pseudo-header.
+
+        Addresses are packed through `inet_pack_addr`, whose cache keeps
+        the parsing of IPv6 addresses off the send path.
+
+        https://www.rfc-editor.org/rfc/rfc8200
+    """
+    version: int
+    """ IP version: 4 bits """
+
+    traffic_class: int
+    """ Traffic class: 8 bits """
+
+    flow_label: int
+    """ Flow label: 20 bits """
+
+    payload_len: int
+    """ Payload length, extension headers included: 16 bits """
+
+    next_header: int
+    """ Next header: 8 bits """
+
+    hop_limit: int
+    """ Hop limit: 8 bits """
+
+    src_addr: str
+    """ Source address: 128 bits """
+
+    dst_addr: str
+    """ Destination address: 128 bits """
+
+    extensions: tuple[IPv6ExtHeader | IPv6FragmentHeader, ...] = ()
+    """ Extension headers, in order """
+
+    _layout = Struct(">IHBB16s16s")
+    """ Version/traffic class/flow label, payload length, next header,
+        hop limit, source and destination address. """
+
+    _field_offsets = {
+        "payload_len":  (4,  Struct(">H"),   None),
+        "next_header":  (6,  Struct("B"),    None),
+        "hop_limit":    (7,  Struct("B"),    None),
+        "src_addr":     (8,  Struct("16s"),  _ipv6_pack_addr),
+        "dst_addr":     (24, Struct("16s"),  _ipv6_pack_addr),
+    }
+
+    @property
+    def protocol(self) -> int:
+        """ Upper-layer protocol: next header of the last extension. """
+        if self.extensions:
+            return self.extensions[-1].next_header
+        return self.next_header
+
+    @_cached
+    def __bytes__(self) -> bytes:
+        data = self._layout.pack(
+            (self.version << 28) | (self.traffic_class << 20) | self.flow_label,
+            self.payload_len,
+            self.next_header,
+            self.hop_limit,
+            inet_pack_addr(self.src_addr, 6),
+            inet_pack_addr(self.dst_addr, 6),
+        )
+        if self.extensions:
+            data += b"".join(map(bytes, self.extensions))
+        return data
+
+    def pack_into(self, buffer: bytearray | memoryview, offset: int = 0) -> int:
+        size = len(self)
+        check_room(buffer, offset, size)
+        self._layout.pack_into(
+            buffer,
+            offset,
+            (self.version << 28) | (self.traffic_class << 20) | self.flow_label,
+            self.payload_len,
+            self.next_header,
+            self.hop_limit,
+            inet_pack_addr(self.src_addr, 6),
+            inet_pack_addr(self.dst_addr, 6),
+        )
+        at = offset + self._layout.size
+        for ext in self.extensions:
+            at += ext.pack_into(buffer, at)
+        return size
+
+    @classmethod
+    def _decode(cls, buf: bytes | memoryview, offset: int) -> IPv6Header:
+        check_avail(buf, offset, cls._layout.size, "IPv6 header")
+        (vtf, payload_len, next_header, hop_limit,
+         src_addr, dst_addr) = cls._layout.unpack_from(buf, offset)
+        extensions = []
+        protocol = next_header
+        at = offset + cls._layout.size
+        while protocol in _EXT_TYPES:
+            if protocol == IPv6ExtType.FRAGMENT:
+                ext = IPv6FragmentHeader._decode(buf, at)
+            else:
+                check_avail(buf, at, 8, "IPv6 extension header")
+                size = (buf[at + 1] + 1) * 8
+                check_avail(buf, at, size, "IPv6 extension header")
+                ext = IPv6ExtHeader(ext_type=protocol, next_header=buf[at],
+                                    data=buf[at + 2:at + size])
+            extensions.append(ext)
+            protocol = ext.next_header
+            at += len(ext)
+        return cls(
+            version         = vtf >> 28,
+            traffic_class   = (vtf >> 20) & 0xFF,
+            flow_label      = vtf & 0xFFFFF,
+            payload_len     = payload_len,
+            next_header     = next_header,
+            hop_limit       = hop_limit,
+            src_addr        = inet_ntop(AF_INET6, src_addr),
+            dst_addr        = inet_ntop(AF_INET6, dst_addr),
+            extensions      = tuple(extensions),
+        )
+
+    def __len__(self) -> int:
+        if self.extensions:
+            return self._layout.size + sum(map(len, self.extensions))
+        return self._layout.size
+
+
+class IPv6View(HeaderView):
+    """ Lazily decoded `IPv6Header` inside a buffer. `protocol` and
+        `header_len` walk the extension headers when accessed. """
+    __slots__ = ()
+
+    _header = IPv6Header
+    _size = IPv6Header._layout.size
+
+    version       = property(lambda self: self._buf[self._off] >> 4)
+    traffic_class = property(lambda self: (self._buf[self._off] << 4 | self._buf[self._off + 1] >> 4) & 0xFF)
+    flow_label    = property(lambda self: int.from_bytes(self._slice(1, 4), "big") & 0xFFFFF)
+    payload_len   = property(lambda self: self._buf[self._off + 4] << 8 | self._buf[self._off + 5])
+    next_header   = property(lambda self: self._buf[self._off + 6])
+    hop_limit     = property(lambda self: self._buf[self._off + 7])
+    src_addr      = property(lambda self: inet_ntop(AF_INET6, self._slice(8, 24)))
+    dst_addr      = property(lambda self: inet_ntop(AF_INET6, self._slice(24, 40)))
+    protocol      = property(lambda self: _ipv6_chain(self._buf, self._off)[0])
+    header_len    = property(lambda self: _ipv6_chain(self._buf, self._off)[1])
+    frag_offset   = property(lambda self: _ipv6_chain(self._buf, self._off)[2])
@@ -18,8 +18,10 @@ from __future__ import annotations
 
 from dataclasses import dataclass
 from enum import IntEnum
+from struct import Struct
 
 from .._header import *
+from .._header import _cached
 from .._inet import *
 
 
@@ -27,6 +29,7 @@ __all__ = (
     "TCPFlag",
     "TCPHeader",
     "TCPOption",
+    "TCPView",
 )
 
 
@@ -45,7 +48,10 @@ class TCPFlag(IntEnum):
     FIN     = 0b000000000001
 
 
-@dataclass(kw_only=True)
+_tcp_off_flags = lambda h: ((h.data_offset // 4) << 12) | h.flags
+
+
+@dataclass(kw_only=True, slots=True)
 class TCPHeader(Header):
     """ Transmission Control Protocol header.
 
@@ -95,25 +101,123 @@ class TCPHeader(Header):
     data: bytes = b""
     """ TCP data: <65483 bits """
 
+    _checksum_fields = {
+        "src_port":     (16, lambda h: h.src_port),
+        "dst_port":     (16, lambda h: h.dst_port),
+        "seq_num":      (32, lambda h: h.seq_num),
+        "ack_num":      (32, lambda h: h.ack_num),
+        "data_offset":  (16, _tcp_off_flags),
+        "flags":        (16, _tcp_off_flags),
+        "window":       (16, lambda h: h.window),
+        "urg_ptr":      (16, lambda h: h.urg_ptr),
+    }
+
+    _layout = Struct(">HHIIHHHH")
+    """ Fixed part: ports, sequence and acknowledgment number, data
+        offset/flags, window, checksum and urgent pointer. """
+
+    _field_offsets = {
+        "src_port":     (0,  Struct(">H"),  None),
+        "dst_port":     (2,  Struct(">H"),  None),
+        "seq_num":      (4,  Struct(">I"),  None),
+        "ack_num":      (8,  Struct(">I"),  None),
+        "window":       (14, Struct(">H"),  None),
+        "checksum":     (16, Struct(">H"),  None),
+        "urg_ptr":      (18, Struct(">H"),  None),
+    }
+
+    _MIN_LEN = 32
+    """ Options are zero-padded up to this header length. """
+
+    @_cached
     def __bytes__(self) -> bytes:
-        header = b"" # Big endianess?
-        header += i2bb(16, self.src_port)
-        header += i2bb(16, self.dst_port)
-        header += i2bb(32, self.seq_num)
-        header += i2bb(32, self.ack_num)
-        header += i2bb(16, ((self.data_offset // 4) << 12) | (0b000 << 3) | (self.flags))
-        header += i2bb(16, self.window)
-        header += i2bb(16, self.checksum)
-        header += i2bb(16, self.urg_ptr)
-        header += self.options
+        header = self._layout.pack(
+            self.src_port,
+            self.dst_port,
+            self.seq_num,
+            self.ack_num,
+            ((self.data_offset // 4) << 12) | (0b000 << 3) | (self.flags),
+            self.window,
+            self.checksum,
+            self.urg_ptr,
+        )
+        # Padding
+        pad = b"\x00" * (self._MIN_LEN - self._layout.size - len(self.options))
+        return b"".join((header, self.options, pad, self.data))
+
+    def pack_into(self, buffer: bytearray | memoryview, offset: int = 0) -> int:
+        size = self._layout.size
+        opt_end = offset + size + len(self.options)
+        hdr_end = max(opt_end, offset + self._MIN_LEN)
+        end = hdr_end + len(self.data)
+        check_room(buffer, offset, end - offset)
+        self._layout.pack_into(
+            buffer,
+            offset,
+            self.src_port,
+            self.dst_port,
+            self.seq_num,
+            self.ack_num,
+            ((self.data_offset // 4) << 12) | (0b000 << 3) | (self.flags),
+            self.window,
+            self.checksum,
+            self.urg_ptr,
+        )
+        buffer[offset + size:opt_end] = self.options
         # Padding
-        while len(header) < 32:
-            header += b"\x00"
-        header += self.data
-        return header
+        buffer[opt_end:hdr_end] = b"\x00" * (hdr_end - opt_end)
+        buffer[hdr_end:end] = self.data
+        return end - offset
+
+    @classmethod
+    def _decode(cls, buf: bytes | memoryview, offset: int) -> TCPHeader:
+        size = cls._layout.size
+        check_avail(buf, offset, size, "TCP header")
+        (src_port, dst_port, seq_num, ack_num, off_flags, window, checksum,
+         urg_ptr) = cls._layout.unpack_from(buf, offset)
+        data_offset = (off_flags >> 12) * 4
+        if data_offset < size:
+            raise ValueError(f"invalid TCP data offset {data_offset}")
+        check_avail(buf, offset, data_offset, "TCP options")
+        return cls(
+            src_port    = src_port,
+            dst_port    = dst_port,
+            seq_num     = seq_num,
+            ack_num     = ack_num,
+            data_offset = data_offset,
+            flags       = off_flags & 0xFFF,
+            window      = window,
+            checksum    = checksum,
+            urg_ptr     = urg_ptr,
+            options     = buf[offset + size:offset + data_offset],
+            data        = buf[offset + data_offset:],
+        )
 
     def __len__(self) -> int:
-        return len(bytes(self))
+        return max(self._layout.size + len(self.options), self._MIN_LEN) + len(self.data)
+
+
+_u32 = Struct(">I").unpack_from
+
+
+class TCPView(HeaderView):
+    """ Lazily decoded `TCPHeader` inside a buffer. """
+    __slots__ = ()
+
+    _header = TCPHeader
+    _size = TCPHeader._layout.size
+
+    src_port    = property(lambda self: self._buf[self._off] << 8 | self._buf[self._off + 1])
+    dst_port    = property(lambda self: self._buf[self._off + 2] << 8 | self._buf[self._off + 3])
+    seq_num     = property(lambda self: _u32(self._buf, self._off + 4)[0])
+    ack_num     = property(lambda self: _u32(self._buf, self._off + 8)[0])
+    data_offset = property(lambda self: (self._buf[self._off + 12] >> 4) * 4)
+    flags       = property(lambda self: (self._buf[self._off + 12] & 0xF) << 8 | self._buf[self._off + 13])
+    window      = property(lambda self: self._buf[self._off + 14] << 8 | self._buf[self._off + 15])
+    checksum    = property(lambda self: self._buf[self._off + 16] << 8 | self._buf[self._off + 17])
+    urg_ptr     = property(lambda self: self._buf[self._off + 18] << 8 | self._buf[self._off + 19])
+    options     = property(lambda self: self._slice(20, self.data_offset))
+    data        = property(lambda self: self._slice(self.data_offset))
 
 
 class TCPOption:
@@ -17,6 +17,7 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
+from struct import Struct
 
 from .._header import *
 from .._inet import *
@@ -24,10 +25,11 @@ from .._inet import *
 
 __all__ = (
     "UDPHeader",
+    "UDPView",
 )
 
 
-@dataclass(kw_only=True)
+@dataclass(kw_only=True, slots=True)
 class UDPHeader(Header):
     """ User Datagram Protocol header.
 
@@ -48,14 +50,70 @@ class UDPHeader(Header):
     data: bytes
     """ UDP data: <65507 bits """
 
+    _checksum_fields = {
+        "src_port":     (16, lambda h: h.src_port),
+        "dst_port":     (16, lambda h: h.dst_port),
+        "header_len":   (16, lambda h: h.header_len),
+    }
+
+    _layout = Struct(">HHHH")
+    """ Ports, length and checksum. """
+
+    _field_offsets = {
+        "src_port":     (0,  Struct(">H"),  None),
+        "dst_port":     (2,  Struct(">H"),  None),
+        "header_len":   (4,  Struct(">H"),  None),
+        "checksum":     (6,  Struct(">H"),  None),
+    }
+
     def __bytes__(self) -> bytes:
-        header = b"" # Big endianess?
-        header += i2bb(16, self.src_port)
-        header += i2bb(16, self.dst_port)
-        header += i2bb(16, self.header_len)
-        header += i2bb(16, self.checksum)
-        header += self.data
-        return header
+        return self._layout.pack(
+            self.src_port,
+            self.dst_port,
+            self.header_len,
+            self.checksum,
+        ) + self.data
+
+    def pack_into(self, buffer: bytearray | memoryview, offset: int = 0) -> int:
+        start = offset + self._layout.size
+        end = start + len(self.data)
+        check_room(buffer, offset, end - offset)
+        self._layout.pack_into(
+            buffer,
+            offset,
+            self.src_port,
+            self.dst_port,
+            self.header_len,
+            self.checksum,
+        )
+        buffer[start:end] = self.data
+        return end - offset
+
+    @classmethod
+    def _decode(cls, buf: bytes | memoryview, offset: int) -> UDPHeader:
+        check_avail(buf, offset, cls._layout.size, "UDP header")
+        src_port, dst_port, header_len, checksum = cls._layout.unpack_from(buf, offset)
+        return cls(
+            src_port    = src_port,
+            dst_port    = dst_port,
+            header_len  = header_len,
+            checksum    = checksum,
+            data        = buf[offset + cls._layout.size:],
+        )
 
     def __len__(self) -> int:
-        return len(bytes(self))
+        return self._layout.size + len(self.data)
+
+
+class UDPView(HeaderView):
+    """ Lazily decoded `UDPHeader` inside a buffer. """
+    __slots__ = ()
+
+    _header = UDPHeader
+    _size = UDPHeader._layout.size
+
+    src_port    = property(lambda self: self._buf[self._off] << 8 | self._buf[self._off + 1])
+    dst_port    = property(lambda self: self._buf[self._off + 2] << 8 | self._buf[self._off + 3])
+    header_len  = property(lambda self: self._buf[self._off + 4] << 8 | self._buf[self._off + 5])
+    checksum    = property(lambda self: self._buf[self._off + 6] << 8 | self._buf[self._off + 7])
+    data        = property(lambda self: self._slice(8))
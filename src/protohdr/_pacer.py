@@ -0,0 +1,196 @@
+#  This file is part of protohdr-python3
+#  Copyright (C) 2022 ecriminal
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from itertools import islice
+from math import sqrt
+from time import perf_counter, sleep
+from typing import Any, Callable, Iterable, Iterator
+
+
+__all__ = (
+    "Pacer",
+    "PacerStats",
+)
+
+
+@dataclass(slots=True)
+class PacerStats:
+    """ Counters of one `Pacer` run. """
+    batches: int = 0
+    """ Micro-batches released. """
+
+    packets: int = 0
+    """ Packets released. """
+
+    nbytes: int = 0
+    """ Bytes released. """
+
+    elapsed: float = 0.0
+    """ Seconds from the first release to the end of the time allotted
+        to the last batch, or to now if later. """
+
+    lateness: float = 0.0
+    """ Mean seconds a batch was released after its scheduled time. """
+
+    jitter: float = 0.0
+    """ Standard deviation of the lateness in seconds. """
+
+    max_lateness: float = 0.0
+    """ Largest lateness in seconds. """
+
+    @property
+    def pps(self) -> float:
+        """ Achieved packets per second. """
+        return self.packets / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def bps(self) -> float:
+        """ Achieved bits per second. """
+        return self.nbytes * 8 / self.elapsed if self.elapsed else 0.0
+
+
+class Pacer:
+    """ Token bucket pacing of packet sends to `pps` packets and/or `bps`
+        bits per second.
+
+        Packets are released in micro-batches of about `interval` seconds
+        worth of the rate, so the sender can use batched system calls
+        (see `Sender`) without bursting. Each batch is scheduled when the
+        previous one has used up its share of the rate; wait() sleeps
+        until `spin` seconds before that time and busy-waits for the rest,
+        since sleep() alone overshoots by tens of microseconds. A sender
+        that falls behind may catch up by at most `burst` seconds worth of
+        the rate (the bucket depth, by default five intervals).
+
+        Use batches() to pace any iterable of packets, e.g.
+
+            for batch in pacer.batches(template.packets(rows)):
+                sender.send(batch)
+
+        or call wait() before sending each batch of your own.
+    """
+    __slots__ = (
+        "_pps",
+        "_bps",
+        "_interval",
+        "_burst",
+        "_spin",
+        "_start",
+        "_next",
+        "_m2",
+        "stats",
+    )
+
+    def __init__(self, pps: float | None = None, bps: float | None = None, *,
+                 interval: float = 0.001, burst: float | None = None,
+                 spin: float = 0.0005) -> None:
+        if pps is None and bps is None:
+            raise ValueError("no rate given")
+        if pps is not None and pps <= 0 or bps is not None and bps <= 0:
+            raise ValueError("rates must be positive")
+        if interval <= 0 or spin < 0 or burst is not None and burst < 0:
+            raise ValueError("invalid pacing intervals")
+        self._pps = pps
+        self._bps = bps
+        self._interval = interval
+        self._burst = 5 * interval if burst is None else burst
+        self._spin = spin
+        self.reset()
+
+    @property
+    def batch_size(self) -> int | None:
+        """ Packets per micro-batch at the packet rate, None without one. """
+        if self._pps is None:
+            return None
+        return max(1, round(self._pps * self._interval))
+
+    def reset(self) -> None:
+        """ Start over with a full bucket and new counters. """
+        self._start = None
+        self._next = 0.0
+        self._m2 = 0.0
+        self.stats = PacerStats()
+
+    def delay(self) -> float:
+        """ Seconds until the next batch may be released, 0 if now. Lets
+            callers do other work instead of blocking in wait(). """
+        return max(0.0, self._next - perf_counter()) if self._start is not None else 0.0
+
+    def wait(self, packets: int = 1, nbytes: int = 0) -> float:
+        """ Wait until a batch of `packets` packets and `nbytes` bytes may
+            be sent and account for it. Returns how many seconds later
+            than scheduled the batch was released. """
+        now = perf_counter()
+        if self._start is None:
+            self._start = self._next = now
+        # Unused time beyond the bucket depth is lost.
+        due = max(self._next, now - self._burst)
+        if due - now > self._spin:
+            sleep(due - now - self._spin)
+        while (now := perf_counter()) < due:
+            pass
+
+        cost = 0.0
+        if self._pps is not None:
+            cost = packets / self._pps
+        if self._bps is not None:
+            cost = max(cost, nbytes * 8 / self._bps)
+        self._next = due + cost
+
+        late = now - due
+        stats = self.stats
+        stats.batches += 1
+        stats.packets += packets
+        stats.nbytes += nbytes
+        # Welford's running mean and variance.
+        delta = late - stats.lateness
+        stats.lateness += delta / stats.batches
+        self._m2 += delta * (late - stats.lateness)
+        stats.jitter = sqrt(self._m2 / stats.batches)
+        stats.max_lateness = max(stats.max_lateness, late)
+        stats.elapsed = self._next - self._start
+        return late
+
+    def batches(self, packets: Iterable[Any],
+                size: Callable[[Any], int] = len) -> Iterator[list[Any]]:
+        """ Yield `packets` in micro-batches, each once it may be sent.
+            Bytes are counted with `size` if pacing by `bps`. """
+        it = iter(packets)
+        count = self.batch_size
+        quota = None if self._bps is None else self._bps * self._interval / 8
+        while True:
+            if count is not None:
+                batch = list(islice(it, count))
+                nbytes = sum(map(size, batch)) if quota is not None else 0
+            else:
+                # Bit rate only: fill the batch up to the bytes of an
+                # interval.
+                batch = []
+                nbytes = 0
+                for packet in it:
+                    batch.append(packet)
+                    nbytes += size(packet)
+                    if nbytes >= quota:
+                        break
+            if not batch:
+                break
+            self.wait(len(batch), nbytes)
+            yield batch
+        if self._start is not None:
+            self.stats.elapsed = max(perf_counter(), self._next) - self._start
@@ -0,0 +1,276 @@
+#  This file is part of protohdr-python3
+#  Copyright (C) 2022 ecriminal
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+
+from socket import IPPROTO_ICMP, IPPROTO_ICMPV6, IPPROTO_TCP, IPPROTO_UDP
+from typing import Any, Iterable
+
+from ._header import *
+from ._headers import *
+from ._headers._ipv6 import _ipv6_chain
+from ._inet import *
+
+
+__all__ = (
+    "Packet",
+    "decode_packet",
+    "view_packet",
+)
+
+
+_TRANSPORTS: dict[int, type[Header]] = {
+    IPPROTO_TCP:    TCPHeader,
+    IPPROTO_UDP:    UDPHeader,
+    IPPROTO_ICMP:   ICMPHeader,
+}
+""" Transport header classes by IP protocol number. """
+
+_TRANSPORT_VIEWS: dict[int, type[HeaderView]] = {
+    IPPROTO_TCP:    TCPView,
+    IPPROTO_UDP:    UDPView,
+    IPPROTO_ICMP:   ICMPView,
+}
+""" Transport header views by IP protocol number. """
+
+_IPV6_TRANSPORTS: dict[int, type[Header]] = {
+    IPPROTO_TCP:    TCPHeader,
+    IPPROTO_UDP:    UDPHeader,
+    IPPROTO_ICMPV6: ICMPHeader,
+}
+""" Transport header classes by IPv6 next header value. """
+
+_IPV6_TRANSPORT_VIEWS: dict[int, type[HeaderView]] = {
+    IPPROTO_TCP:    TCPView,
+    IPPROTO_UDP:    UDPView,
+    IPPROTO_ICMPV6: ICMPView,
+}
+""" Transport header views by IPv6 next header value. """
+
+_IPV6_PROTOCOLS: dict[type[Header], int] = {
+    TCPHeader:      IPPROTO_TCP,
+    UDPHeader:      IPPROTO_UDP,
+    ICMPHeader:     IPPROTO_ICMPV6,
+}
+""" IPv6 next header value ending the chain, per transport header class. """
+
+_LENGTH_FIELDS: dict[type[Header], frozenset[str]] = {
+    IPHeader:       frozenset(("header_len", "total_len", "checksum")),
+    IPv6Header:     frozenset(("payload_len", "next_header")),
+    TCPHeader:      frozenset(("data_offset", "checksum")),
+    UDPHeader:      frozenset(("header_len", "checksum")),
+    ICMPHeader:     frozenset(("checksum",)),
+}
+""" Length and checksum fields filled in by `Packet`, per header class. """
+
+
+def _lookup(table: dict[type[Header], Any], hdr: Header) -> Any:
+    """ Entry of `table` for the class of `hdr` or its nearest base. """
+    for cls in type(hdr).__mro__:
+        if cls in table:
+            return table[cls]
+    raise TypeError(f"unsupported header {type(hdr).__name__}")
+
+
+class Packet:
+    """ IPv4 or IPv6 header stacked with a TCP, UDP or ICMP header.
+
+        Usually built as `ip / transport`. Packing fills in the length
+        and checksum fields of both headers and writes the wire format:
+        the headers are packed once into the output buffer and both
+        checksums are computed over that buffer, with no intermediate
+        serialization. The filled-in values are also assigned to the
+        headers.
+
+        Filled in are the IP `header_len`, `total_len` and `checksum`,
+        the TCP `data_offset`, the UDP `header_len` and the transport
+        `checksum`. Fields named in `ip_keep` and `transport_keep` are
+        packed as set on the header instead.
+
+        An IPv6 header has no checksum; its `payload_len` is filled in
+        and `next_header` chained through its extension headers to the
+        transport header, whose checksum covers the IPv6 pseudo-header.
+        An ICMP header behind IPv6 is an ICMPv6 message (next header 58),
+        with the pseudo-header included in its checksum as well.
+    """
+    __slots__ = (
+        "ip",
+        "transport",
+        "ip_keep",
+        "transport_keep",
+    )
+
+    def __init__(self, ip: IPHeader | IPv6Header, transport: TCPHeader | UDPHeader | ICMPHeader,
+                 ip_keep: Iterable[str] = (), transport_keep: Iterable[str] = ()) -> None:
+        if not isinstance(ip, (IPHeader, IPv6Header)):
+            raise TypeError(f"unsupported network header {type(ip).__name__}")
+        if not isinstance(transport, (TCPHeader, UDPHeader, ICMPHeader)):
+            raise TypeError(f"unsupported transport header {type(transport).__name__}")
+        self.ip = ip
+        self.transport = transport
+        self.ip_keep = frozenset(ip_keep)
+        self.transport_keep = frozenset(transport_keep)
+        for hdr, keep in ((ip, self.ip_keep), (transport, self.transport_keep)):
+            for name in keep - _lookup(_LENGTH_FIELDS, hdr):
+                raise ValueError(f"{type(hdr).__name__}.{name} is not filled in")
+
+    def __len__(self) -> int:
+        return len(self.ip) + len(self.transport)
+
+    def __bytes__(self) -> bytes:
+        buf = bytearray(len(self))
+        self.pack_into(buf)
+        return bytes(buf)
+
+    def fill_in(self) -> tuple[int, int]:
+        """ Fill in the length fields of both headers, and the next
+            header chain of an IPv6 header, as pack_into() does, without
+            packing anything. Checksums are left as they are, e.g. for a
+            `PacketTemplate`, which computes its own. Returns the lengths
+            of the IP and the transport header. """
+        ip, transport = self.ip, self.transport
+        ip_keep, tp_keep = self.ip_keep, self.transport_keep
+        tp_len = len(transport)
+        ip_len = len(ip)
+        if isinstance(ip, IPv6Header):
+            if "payload_len" not in ip_keep:
+                ip.payload_len = ip_len + tp_len - ip._layout.size
+            if "next_header" not in ip_keep:
+                _link(ip, _lookup(_IPV6_PROTOCOLS, transport))
+        else:
+            if "header_len" not in ip_keep:
+                ip.header_len = ip_len
+            if "total_len" not in ip_keep:
+                ip.total_len = ip_len + tp_len
+        if isinstance(transport, TCPHeader):
+            if "data_offset" not in tp_keep:
+                transport.data_offset = tp_len - len(transport.data)
+        elif isinstance(transport, UDPHeader):
+            if "header_len" not in tp_keep:
+                transport.header_len = tp_len
+        return ip_len, tp_len
+
+    def pack_into(self, buffer: bytearray | memoryview, offset: int = 0) -> int:
+        """ Fill in lengths and checksums and write the packet into
+            `buffer`. Returns the number of bytes written. """
+        ip, transport = self.ip, self.transport
+        ip_len, tp_len = self.fill_in()
+        size = ip_len + tp_len
+        check_room(buffer, offset, size)
+
+        v6 = isinstance(ip, IPv6Header)
+        ip_keep, tp_keep = self.ip_keep, self.transport_keep
+        # Checksums are computed with the field zeroed, as on the wire.
+        ip_sum = not v6 and "checksum" not in ip_keep
+        tp_sum = "checksum" not in tp_keep
+        if ip_sum:
+            ip.checksum = 0
+        if tp_sum:
+            transport.checksum = 0
+
+        ip.pack_into(buffer, offset)
+        transport.pack_into(buffer, offset + ip_len)
+
+        view = memoryview(buffer)
+        if tp_sum:
+            segment = view[offset + ip_len:offset + size]
+            if isinstance(transport, ICMPHeader) and not v6:
+                checksum = inet_checksum(segment)
+            else:
+                checksum = inet_transport_checksum(segment, ip)
+            at, layout, _ = transport._field_offsets["checksum"]
+            layout.pack_into(buffer, offset + ip_len + at, checksum)
+            transport.checksum = checksum
+        if ip_sum:
+            checksum = inet_checksum(view[offset:offset + ip_len])
+            at, layout, _ = ip._field_offsets["checksum"]
+            layout.pack_into(buffer, offset + at, checksum)
+            ip.checksum = checksum
+        return size
+
+
+def _stack(ip: IPHeader | IPv6Header, transport: Header) -> Packet:
+    """ Stack a transport header on top, see `Packet`. """
+    if not isinstance(transport, Header):
+        return NotImplemented
+    return Packet(ip, transport)
+
+# The `/` operator of the IP headers, installed here so the header
+# modules do not import this one.
+IPHeader.__truediv__ = IPv6Header.__truediv__ = _stack
+
+
+def _link(ip: IPv6Header, protocol: int) -> None:
+    """ Chain the next header fields of `ip` through its extension
+        headers to `protocol`. """
+    nexts = [ext.ext_type for ext in ip.extensions]
+    nexts.append(protocol)
+    if ip.next_header != nexts[0]:
+        ip.next_header = nexts[0]
+    for ext, next_header in zip(ip.extensions, nexts[1:]):
+        if ext.next_header != next_header:
+            ext.next_header = next_header
+            # The extensions are serialized with the IPv6 header.
+            ip.invalidate()
+
+
+def decode_packet(buffer: bytes | bytearray | memoryview,
+                  offset: int = 0) -> tuple[IPHeader | IPv6Header, Header | None]:
+    """ Decode an IP packet and its TCP, UDP or ICMP header in one call.
+
+        Returns the IP header and the transport header, or None for other
+        protocols. Transport options and data are memoryview slices of
+        `buffer`, as with `Header.from_buffer`. IPv6 packets are decoded
+        with their extension headers. Later fragments of IPv4 and IPv6
+        packets have no transport header.
+    """
+    buf = memoryview(buffer)
+    if 0 <= offset < len(buf) and buf[offset] >> 4 == IPVersion.IPV6:
+        ip = IPv6Header.from_buffer(buf, offset)
+        transport = _IPV6_TRANSPORTS.get(ip.protocol)
+        if transport is None or any(ext.ext_type == IPv6ExtType.FRAGMENT and ext.frag_offset
+                                    for ext in ip.extensions):
+            return ip, None
+        return ip, transport.from_buffer(buf, offset + len(ip))
+    ip = IPHeader.from_buffer(buf, offset)
+    if ip.version != IPVersion.IPV4 or ip.header_len < len(ip):
+        raise ValueError(f"not an IPv4 header (version {ip.version}, "
+                         f"length {ip.header_len})")
+    transport = _TRANSPORTS.get(ip.protocol)
+    if transport is None or ip.frag_offset:
+        return ip, None
+    return ip, transport.from_buffer(buf, offset + ip.header_len)
+
+
+def view_packet(buffer: bytes | bytearray | memoryview,
+                offset: int = 0) -> tuple[IPView | IPv6View, HeaderView | None]:
+    """ Wrap an IP packet and its TCP, UDP or ICMP header in views.
+
+        Like `decode_packet`, but no field is decoded until accessed.
+        Only the next header fields of IPv6 extension headers are read.
+    """
+    if 0 <= offset < len(buffer) and buffer[offset] >> 4 == IPVersion.IPV6:
+        ip = IPv6View(buffer, offset)
+        protocol, header_len, frag_offset = _ipv6_chain(buffer, offset)
+        transport = _IPV6_TRANSPORT_VIEWS.get(protocol)
+        if transport is None or frag_offset:
+            return ip, None
+        return ip, transport(buffer, offset + header_len)
+    ip = IPView(buffer, offset)
+    transport = _TRANSPORT_VIEWS.get(ip.protocol)
+    if transport is None or ip.frag_offset:
+        return ip, None
+    return ip, transport(buffer, offset + ip.header_len)
@@ -0,0 +1,420 @@
+#  This file is part of protohdr-python3
+#  Copyright (C) 2022 ecriminal
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+
+from abc import ABC, abstractmethod
+from enum import IntEnum
+from mmap import ACCESS_READ, mmap
+from os import PathLike, fstat
+from struct import Struct
+from time import time_ns
+from typing import Any, BinaryIO, Iterable, Iterator
+
+from ._header import *
+from ._headers import *
+from ._packet import *
+
+
+__all__ = (
+    "LinkType",
+    "PcapWriter",
+    "PcapNgWriter",
+    "PcapReader",
+)
+
+
+class LinkType(IntEnum):
+    """ Link-layer header types of capture files.
+
+        https://www.tcpdump.org/linktypes.html
+    """
+    NULL        = 0
+    ETHERNET    = 1
+    RAW         = 101
+    LINUX_SLL   = 113
+    IPV4        = 228
+
+
+_PCAP_MAGIC = 0xA1B2C3D4
+""" Classic pcap magic number, microsecond timestamps. """
+
+_PCAP_MAGIC_NS = 0xA1B23C4D
+""" Classic pcap magic number, nanosecond timestamps. """
+
+_PCAPNG_SHB = 0x0A0D0D0A
+""" pcapng Section Header Block type, same in either byte order. """
+
+_PCAPNG_BOM = 0x1A2B3C4D
+""" pcapng byte-order magic. """
+
+_PCAPNG_IDB = 1
+_PCAPNG_PB  = 2
+_PCAPNG_SPB = 3
+_PCAPNG_EPB = 6
+
+_OPT_TSRESOL = 9
+""" Interface Description Block option: timestamp resolution. """
+
+_ETHERTYPE_IPV4 = 0x0800
+_ETHERTYPE_VLAN = 0x8100
+
+_FLUSH_SIZE = 1 << 20
+""" Bytes buffered by the writers before a write to the file. """
+
+
+def _packet_bytes(packet: Any) -> bytes | bytearray | memoryview:
+    return bytes(packet) if isinstance(packet, (Header, Packet)) else packet
+
+
+class _Writer(ABC):
+    """ Buffered capture file writer base.
+
+        _record() appends the record of one packet to `_buffer`.
+    """
+    __slots__ = (
+        "_file",
+        "_owned",
+        "_buffer",
+        "_buffer_size",
+        "snaplen",
+    )
+
+    def __init__(self, file: str | PathLike | BinaryIO, snaplen: int,
+                 buffer_size: int) -> None:
+        if isinstance(file, (str, PathLike)):
+            self._file = open(file, "wb")
+            self._owned = True
+        else:
+            self._file = file
+            self._owned = False
+        self._buffer = bytearray()
+        self._buffer_size = buffer_size
+        self.snaplen = snaplen
+
+    def __enter__(self) -> Any:
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def write(self, packet: bytes | bytearray | memoryview | Header | Packet,
+              timestamp: int | None = None) -> None:
+        """ Append one IP packet, captured at `timestamp` nanoseconds
+            since the epoch (now by default). """
+        self._record(_packet_bytes(packet), time_ns() if timestamp is None else timestamp)
+        if len(self._buffer) >= self._buffer_size:
+            self.flush()
+
+    def write_many(self, packets: Iterable[bytes | bytearray | memoryview | Header | Packet],
+                   timestamps: Iterable[int] | None = None) -> int:
+        """ Append all `packets`, all stamped now unless `timestamps` are
+            given. Returns the number of packets written. """
+        count = 0
+        if timestamps is None:
+            now = time_ns()
+            pairs = ((packet, now) for packet in packets)
+        else:
+            pairs = zip(packets, timestamps, strict=True)
+        buffer = self._buffer
+        for packet, timestamp in pairs:
+            self._record(_packet_bytes(packet), timestamp)
+            if len(buffer) >= self._buffer_size:
+                self.flush()
+            count += 1
+        return count
+
+    def flush(self) -> None:
+        if self._buffer:
+            self._file.write(self._buffer)
+            self._buffer.clear()
+        self._file.flush()
+
+    def close(self) -> None:
+        if self._file is None:
+            return
+        self.flush()
+        if self._owned:
+            self._file.close()
+        self._file = None
+
+    @abstractmethod
+    def _record(self, data: bytes | bytearray | memoryview, timestamp: int) -> None: ...
+
+
+class PcapWriter(_Writer):
+    """ Streaming writer of classic pcap files.
+
+        Records are collected in memory and written to the file in bulk
+        every `buffer_size` bytes and on flush() or close(). Packets are
+        written as-is (link type RAW, i.e. starting with the IP header)
+        and truncated to `snaplen`. With `nanosecond`, timestamps keep
+        their full resolution.
+
+        https://www.ietf.org/archive/id/draft-gharris-opsawg-pcap-01.html
+    """
+    __slots__ = ("_nanosecond",)
+
+    _file_header = Struct("<IHHiIII")
+    _record_header = Struct("<IIII")
+
+    def __init__(self, file: str | PathLike | BinaryIO, linktype: int = LinkType.RAW,
+                 snaplen: int = 0xFFFF, nanosecond: bool = False,
+                 buffer_size: int = _FLUSH_SIZE) -> None:
+        super().__init__(file, snaplen, buffer_size)
+        self._nanosecond = nanosecond
+        self._buffer += self._file_header.pack(
+            _PCAP_MAGIC_NS if nanosecond else _PCAP_MAGIC,
+            2, 4, 0, 0, snaplen, linktype)
+
+    def _record(self, data: bytes | bytearray | memoryview, timestamp: int) -> None:
+        size = len(data)
+        caplen = min(size, self.snaplen)
+        sec, frac = divmod(timestamp, 1_000_000_000)
+        if not self._nanosecond:
+            frac //= 1000
+        self._buffer += self._record_header.pack(sec, frac, caplen, size)
+        self._buffer += data[:caplen] if caplen < size else data
+
+
+class PcapNgWriter(_Writer):
+    """ Streaming writer of pcapng files with a single interface.
+
+        Buffering and packets as with `PcapWriter`; every packet is an
+        Enhanced Packet Block with a nanosecond timestamp.
+
+        https://www.ietf.org/archive/id/draft-ietf-opsawg-pcapng-01.html
+    """
+    __slots__ = ()
+
+    _shb = Struct("<IIIHHqI")
+    _idb = Struct("<IIHHIHHBxxxHHI")
+    _epb = Struct("<IIIIIII")
+
+    def __init__(self, file: str | PathLike | BinaryIO, linktype: int = LinkType.RAW,
+                 snaplen: int = 0xFFFF, buffer_size: int = _FLUSH_SIZE) -> None:
+        super().__init__(file, snaplen, buffer_size)
+        self._buffer += self._shb.pack(_PCAPNG_SHB, 28, _PCAPNG_BOM, 1, 0, -1, 28)
+        # if_tsresol = 9 (nanoseconds), then opt_endofopt.
+        self._buffer += self._idb.pack(_PCAPNG_IDB, 32, linktype, 0, snaplen,
+                                       _OPT_TSRESOL, 1, 9, 0, 0, 32)
+
+    def _record(self, data: bytes | bytearray | memoryview, timestamp: int) -> None:
+        size = len(data)
+        caplen = min(size, self.snaplen)
+        pad = -caplen & 3
+        total = self._epb.size + caplen + pad + 4
+        self._buffer += self._epb.pack(_PCAPNG_EPB, total, 0, timestamp >> 32,
+                                       timestamp & 0xFFFFFFFF, caplen, size)
+        self._buffer += data[:caplen] if caplen < size else data
+        self._buffer += b"\x00" * pad + total.to_bytes(4, "little")
+
+
+class PcapReader:
+    """ Memory-mapped reader of pcap and pcapng files.
+
+        Iterating yields (timestamp, data) per record, with the timestamp
+        in nanoseconds since the epoch and the data a zero-copy memoryview
+        of the mapped file, so memory use does not depend on the file
+        size. Views still referenced at close() keep the mapping alive
+        until they are dropped.
+
+        ip_packets() additionally strips the link-layer header, skipping
+        records other than IPv4, and packets() decodes them like
+        `decode_packet`. Both byte orders and the pcap microsecond and
+        nanosecond variants are supported; pcapng files may have several
+        sections and interfaces.
+    """
+    __slots__ = (
+        "_file",
+        "_map",
+        "_view",
+        "linktype",
+        "skipped",
+    )
+
+    def __init__(self, file: str | PathLike | BinaryIO) -> None:
+        if isinstance(file, (str, PathLike)):
+            self._file = open(file, "rb")
+        else:
+            self._file = file
+        # mmap() refuses empty files, so short ones are turned away first.
+        if fstat(self._file.fileno()).st_size < 4:
+            self._file.close()
+            raise ValueError("truncated pcap file header")
+        self._map = mmap(self._file.fileno(), 0, access=ACCESS_READ)
+        self._view = memoryview(self._map)
+        self.linktype = None
+        """ Link type of the (first) interface, known once read. """
+        self.skipped = 0
+        """ Records ip_packets() and packets() skipped as not IPv4 or not
+            decodable. """
+
+    def __enter__(self) -> PcapReader:
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def __iter__(self) -> Iterator[tuple[int, memoryview]]:
+        for timestamp, _, data in self._records():
+            yield timestamp, data
+
+    def ip_packets(self) -> Iterator[tuple[int, memoryview]]:
+        """ Like iterating, but with the link-layer header stripped and
+            records other than IPv4 skipped. """
+        for timestamp, linktype, data in self._records():
+            offset = _ip_offset(linktype, data)
+            if offset is None:
+                self.skipped += 1
+                continue
+            yield timestamp, data[offset:]
+
+    def packets(self) -> Iterator[tuple[int, IPHeader, Header | None]]:
+        """ Decode every IPv4 record into its IP and transport header. """
+        for timestamp, data in self.ip_packets():
+            try:
+                ip, transport = decode_packet(data)
+            except ValueError:
+                self.skipped += 1
+                continue
+            yield timestamp, ip, transport
+
+    def close(self) -> None:
+        if self._map is None:
+            return
+        self._view.release()
+        try:
+            self._map.close()
+        except BufferError:
+            # Records (or headers decoded from them) are still referenced;
+            # the mapping goes away with the last of them.
+            pass
+        self._file.close()
+        self._map = None
+
+    def _records(self) -> Iterator[tuple[int, int, memoryview]]:
+        magic = int.from_bytes(self._view[:4], "little")
+        if magic == _PCAPNG_SHB:
+            return self._pcapng_records()
+        return self._pcap_records()
+
+    def _pcap_records(self) -> Iterator[tuple[int, int, memoryview]]:
+        view = self._view
+        for order in "<>":
+            magic, = Struct(order + "I").unpack_from(view)
+            if magic in (_PCAP_MAGIC, _PCAP_MAGIC_NS):
+                break
+        else:
+            raise ValueError("not a pcap or pcapng file")
+        scale = 1 if magic == _PCAP_MAGIC_NS else 1000
+        file_header = Struct(order + "IHHiIII")
+        if len(view) < file_header.size:
+            raise ValueError("truncated pcap file header")
+        *_, linktype = file_header.unpack_from(view)
+        self.linktype = linktype
+        unpack = Struct(order + "IIII").unpack_from
+        offset = file_header.size
+        end = len(view)
+        while offset + 16 <= end:
+            sec, frac, caplen, _ = unpack(view, offset)
+            offset += 16
+            if offset + caplen > end:
+                raise ValueError(f"truncated pcap record at offset {offset - 16}")
+            yield sec * 1_000_000_000 + frac * scale, linktype, view[offset:offset + caplen]
+            offset += caplen
+
+    def _pcapng_records(self) -> Iterator[tuple[int, int, memoryview]]:
+        view = self._view
+        end = len(view)
+        offset = 0
+        order = "<"
+        interfaces = []
+        while offset + 12 <= end:
+            block_type = int.from_bytes(view[offset:offset + 4], "little" if order == "<" else "big")
+            if block_type == _PCAPNG_SHB:
+                bom = int.from_bytes(view[offset + 8:offset + 12], "little")
+                order = "<" if bom == _PCAPNG_BOM else ">"
+                interfaces = []
+            u32 = Struct(order + "I").unpack_from
+            length, = u32(view, offset + 4)
+            if length < 12 or length % 4 or offset + length > end:
+                raise ValueError(f"invalid pcapng block at offset {offset}")
+            body = offset + 8
+
+            if block_type == _PCAPNG_IDB:
+                linktype, = Struct(order + "H").unpack_from(view, body)
+                interfaces.append((linktype, _tsresol(view, body + 8, offset + length - 4, order)))
+                if self.linktype is None:
+                    self.linktype = linktype
+            elif block_type == _PCAPNG_EPB or block_type == _PCAPNG_PB:
+                if block_type == _PCAPNG_EPB:
+                    iface, high, low, caplen, _ = Struct(order + "IIIII").unpack_from(view, body)
+                else:
+                    iface, _, high, low, caplen, _ = Struct(order + "HHIIII").unpack_from(view, body)
+                linktype, (num, den) = interfaces[iface]
+                yield ((high << 32 | low) * num // den, linktype,
+                       view[body + 20:body + 20 + caplen])
+            elif block_type == _PCAPNG_SPB:
+                size, = u32(view, body)
+                caplen = min(size, length - 16)
+                yield 0, interfaces[0][0], view[body + 4:body + 4 + caplen]
+            offset += length
+
+
+def _tsresol(view: memoryview, offset: int, end: int, order: str) -> tuple[int, int]:
+    """ Nanoseconds per timestamp unit, as a fraction, from the options
+        of an Interface Description Block. """
+    opt = Struct(order + "HH").unpack_from
+    while offset + 4 <= end:
+        code, size = opt(view, offset)
+        if code == 0:
+            break
+        if code == _OPT_TSRESOL and size >= 1:
+            value = view[offset + 4]
+            if value & 0x80:
+                return 1_000_000_000, 1 << (value & 0x7F)
+            exp = value & 0x7F
+            return (10 ** (9 - exp), 1) if exp <= 9 else (1, 10 ** (exp - 9))
+        offset += 4 + size + (-size & 3)
+    return 1000, 1
+
+
+def _ip_offset(linktype: int, data: memoryview) -> int | None:
+    """ Offset of the IPv4 header in a record, or None if it has none. """
+    if linktype in (LinkType.RAW, LinkType.IPV4):
+        offset = 0
+    elif linktype == LinkType.ETHERNET:
+        if len(data) < 14:
+            return None
+        ethertype = data[12] << 8 | data[13]
+        offset = 14
+        if ethertype == _ETHERTYPE_VLAN and len(data) >= 18:
+            ethertype = data[16] << 8 | data[17]
+            offset = 18
+        if ethertype != _ETHERTYPE_IPV4:
+            return None
+    elif linktype == LinkType.LINUX_SLL:
+        if len(data) < 16 or data[14] << 8 | data[15] != _ETHERTYPE_IPV4:
+            return None
+        offset = 16
+    elif linktype == LinkType.NULL:
+        offset = 4
+    else:
+        return None
+    if len(data) <= offset or data[offset] >> 4 != IPVersion.IPV4:
+        return None
+    return offset
@@ -0,0 +1,356 @@
+#  This file is part of protohdr-python3
+#  Copyright (C) 2022 ecriminal
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+
+from numpy import (
+    ndarray     as np_ndarray,
+    uint64      as np_uint64,
+)
+
+from dataclasses import replace
+from ipaddress import IPv4Network
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+from os import cpu_count
+from socket import inet_ntoa
+from time import sleep
+from typing import Any, Iterator, Sequence
+
+from ._headers import *
+from ._packet import *
+from ._template import *
+
+
+__all__ = (
+    "PacketPipeline",
+    "ShmRing",
+    "shard_range",
+)
+
+
+_IDLE_SLEEP = 0.0001
+""" Seconds a producer (consumer) waits for a full (empty) ring. """
+
+
+class ShmRing:
+    """ Single-producer, single-consumer ring of fixed-size packet slots
+        in a `multiprocessing.shared_memory` block.
+
+        The producer reserves the next free slot with reserve(), writes a
+        packet into it in place and publishes it with commit(). The
+        consumer gets the published slots as memoryviews with peek() and
+        hands them back with release(). Both sides only ever write their
+        own 64-bit counter, so no lock is needed. Counters are published
+        after the slot contents, which keeps them ordered on hosts with
+        total store order (x86-64).
+
+        Create a ring with `ShmRing(slots, slot_size)` and attach to it
+        from another process with `ShmRing.attach(name)`.
+    """
+    __slots__ = (
+        "_shm",
+        "_ctl",
+        "_data",
+        "_slots",
+        "_slot_size",
+        "_owner",
+    )
+
+    _CTL_WORDS = 8
+    """ Control block: head, tail, closed, slots, slot size, padding. """
+
+    def __init__(self, slots: int, slot_size: int, *, _shm: SharedMemory | None = None) -> None:
+        if slots < 1 or slot_size < 1:
+            raise ValueError(f"invalid ring geometry {slots} x {slot_size}")
+        ctl_size = self._CTL_WORDS * 8
+        self._owner = _shm is None
+        if _shm is None:
+            _shm = SharedMemory(create=True, size=ctl_size + slots * slot_size)
+        self._shm = _shm
+        self._ctl = np_ndarray((self._CTL_WORDS,), np_uint64, _shm.buf)
+        if self._owner:
+            self._ctl[:] = 0
+            self._ctl[3] = slots
+            self._ctl[4] = slot_size
+        self._data = _shm.buf[ctl_size:ctl_size + slots * slot_size]
+        self._slots = slots
+        self._slot_size = slot_size
+
+    @classmethod
+    def attach(cls, name: str) -> ShmRing:
+        """ Attach to the ring created under `name` by another process. """
+        shm = SharedMemory(name)
+        ctl = np_ndarray((cls._CTL_WORDS,), np_uint64, shm.buf)
+        slots, slot_size = int(ctl[3]), int(ctl[4])
+        del ctl
+        return cls(slots, slot_size, _shm=shm)
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    @property
+    def slot_size(self) -> int:
+        return self._slot_size
+
+    @property
+    def closed(self) -> bool:
+        """ Whether the producer has finished. """
+        return bool(self._ctl[2])
+
+    def __len__(self) -> int:
+        """ Number of published slots not yet released. """
+        return int(self._ctl[0] - self._ctl[1])
+
+    def reserve(self) -> memoryview | None:
+        """ Next free slot, or None while the ring is full. """
+        head = int(self._ctl[0])
+        if head - int(self._ctl[1]) >= self._slots:
+            return None
+        at = (head % self._slots) * self._slot_size
+        return self._data[at:at + self._slot_size]
+
+    def commit(self, count: int = 1) -> None:
+        """ Publish the next `count` reserved slots. """
+        self._ctl[0] += count
+
+    def peek(self, limit: int | None = None) -> list[memoryview]:
+        """ Published slots, oldest first, without releasing them. The
+            views are only valid until release(). """
+        tail = int(self._ctl[1])
+        count = int(self._ctl[0]) - tail
+        if limit is not None:
+            count = min(count, limit)
+        views = []
+        for i in range(tail, tail + count):
+            at = (i % self._slots) * self._slot_size
+            views.append(self._data[at:at + self._slot_size])
+        return views
+
+    def release(self, count: int) -> None:
+        """ Hand the `count` oldest published slots back to the producer. """
+        self._ctl[1] += count
+
+    def mark_closed(self) -> None:
+        """ Signal the consumer that no more slots will be published. """
+        self._ctl[2] = 1
+
+    def close(self) -> None:
+        """ Detach from the ring, and free it if this process created it. """
+        self._ctl = None
+        self._data.release()
+        try:
+            self._shm.close()
+        except BufferError:
+            # Views from peek() are still referenced; the mapping goes
+            # away with the last of them.
+            pass
+        if self._owner:
+            self._shm.unlink()
+
+
+def shard_range(total: int, shards: int, index: int) -> range:
+    """ Contiguous part `index` of `range(total)` split into `shards`
+        nearly equal parts. """
+    if not 0 <= index < shards:
+        raise ValueError(f"shard {index} out of range for {shards} shards")
+    return range(total * index // shards, total * (index + 1) // shards)
+
+
+def _template(ip: IPHeader, transport: TCPHeader | UDPHeader | ICMPHeader) -> PacketTemplate:
+    """ Template patching the fields that vary per target and probe, with
+        lengths filled in as by `Packet`. """
+    ip, transport = replace(ip), replace(transport)
+    Packet(ip, transport).fill_in()
+    if isinstance(transport, TCPHeader):
+        fields = ("dst_port", "seq_num")
+    elif isinstance(transport, UDPHeader):
+        fields = ("dst_port",)
+    else:
+        fields = ("seq_num",)
+    return PacketTemplate(ip, transport, ("identifier", "dst_addr"), fields)
+
+
+def _seq_bits(transport: Header) -> int:
+    """ Width of the sequence number field of `transport`. """
+    return 32 if isinstance(transport, TCPHeader) else 16
+
+
+def _values(ip: IPHeader, transport: Header, addresses: Sequence[Any],
+            ports: Sequence[int], index: int, count: int, ids: range, seqs: range) -> tuple:
+    """ Field values of target `index`, the `count`th of its worker, in
+        `_template` order. """
+    addr = addresses[index // len(ports)]
+    addr = inet_ntoa(addr.to_bytes(4, "big")) if type(addr) is int else str(addr)
+    identifier = (ip.identifier + ids[count % len(ids)]) & 0xFFFF
+    if isinstance(transport, TCPHeader):
+        return (identifier, addr, ports[index % len(ports)],
+                (transport.seq_num + seqs[count % len(seqs)]) & 0xFFFFFFFF)
+    if isinstance(transport, UDPHeader):
+        return identifier, addr, ports[index % len(ports)]
+    return identifier, addr, (transport.seq_num + seqs[count % len(seqs)]) & 0xFFFF
+
+
+def _generate(name: str, ip: IPHeader, transport: Header, addresses: Sequence[Any],
+              ports: Sequence[int], targets: range, ids: range, seqs: range) -> None:
+    """ Worker process: write the packets of `targets` into ring `name`,
+        numbered from the identifier and sequence number blocks `ids` and
+        `seqs`. """
+    ring = ShmRing.attach(name)
+    try:
+        template = _template(ip, transport)
+        for count, index in enumerate(targets):
+            while (slot := ring.reserve()) is None:
+                sleep(_IDLE_SLEEP)
+            template.pack_into(slot, 0, *_values(ip, transport, addresses, ports,
+                                                 index, count, ids, seqs))
+            slot.release()
+            ring.commit()
+        ring.mark_closed()
+    finally:
+        ring.close()
+
+
+class PacketPipeline:
+    """ Packet generation sharded across worker processes.
+
+        The target space `addresses` x `ports` is numbered address-major
+        and split into one contiguous shard per worker. `addresses` is an
+        `ipaddress.IPv4Network` or a sequence of addresses as strings,
+        `IPv4Address` objects or integers (e.g. a range), so large spaces
+        are never materialized. Every worker patches the packets of its
+        shard from a `PacketTemplate` of `ip` and `transport` straight
+        into its own `ShmRing`; the consuming process drains all rings
+        without pickling anything.
+
+        The IP identifier space is split into one contiguous block per
+        worker, as is the TCP or ICMP sequence number space. Each worker
+        numbers its packets through its own blocks, added to
+        `ip.identifier` and `transport.seq_num`, and starts over at the
+        beginning of its block once it runs out, so no two workers ever
+        use the same identifier or sequence number. With one worker,
+        target number i gets `ip.identifier + i` and `transport.seq_num +
+        i`; the numbering thus depends on the number of workers. UDP and
+        TCP packets get the target port as `dst_port`; ICMP ignores
+        `ports`. Lengths and checksums are filled in as by `Packet`.
+    """
+    __slots__ = (
+        "_ip",
+        "_transport",
+        "_addresses",
+        "_ports",
+        "_workers",
+        "_slots",
+        "_context",
+        "_rings",
+        "_procs",
+    )
+
+    def __init__(self, ip: IPHeader, transport: TCPHeader | UDPHeader | ICMPHeader,
+                 addresses: Sequence[Any], ports: Sequence[int] = (0,),
+                 workers: int | None = None, slots: int = 4096,
+                 context: str | None = None) -> None:
+        if not ports:
+            raise ValueError("no ports given")
+        _template(ip, transport)
+        if isinstance(addresses, IPv4Network):
+            first = int(addresses.network_address)
+            addresses = range(first, first + addresses.num_addresses)
+        self._ip = ip
+        self._transport = transport
+        self._addresses = addresses
+        self._ports = ports
+        self._workers = workers or cpu_count() or 1
+        if not 0 < self._workers <= 1 << 16:
+            raise ValueError(f"cannot split identifiers across {self._workers} workers")
+        self._slots = slots
+        self._context = get_context(context)
+        self._rings = []
+        self._procs = []
+
+    def __len__(self) -> int:
+        return len(self._addresses) * len(self._ports)
+
+    def __enter__(self) -> PacketPipeline:
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def start(self) -> None:
+        """ Start the worker processes. """
+        if self._procs:
+            raise RuntimeError("pipeline already started")
+        size = len(_template(self._ip, self._transport))
+        seq_bits = _seq_bits(self._transport)
+        for index in range(self._workers):
+            ring = ShmRing(self._slots, size)
+            self._rings.append(ring)
+            proc = self._context.Process(
+                target=_generate,
+                args=(ring.name, self._ip, self._transport, self._addresses,
+                      self._ports, shard_range(len(self), self._workers, index),
+                      shard_range(1 << 16, self._workers, index),
+                      shard_range(1 << seq_bits, self._workers, index)),
+                daemon=True,
+            )
+            proc.start()
+            self._procs.append(proc)
+
+    def batches(self, limit: int | None = None) -> Iterator[list[memoryview]]:
+        """ Drain the rings round-robin, yielding up to `limit` packets at
+            a time. The views are only valid until the next iteration. """
+        if not self._procs:
+            self.start()
+        pending = dict(enumerate(self._rings))
+        while pending:
+            idle = True
+            for index, ring in list(pending.items()):
+                closed = ring.closed
+                views = ring.peek(limit)
+                if views:
+                    idle = False
+                    try:
+                        yield views
+                    finally:
+                        for view in views:
+                            view.release()
+                    ring.release(len(views))
+                elif closed:
+                    del pending[index]
+                elif self._procs[index].exitcode is not None:
+                    raise RuntimeError(f"worker {index} exited with code "
+                                       f"{self._procs[index].exitcode}")
+            if idle:
+                sleep(_IDLE_SLEEP)
+
+    def packets(self) -> Iterator[bytes]:
+        """ Drain the rings, yielding every packet as bytes. """
+        for views in self.batches():
+            yield from map(bytes, views)
+
+    def close(self) -> None:
+        """ Stop the workers and free the rings. """
+        for proc in self._procs:
+            if proc.is_alive():
+                proc.terminate()
+            proc.join()
+        for ring in self._rings:
+            ring.close()
+        self._procs.clear()
+        self._rings.clear()
@@ -0,0 +1,113 @@
+#  This file is part of protohdr-python3
+#  Copyright (C) 2022 ecriminal
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+
+from hashlib import blake2b
+from os import urandom
+from typing import Any
+
+from ._headers import *
+from ._inet import *
+
+
+__all__ = (
+    "ProbeCodec",
+)
+
+
+class ProbeCodec:
+    """ Stateless encoding of probe state into header fields.
+
+        Probe fields are derived from a keyed hash (BLAKE2b) of the target
+        address and port, so replies can be matched to probes by hashing
+        their source again instead of remembering every probe. Memory use
+        does not depend on the number of probes.
+
+        TCP probes get their `src_port` (from `src_ports`) and `seq_num`
+        from the hash; a SYN-ACK or RST answering one acknowledges
+        `seq_num + 1` on that port. ICMP echo requests get their
+        `identifier` and `seq_num` from the hash of the address alone and
+        the echo reply repeats both.
+
+        Codecs sharing the same `key` (e.g. in worker processes) derive
+        the same fields. Without a key a random one is generated.
+    """
+    __slots__ = (
+        "_hash",
+        "_port_base",
+        "_port_count",
+        "key",
+    )
+
+    def __init__(self, key: bytes | None = None,
+                 src_ports: range = range(32768, 61000)) -> None:
+        if key is None:
+            key = urandom(16)
+        if src_ports.step != 1 or not src_ports or src_ports[0] < 0 or src_ports[-1] > 0xFFFF:
+            raise ValueError(f"invalid source port range {src_ports}")
+        self.key = key
+        self._hash = blake2b(key=key, digest_size=8)
+        self._port_base = src_ports[0]
+        self._port_count = len(src_ports)
+
+    def cookie(self, addr: str, port: int = 0) -> int:
+        """ 64-bit keyed hash of a target IPv4 or IPv6 address and port. """
+        h = self._hash.copy()
+        h.update(inet_pack_addr(addr, 6 if ":" in addr else 4) + port.to_bytes(2, "big"))
+        return int.from_bytes(h.digest(), "big")
+
+    def tcp(self, dst_addr: str, dst_port: int) -> tuple[int, int]:
+        """ `src_port` and `seq_num` of the TCP probe to a target. """
+        cookie = self.cookie(dst_addr, dst_port)
+        return self._port_base + (cookie >> 32) % self._port_count, cookie & 0xFFFFFFFF
+
+    def icmp(self, dst_addr: str) -> tuple[int, int]:
+        """ `identifier` and `seq_num` of the ICMP echo request to a
+            target. """
+        cookie = self.cookie(dst_addr)
+        return cookie >> 48, (cookie >> 32) & 0xFFFF
+
+    def encode(self, ip: IPHeader | IPv6Header, transport: TCPHeader | ICMPHeader) -> None:
+        """ Set the probe fields of `transport` for `ip.dst_addr` (and the
+            TCP `dst_port`). Checksums are left to the caller. """
+        if isinstance(transport, TCPHeader):
+            transport.src_port, transport.seq_num = self.tcp(ip.dst_addr, transport.dst_port)
+        elif isinstance(transport, ICMPHeader):
+            transport.identifier, transport.seq_num = self.icmp(ip.dst_addr)
+        else:
+            raise TypeError(f"unsupported transport header {type(transport).__name__}")
+
+    def check_tcp(self, ip: Any, tcp: Any) -> bool:
+        """ Whether a TCP segment answers one of our probes, judging by its
+            ports and acknowledgment number. Flags are not checked. """
+        src_port, seq_num = self.tcp(ip.src_addr, tcp.src_port)
+        return tcp.dst_port == src_port and tcp.ack_num == (seq_num + 1) & 0xFFFFFFFF
+
+    def check_icmp(self, ip: Any, icmp: Any) -> bool:
+        """ Whether an ICMP message carries the identifier and sequence
+            number of our echo request to its sender. The type is not
+            checked. """
+        return (icmp.identifier, icmp.seq_num) == self.icmp(ip.src_addr)
+
+    def check(self, ip: Any, transport: Any) -> bool:
+        """ Whether a received packet answers one of our probes. Accepts
+            headers as well as views (see `view_packet`). """
+        if isinstance(transport, (TCPHeader, TCPView)):
+            return self.check_tcp(ip, transport)
+        if isinstance(transport, (ICMPHeader, ICMPView)):
+            return self.check_icmp(ip, transport)
+        return False
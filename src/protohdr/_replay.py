@@ -0,0 +1,222 @@
+#  This file is part of protohdr-python3
+#  Copyright (C) 2022 ecriminal
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+
+from itertools import islice
+from socket import IPPROTO_TCP, IPPROTO_UDP, inet_aton, inet_ntoa
+from struct import Struct
+from time import perf_counter
+from typing import Any, Callable, Iterable, Iterator, Mapping
+
+from ._pacer import *
+from ._sender import *
+
+
+__all__ = (
+    "Rewriter",
+    "replay",
+)
+
+
+_IP_FIELDS = Struct("!HHBBHII")
+""" IPv4 header from the identifier to the destination address. """
+
+_PORTS = Struct("!HH")
+_CHECKSUM = Struct("!H")
+
+
+def _rule(rule: Any, encode: Callable[[Any], int],
+          decode: Callable[[int], Any]) -> Callable[[int], int] | None:
+    """ Compile `rule` into a function of the old field value. """
+    if rule is None:
+        return None
+    if isinstance(rule, Mapping):
+        table = {encode(old): encode(new) for old, new in rule.items()}
+        return lambda old: table.get(old, old)
+    if callable(rule):
+        return lambda old: encode(rule(decode(old)))
+    new = encode(rule)
+    return lambda old: new
+
+
+def _addr_rule(rule: Any) -> Callable[[int], int] | None:
+    return _rule(rule, lambda addr: int.from_bytes(inet_aton(str(addr)), "big"),
+                 lambda old: inet_ntoa(old.to_bytes(4, "big")))
+
+
+def _int_rule(rule: Any) -> Callable[[int], int] | None:
+    return _rule(rule, int, int)
+
+
+def _fold(checksum: int, delta: int) -> int:
+    """ `checksum` adjusted for a change of `delta` in the summed words
+        (RFC 1624). """
+    return 0xFFFF - ((0xFFFF - checksum + delta) % 0xFFFF or 0xFFFF)
+
+
+class Rewriter:
+    """ Declarative in-place rewriting of captured IPv4 packets.
+
+        Every rule is a new value, a Mapping of old to new values (values
+        not in it are kept) or a callable returning the new value for the
+        old one. Addresses are strings (or `IPv4Address`), the other
+        fields integers. Rules are compiled to lookups on the raw field
+        values once, so a packet is never decoded: rewrite() patches the
+        fields in place and fixes the IP and the TCP or UDP checksum
+        incrementally (RFC 1624) from the values that changed, address
+        changes included via the pseudo-header. Packets truncated by the
+        capture are patched as far as they go.
+
+        Ports are only rewritten in TCP and UDP packets that are not
+        later fragments; UDP packets without a checksum keep none.
+    """
+    __slots__ = (
+        "_identifier",
+        "_ttl",
+        "_src_addr",
+        "_dst_addr",
+        "_src_port",
+        "_dst_port",
+        "_ip",
+    )
+
+    def __init__(self, *, src_addr: Any = None, dst_addr: Any = None,
+                 src_port: Any = None, dst_port: Any = None,
+                 ttl: Any = None, identifier: Any = None) -> None:
+        self._identifier = _int_rule(identifier)
+        self._ttl = _int_rule(ttl)
+        self._src_addr = _addr_rule(src_addr)
+        self._dst_addr = _addr_rule(dst_addr)
+        self._src_port = _int_rule(src_port)
+        self._dst_port = _int_rule(dst_port)
+        self._ip = any(rule is not None for rule in (identifier, ttl, src_addr, dst_addr))
+
+    def rewrite(self, packet: bytearray | memoryview, offset: int = 0) -> None:
+        """ Rewrite the IPv4 packet at `offset` of `packet` in place.
+            Raises ValueError for anything else and for rule results out
+            of range of their field, which leave the packet as it was. """
+        size = len(packet) - offset
+        if size < 20 or packet[offset] >> 4 != 4:
+            raise ValueError("not an IPv4 packet")
+        identifier, frag, ttl, protocol, checksum, src, dst = _IP_FIELDS.unpack_from(
+            packet, offset + 4)
+        if protocol == IPPROTO_TCP:
+            at = 16
+        elif protocol == IPPROTO_UDP:
+            at = 6
+        else:
+            at = None
+        # Later fragments have no transport header. The checksum is in
+        # the first fragment, which gets the pseudo-header change.
+        transport = at is not None and not frag & 0x1FFF
+        start = offset + (packet[offset] & 0x0F) * 4
+        ports = (transport and (self._src_port is not None or self._dst_port is not None)
+                 and size >= start - offset + 4)
+
+        # Every new value is checked before the first one is written, so
+        # a failing rule leaves the packet intact. Addresses come from
+        # inet_aton() and are always in range.
+        new_id, new_ttl, new_src, new_dst = identifier, ttl, src, dst
+        if self._ip:
+            if self._identifier is not None:
+                new_id = self._identifier(identifier)
+            if self._ttl is not None:
+                new_ttl = self._ttl(ttl)
+            if self._src_addr is not None:
+                new_src = self._src_addr(src)
+            if self._dst_addr is not None:
+                new_dst = self._dst_addr(dst)
+            if not (0 <= new_id <= 0xFFFF and 0 <= new_ttl <= 0xFF):
+                raise ValueError(f"rewritten field out of range: identifier {new_id}, "
+                                 f"TTL {new_ttl}")
+        if ports:
+            src_port, dst_port = _PORTS.unpack_from(packet, start)
+            new_src_port = src_port if self._src_port is None else self._src_port(src_port)
+            new_dst_port = dst_port if self._dst_port is None else self._dst_port(dst_port)
+            if not (0 <= new_src_port <= 0xFFFF and 0 <= new_dst_port <= 0xFFFF):
+                raise ValueError(f"rewritten port out of range: {new_src_port}, {new_dst_port}")
+
+        # Values of word-aligned fields are congruent to the sum of their
+        # words modulo 0xFFFF, so differences of values are deltas of sums.
+        pseudo = new_src - src + new_dst - dst
+        if self._ip:
+            delta = pseudo + new_id - identifier + (new_ttl - ttl << 8)
+            if delta % 0xFFFF:
+                checksum = _fold(checksum, delta)
+            _IP_FIELDS.pack_into(packet, offset + 4, new_id, frag, new_ttl, protocol,
+                                 checksum, new_src, new_dst)
+        if not transport:
+            return
+        if ports:
+            _PORTS.pack_into(packet, start, new_src_port, new_dst_port)
+            pseudo += new_src_port - src_port + new_dst_port - dst_port
+        if pseudo % 0xFFFF and size >= start - offset + at + 2:
+            checksum, = _CHECKSUM.unpack_from(packet, start + at)
+            if checksum or protocol == IPPROTO_TCP:
+                checksum = _fold(checksum, pseudo)
+                if not checksum and protocol == IPPROTO_UDP:
+                    checksum = 0xFFFF
+                _CHECKSUM.pack_into(packet, start + at, checksum)
+
+
+def replay(packets: Iterable[tuple[int, bytes | bytearray | memoryview]],
+           send: Callable[[list[bytes]], Any], rewriter: Rewriter | None = None, *,
+           pacer: Pacer | None = None, batch_size: int = 64) -> SendStats:
+    """ Rewrite and send captured IPv4 packets.
+
+        `packets` are (timestamp, data) pairs such as
+        `PcapReader.ip_packets()`; timestamps are ignored. Every packet is
+        copied, rewritten with `rewriter` and passed on in lists of bytes
+        objects to `send`, e.g. `Sender.send` or `PcapWriter.write_many`.
+        With a `pacer`, the lists are its micro-batches, released at its
+        rate (of IP packets, without link layer); otherwise they hold up
+        to `batch_size` packets and are sent as fast as possible.
+
+        Returns the counters; `calls` and `partial` are taken from `send`
+        if it returns `SendStats` and count the batches otherwise.
+    """
+    if batch_size < 1:
+        raise ValueError(f"batch size must be positive, not {batch_size}")
+    rewrite = rewriter.rewrite if rewriter is not None else None
+
+    def rewritten() -> Iterator[bytes]:
+        for _, data in packets:
+            if rewrite is None:
+                yield bytes(data)
+                continue
+            buf = bytearray(data)
+            rewrite(buf)
+            yield bytes(buf)
+
+    if pacer is not None:
+        batches = pacer.batches(rewritten())
+    else:
+        it = rewritten()
+        batches = iter(lambda: list(islice(it, batch_size)), [])
+    stats = SendStats()
+    start = perf_counter()
+    for batch in batches:
+        result = send(batch)
+        if isinstance(result, SendStats):
+            stats.calls += result.calls
+            stats.partial += result.partial
+        else:
+            stats.calls += 1
+        stats.packets += len(batch)
+        stats.nbytes += sum(map(len, batch))
+    stats.elapsed = perf_counter() - start
+    return stats
@@ -0,0 +1,432 @@
+#  This file is part of protohdr-python3
+#  Copyright (C) 2022 ecriminal
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+
+from numpy import (
+    cumsum      as np_cumsum,
+    frombuffer  as np_frombuffer,
+    fromiter    as np_fromiter,
+    uint8       as np_uint8,
+    uint16      as np_uint16,
+    uint32      as np_uint32,
+    uintp       as np_uintp,
+)
+
+from ctypes import (
+    CDLL, POINTER, Structure, addressof, c_char, c_char_p, c_int, c_size_t,
+    c_uint, c_uint16, c_uint32, c_void_p, cast, get_errno, sizeof,
+)
+from dataclasses import dataclass
+from errno import EAGAIN, EINTR, EWOULDBLOCK
+from itertools import islice
+from os import strerror
+from select import select
+from socket import (
+    AF_INET, AF_INET6, IP_HDRINCL, IPPROTO_IP, IPPROTO_IPV6, SOCK_RAW, inet_ntop, inet_pton,
+    socket,
+)
+from sys import byteorder, platform
+from time import perf_counter
+from typing import Any, Iterable, Sequence
+
+from ._header import *
+from ._packet import *
+from ._template import *
+
+
+__all__ = (
+    "SendStats",
+    "Sender",
+)
+
+
+class _iovec(Structure):
+    _fields_ = (
+        ("iov_base", c_char_p),
+        ("iov_len", c_size_t),
+    )
+
+
+class _msghdr(Structure):
+    _fields_ = (
+        ("msg_name", c_void_p),
+        ("msg_namelen", c_uint),
+        ("msg_iov", POINTER(_iovec)),
+        ("msg_iovlen", c_size_t),
+        ("msg_control", c_void_p),
+        ("msg_controllen", c_size_t),
+        ("msg_flags", c_int),
+    )
+
+
+class _mmsghdr(Structure):
+    _fields_ = (
+        ("msg_hdr", _msghdr),
+        ("msg_len", c_uint),
+    )
+
+
+class _sockaddr_in(Structure):
+    _fields_ = (
+        ("sin_family", c_uint16),
+        ("sin_port", c_uint16),
+        ("sin_addr", c_char * 4),
+        ("sin_zero", c_char * 8),
+    )
+
+
+class _sockaddr_in6(Structure):
+    _fields_ = (
+        ("sin6_family", c_uint16),
+        ("sin6_port", c_uint16),
+        ("sin6_flowinfo", c_uint32),
+        ("sin6_addr", c_char * 16),
+        ("sin6_scope_id", c_uint32),
+    )
+
+
+def _load_sendmmsg() -> Any:
+    """ sendmmsg(2) from the C library, or None where unavailable. The
+        structure layouts above are the Linux ones. """
+    if not platform.startswith("linux"):
+        return None
+    try:
+        func = CDLL(None, use_errno=True).sendmmsg
+    except (OSError, AttributeError):
+        return None
+    func.argtypes = (c_int, c_void_p, c_uint, c_int)
+    func.restype = c_int
+    return func
+
+
+_sendmmsg = _load_sendmmsg()
+
+_MAX_IOV = 8
+""" Maximum number of buffers gathered into one packet. """
+
+_DST_FIELDS = {
+    AF_INET:    (16, 4,  _sockaddr_in,  _sockaddr_in.sin_addr.offset),
+    AF_INET6:   (24, 16, _sockaddr_in6, _sockaddr_in6.sin6_addr.offset),
+}
+""" Offset and size of the destination address in the IP header, and the
+    socket address structure holding it, per address family. """
+
+_HDRINCL = {
+    AF_INET:    (IPPROTO_IP,    IP_HDRINCL),
+    AF_INET6:   (IPPROTO_IPV6,  36),
+}
+""" Socket option telling whether packets include their IP header, per
+    address family. IPV6_HDRINCL is missing from the socket module; 36 is
+    its Linux value. """
+
+
+def _includes_header(sock: socket) -> bool:
+    """ Whether packets sent on `sock` carry their own IPv4 or IPv6
+        header: a raw socket with IP_HDRINCL or IPV6_HDRINCL set, which
+        IPPROTO_RAW sockets imply. """
+    if sock.type != SOCK_RAW or sock.family not in _HDRINCL:
+        return False
+    try:
+        return bool(sock.getsockopt(*_HDRINCL[sock.family]))
+    except OSError:
+        return False
+
+
+@dataclass(slots=True)
+class SendStats:
+    """ Counters of one `Sender` run. """
+    packets: int = 0
+    """ Packets handed to the kernel. """
+
+    nbytes: int = 0
+    """ Bytes handed to the kernel. """
+
+    calls: int = 0
+    """ Send system calls made. """
+
+    partial: int = 0
+    """ Calls that sent fewer packets (sendmmsg) or bytes (sendmsg) than
+        requested. The rest is sent by the next call. """
+
+    elapsed: float = 0.0
+    """ Wall-clock seconds spent sending. """
+
+    @property
+    def pps(self) -> float:
+        """ Achieved packets per second. """
+        return self.packets / self.elapsed if self.elapsed else 0.0
+
+
+class Sender:
+    """ Batched packet sender for raw (or any datagram) sockets.
+
+        Packets are sent `batch_size` at a time with one sendmmsg(2) call
+        per batch where the C library provides it (Linux), and with one
+        sendmsg(2) call per packet otherwise. A packet is a bytes-like
+        object, a `Header` or `Packet` (serialized with bytes()), or a
+        sequence of up to 8 bytes-like objects that are gathered by the
+        kernel, e.g. (headers, payload), so payloads are never
+        concatenated in Python.
+
+        Packets go to `address`, a (host, port) pair of the socket's
+        address family. Without an address, packets sent on a raw socket
+        with IP_HDRINCL or IPV6_HDRINCL set (or of IPPROTO_RAW) go to the
+        destination in their IPv4 or IPv6 header, and other sockets must
+        be connected, e.g. one end of a socketpair().
+        Blocking and non-blocking sockets are supported; the sender waits
+        for non-blocking sockets to become writable.
+    """
+    __slots__ = (
+        "_sock",
+        "_address",
+        "_per_packet_dst",
+        "_batch_size",
+        "_msgs",
+        "_iovs",
+        "_names",
+        "_iov_words",
+        "_iovlen",
+        "_msglen",
+        "_dst",
+        "_dst_at",
+        "_dst_len",
+    )
+
+    def __init__(self, sock: socket, address: tuple[str, int] | None = None,
+                 batch_size: int = 64) -> None:
+        if batch_size < 1:
+            raise ValueError(f"batch size must be positive, not {batch_size}")
+        self._sock = sock
+        self._address = address
+        self._per_packet_dst = address is None and _includes_header(sock)
+        self._batch_size = batch_size
+        family = sock.family if sock.family in _DST_FIELDS else AF_INET
+        self._dst_at, self._dst_len, sockaddr, addr_at = _DST_FIELDS[family]
+        if _sendmmsg is None:
+            return
+
+        self._msgs = (_mmsghdr * batch_size)()
+        self._iovs = (_iovec * (batch_size * _MAX_IOV))()
+        self._names = (sockaddr * batch_size)()
+        # The family and port lead both address structures.
+        families = np_frombuffer(self._names, np_uint16).reshape(batch_size, -1)
+        families[:, 0] = family
+        if address is not None:
+            families[:, 1] = _htons(address[1])
+        for i, msg in enumerate(self._msgs):
+            msg.msg_hdr.msg_iov = POINTER(_iovec)(self._iovs[i * _MAX_IOV])
+            if address is not None or self._per_packet_dst:
+                msg.msg_hdr.msg_name = addressof(self._names[i])
+                msg.msg_hdr.msg_namelen = sizeof(sockaddr)
+
+        # NumPy views of the message, iovec and address arrays, one row per
+        # element, to fill whole batches without per-field ctypes access.
+        self._iov_words = np_frombuffer(self._iovs, np_uintp).reshape(-1, 2)
+        self._iovlen = np_frombuffer(self._msgs, np_uintp).reshape(batch_size, -1)[
+            :, _msghdr.msg_iovlen.offset // np_uintp().itemsize]
+        self._msglen = np_frombuffer(self._msgs, np_uint32).reshape(batch_size, -1)[
+            :, _mmsghdr.msg_len.offset // 4]
+        self._dst = np_frombuffer(self._names, np_uint8).reshape(batch_size, -1)[
+            :, addr_at:addr_at + self._dst_len]
+        if address is not None:
+            self._dst[:] = np_frombuffer(inet_pton(family, address[0]), np_uint8)
+
+    def send(self, packets: Iterable[bytes | bytearray | memoryview | Header | Packet
+                                     | Sequence[bytes | bytearray | memoryview]]) -> SendStats:
+        """ Send all `packets`, e.g. `PacketTemplate.packets()`. """
+        stats = SendStats()
+        start = perf_counter()
+        it = iter(packets)
+        while batch := list(islice(it, self._batch_size)):
+            if _sendmmsg is not None and set(map(type, batch)) == {bytes}:
+                self._send_bytes(batch, stats)
+            else:
+                self._send_batch([_buffers(pkt) for pkt in batch], stats)
+        stats.elapsed = perf_counter() - start
+        return stats
+
+    def send_template(self, template: PacketTemplate,
+                      rows: Iterable[Iterable[Any]]) -> SendStats:
+        """ Send one packet per row of `template` field values.
+
+            Every batch is patched in place into the same preallocated
+            buffer, so no packet object is allocated.
+        """
+        stats = SendStats()
+        start = perf_counter()
+        size = len(template)
+        slab = bytearray(size * self._batch_size)
+        view = memoryview(slab)
+        if self._per_packet_dst and size < self._dst_at + self._dst_len:
+            raise ValueError(f"packet of {size} bytes has no destination address")
+        dsts = np_frombuffer(slab, np_uint8).reshape(self._batch_size, size)[
+            :, self._dst_at:self._dst_at + self._dst_len]
+        it = iter(rows)
+        if _sendmmsg is not None:
+            addr = addressof((c_char * len(slab)).from_buffer(slab))
+            for i in range(self._batch_size):
+                iov = self._iovs[i * _MAX_IOV]
+                iov.iov_base = addr + i * size
+                iov.iov_len = size
+                self._msgs[i].msg_hdr.msg_iovlen = 1
+        while batch := list(islice(it, self._batch_size)):
+            for i, values in enumerate(batch):
+                template.pack_into(slab, i * size, *values)
+            if _sendmmsg is None:
+                for i in range(len(batch)):
+                    self._sendmsg((view[i * size:(i + 1) * size],), stats)
+                continue
+            if self._per_packet_dst:
+                self._dst[:len(batch)] = dsts[:len(batch)]
+            self._submit(len(batch), stats)
+        stats.elapsed = perf_counter() - start
+        return stats
+
+    def _send_bytes(self, batch: list[bytes], stats: SendStats) -> None:
+        """ Send a batch of bytes packets with sendmmsg(2).
+
+            The packets are joined into one buffer, so that the iovecs
+            are filled in vectorized from its address and the packet
+            lengths. Joining small packets costs less than setting the
+            iovecs of each packet through ctypes.
+        """
+        n = len(batch)
+        data = b"".join(batch)
+        iovs = self._iov_words[:n * _MAX_IOV:_MAX_IOV]
+        iovs[:, 1] = np_fromiter(map(len, batch), np_uintp, n)
+        iovs[0, 0] = 0
+        np_cumsum(iovs[:-1, 1], out=iovs[1:, 0])
+        iovs[:, 0] += cast(c_char_p(data), c_void_p).value
+        self._iovlen[:n] = 1
+        if self._per_packet_dst:
+            at, end = self._dst_at, self._dst_at + self._dst_len
+            if iovs[:, 1].min() < end:
+                raise ValueError("packet too short for a destination address")
+            self._dst[:n] = np_frombuffer(
+                b"".join([pkt[at:end] for pkt in batch]), np_uint8).reshape(n, -1)
+        self._submit(n, stats)
+
+    def _send_batch(self, batch: list[tuple], stats: SendStats) -> None:
+        if _sendmmsg is None:
+            for bufs in batch:
+                self._sendmsg(bufs, stats)
+            return
+
+        # Keeps the exported non-bytes buffers alive until sent.
+        refs = []
+        dsts = []
+        for i, bufs in enumerate(batch):
+            if len(bufs) > _MAX_IOV:
+                raise ValueError(f"cannot gather more than {_MAX_IOV} buffers per packet")
+            base = i * _MAX_IOV
+            for j, buf in enumerate(bufs):
+                iov = self._iovs[base + j]
+                if type(buf) is bytes:
+                    iov.iov_base = buf
+                else:
+                    arr = np_frombuffer(buf, np_uint8)
+                    refs.append(arr)
+                    iov.iov_base = arr.ctypes.data
+                iov.iov_len = len(buf)
+            self._msgs[i].msg_hdr.msg_iovlen = len(bufs)
+            if self._per_packet_dst:
+                dsts.append(self._dst_addr(bufs[0]))
+        if dsts:
+            self._dst[:len(batch)] = np_frombuffer(b"".join(dsts), np_uint8).reshape(len(batch), -1)
+        self._submit(len(batch), stats)
+
+    def _submit(self, n: int, stats: SendStats) -> None:
+        """ Send the first `n` prepared messages. """
+        done = 0
+        fd = self._sock.fileno()
+        while done < n:
+            sent = _sendmmsg(fd, addressof(self._msgs) + done * sizeof(_mmsghdr), n - done, 0)
+            if sent < 0:
+                err = get_errno()
+                if err == EINTR:
+                    continue
+                if err in (EAGAIN, EWOULDBLOCK):
+                    select((), (fd,), ())
+                    continue
+                raise OSError(err, strerror(err))
+            stats.calls += 1
+            if sent < n - done:
+                stats.partial += 1
+            done += sent
+        stats.packets += n
+        stats.nbytes += int(self._msglen[:n].sum())
+
+    def _sendmsg(self, bufs: Sequence[bytes | bytearray | memoryview],
+                 stats: SendStats) -> None:
+        address = self._address
+        if self._per_packet_dst:
+            address = (inet_ntop(self._sock.family, self._dst_addr(bufs[0])), 0)
+        left = sum(map(len, bufs))
+        while True:
+            try:
+                if address is None:
+                    sent = self._sock.sendmsg(bufs)
+                else:
+                    sent = self._sock.sendmsg(bufs, (), 0, address)
+            except InterruptedError:
+                continue
+            except BlockingIOError:
+                select((), (self._sock,), ())
+                continue
+            stats.calls += 1
+            stats.nbytes += sent
+            left -= sent
+            if left <= 0:
+                break
+            # Only stream sockets send part of a packet: send the rest.
+            stats.partial += 1
+            bufs = _skip(bufs, sent)
+        stats.packets += 1
+
+    def _dst_addr(self, buf: bytes | bytearray | memoryview) -> bytes:
+        """ Destination address of the IP header at the start of `buf`. """
+        at, size = self._dst_at, self._dst_len
+        if len(buf) < at + size:
+            raise ValueError(f"packet of {len(buf)} bytes has no destination address")
+        return bytes(buf[at:at + size])
+
+
+def _htons(port: int) -> int:
+    """ Port number in network byte order, as a native 16-bit value. """
+    return int.from_bytes(int(port).to_bytes(2, "big"), byteorder)
+
+
+def _skip(bufs: Sequence[bytes | bytearray | memoryview], n: int) -> list[memoryview]:
+    """ What remains of `bufs` once their first `n` bytes are sent. """
+    rest = []
+    for buf in bufs:
+        if n >= len(buf):
+            n -= len(buf)
+        else:
+            rest.append(memoryview(buf)[n:])
+            n = 0
+    return rest
+
+
+def _buffers(pkt: Any) -> tuple:
+    """ Buffers making up one packet. """
+    if isinstance(pkt, (bytes, bytearray, memoryview)):
+        return (pkt,)
+    if isinstance(pkt, (Header, Packet)):
+        return (bytes(pkt),)
+    return tuple(pkt)
+
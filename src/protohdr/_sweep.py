@@ -0,0 +1,275 @@
+#  This file is part of protohdr-python3
+#  Copyright (C) 2022 ecriminal
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+
+from collections import deque
+from dataclasses import dataclass, replace
+from os import urandom
+from select import select
+from socket import IPPROTO_ICMP, MSG_DONTWAIT, inet_ntoa, socket
+from struct import Struct
+from time import monotonic, monotonic_ns
+from typing import Any, Iterable, Iterator
+
+from ._headers import *
+from ._packet import *
+from ._pacer import *
+from ._sender import *
+from ._wheel import *
+
+
+__all__ = (
+    "EchoResult",
+    "EchoSweeper",
+    "SweepStats",
+)
+
+
+_MAX_PACKET = 0x10000
+""" Receive buffer size, enough for any IPv4 packet. """
+
+_TIMESTAMP = Struct(">Q")
+""" Send time in `time.monotonic_ns` nanoseconds, leading the payload. """
+
+
+@dataclass(slots=True)
+class EchoResult:
+    """ Outcome of the echo requests to one host. """
+    addr: str
+    """ Target address. """
+
+    rtt: float | None
+    """ Round-trip time in seconds, None if the host did not answer. """
+
+    attempts: int
+    """ Echo requests sent. """
+
+    ttl: int | None = None
+    """ TTL of the echo reply as received. """
+
+
+@dataclass(slots=True)
+class SweepStats:
+    """ Counters of one `EchoSweeper` run. """
+    sent: int = 0
+    """ Echo requests sent, retries included. """
+
+    replies: int = 0
+    """ Hosts that answered. """
+
+    retries: int = 0
+    """ Echo requests sent again after a timeout. """
+
+    timeouts: int = 0
+    """ Hosts that never answered. """
+
+    unmatched: int = 0
+    """ Echo replies received that answer none of the pending requests,
+        e.g. late duplicates or replies to other processes. """
+
+    elapsed: float = 0.0
+    """ Wall-clock seconds of the sweep. """
+
+    @property
+    def hosts_per_second(self) -> float:
+        """ Hosts finished per second. """
+        done = self.replies + self.timeouts
+        return done / self.elapsed if self.elapsed else 0.0
+
+
+class EchoSweeper:
+    """ ICMP echo (ping) sweep of many hosts from one raw socket.
+
+        Echo requests go out in batches through a `Sender`, paced by
+        `pacer` if given, while at most `max_pending` hosts await a reply.
+        Every request carries its send time (`time.monotonic_ns`) at the
+        start of its payload, so the RTT is taken from the reply itself,
+        also for replies to earlier attempts. Replies are matched through
+        a dict keyed by identifier and sequence number, which number the
+        hosts of a sweep from a random identifier base, and must come
+        from the host the request went to.
+
+        Hosts not answering within `timeout` seconds are asked again up
+        to `retries` times. Timeouts are kept in a `TimerWheel` with
+        `tick` resolution, so a timeout fires up to one tick late.
+
+        `sock` is a raw IPPROTO_ICMP socket with IP_HDRINCL set, or for
+        testing one end of a socketpair() whose other end answers. The
+        IP headers are a copy of `ip` with `dst_addr` filled in per host;
+        by default the kernel fills in the source address and identifier.
+    """
+    __slots__ = (
+        "_sock",
+        "_sender",
+        "_ip",
+        "_icmp",
+        "_padding",
+        "_identifier",
+        "_timeout",
+        "_retries",
+        "_pacer",
+        "_batch_size",
+        "_max_pending",
+        "_tick",
+        "stats",
+    )
+
+    def __init__(self, sock: socket, ip: IPHeader | None = None, *,
+                 timeout: float = 1.0, retries: int = 1, pacer: Pacer | None = None,
+                 batch_size: int = 64, max_pending: int = 0x10000,
+                 data_size: int = 56, tick: float = 0.01) -> None:
+        if timeout <= 0 or retries < 0 or max_pending < 1:
+            raise ValueError("invalid timeout, retries or pending limit")
+        if data_size < _TIMESTAMP.size:
+            raise ValueError(f"echo data of {data_size} bytes cannot hold a timestamp")
+        if ip is None:
+            ip = IPHeader(version=4, header_len=20, tos=0, total_len=0, identifier=0,
+                          flags=0, frag_offset=0, ttl=64, protocol=IPPROTO_ICMP,
+                          checksum=0, src_addr="0.0.0.0", dst_addr="0.0.0.0")
+        self._sock = sock
+        self._sender = Sender(sock, batch_size=batch_size)
+        # Copied, as _request() fills in the destination.
+        self._ip = replace(ip)
+        self._icmp = ICMPHeader(type=ICMPMessage.ECHO, code=0, checksum=0,
+                                identifier=0, seq_num=0)
+        self._padding = bytes(data_size - _TIMESTAMP.size)
+        self._identifier = int.from_bytes(urandom(2), "big")
+        self._timeout = timeout
+        self._retries = retries
+        self._pacer = pacer
+        self._batch_size = batch_size
+        self._max_pending = max_pending
+        self._tick = tick
+        self.stats = SweepStats()
+
+    def _request(self, addr: str, key: int) -> bytes:
+        """ Echo request to `addr` with identifier and sequence number
+            from `key`, stamped with the current time. """
+        ip, icmp = self._ip, self._icmp
+        ip.dst_addr = addr
+        icmp.identifier = key >> 16
+        icmp.seq_num = key & 0xFFFF
+        icmp.data = ICMPPayload.echo(_TIMESTAMP.pack(monotonic_ns()) + self._padding)
+        return bytes(Packet(ip, icmp))
+
+    def sweep(self, targets: Iterable[Any]) -> Iterator[EchoResult]:
+        """ Ping every host of `targets` and yield its result once it
+            answered or ran out of attempts, in that order.
+
+            `targets` are addresses as strings, `IPv4Address` objects or
+            integers, e.g. the hosts of an `IPv4Network`; they are read
+            as requests are sent, never all at once. The counters of the
+            sweep are in `stats`.
+        """
+        stats = self.stats = SweepStats()
+        start = monotonic()
+        pacer = self._pacer
+        wheel = TimerWheel(self._tick, now=start)
+        # Key -> [address, attempts]; the key is the identifier and
+        # sequence number of the requests.
+        pending = {}
+        retry = deque()
+        hosts = enumerate(targets)
+        exhausted = False
+        buf = bytearray(_MAX_PACKET)
+        view = memoryview(buf)
+        fd = self._sock.fileno()
+
+        while True:
+            # Send a batch of retries and new hosts, if the pacer lets us.
+            ready = bool(retry) or not exhausted and len(pending) < self._max_pending
+            delay = pacer.delay() if ready and pacer is not None else 0.0
+            if ready and not delay:
+                batch = []
+                now = monotonic()
+                while retry and len(batch) < self._batch_size:
+                    key = retry.popleft()
+                    probe = pending.get(key)
+                    if probe is None:
+                        # Answered after all.
+                        continue
+                    probe[1] += 1
+                    batch.append(self._request(probe[0], key))
+                    wheel.schedule(now + self._timeout, (key, probe[1]))
+                while (not exhausted and len(batch) < self._batch_size
+                       and len(pending) < self._max_pending):
+                    target = next(hosts, None)
+                    if target is None:
+                        exhausted = True
+                        break
+                    index, addr = target
+                    addr = inet_ntoa(addr.to_bytes(4, "big")) if type(addr) is int else str(addr)
+                    key = ((self._identifier + (index >> 16)) & 0xFFFF) << 16 | index & 0xFFFF
+                    pending[key] = [addr, 1]
+                    batch.append(self._request(addr, key))
+                    wheel.schedule(now + self._timeout, (key, 1))
+                if batch:
+                    if pacer is not None:
+                        pacer.wait(len(batch), sum(map(len, batch)))
+                    self._sender.send(batch)
+                    stats.sent += len(batch)
+                ready = bool(retry) or not exhausted and len(pending) < self._max_pending
+                delay = pacer.delay() if ready and pacer is not None else 0.0
+            if exhausted and not pending:
+                break
+
+            # Take in replies until more may be sent or the next tick.
+            wait = max(0.0, wheel.next_tick() - monotonic())
+            if ready:
+                wait = min(wait, delay)
+            if select((fd,), (), (), wait)[0]:
+                while True:
+                    try:
+                        n = self._sock.recv_into(buf, _MAX_PACKET, MSG_DONTWAIT)
+                    except (BlockingIOError, InterruptedError):
+                        break
+                    result = self._reply(view[:n], pending)
+                    if result is not None:
+                        stats.replies += 1
+                        yield result
+
+            # Ask again or give up on the hosts that timed out.
+            for key, attempt in wheel.expire(monotonic()):
+                probe = pending.get(key)
+                if probe is None or probe[1] != attempt:
+                    continue
+                if attempt <= self._retries:
+                    retry.append(key)
+                    stats.retries += 1
+                    continue
+                del pending[key]
+                stats.timeouts += 1
+                yield EchoResult(probe[0], None, attempt)
+        stats.elapsed = monotonic() - start
+
+    def _reply(self, packet: memoryview, pending: dict[int, list]) -> EchoResult | None:
+        """ Result of the host a received packet answers, if any. """
+        now = monotonic_ns()
+        try:
+            ip, icmp = view_packet(packet)
+            if type(icmp) is not ICMPView or icmp.type != ICMPMessage.ECHO_REPLY:
+                return None
+            key = icmp.identifier << 16 | icmp.seq_num
+            probe = pending.get(key)
+            if probe is None or ip.src_addr != probe[0] or len(icmp.data) < _TIMESTAMP.size:
+                self.stats.unmatched += 1
+                return None
+            sent, = _TIMESTAMP.unpack_from(icmp.data)
+        except ValueError:
+            return None
+        del pending[key]
+        return EchoResult(probe[0], (now - sent) / 1e9, probe[1], ip.ttl)
@@ -0,0 +1,178 @@
+#  This file is part of protohdr-python3
+#  Copyright (C) 2022 ecriminal
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+
+from dataclasses import replace
+from socket import IPPROTO_UDP
+from typing import Any, Iterable, Iterator
+
+from ._header import *
+from ._headers import *
+from ._inet import *
+
+
+__all__ = (
+    "PacketTemplate",
+)
+
+
+_PROTOCOL_FIELDS = frozenset(("protocol", "next_header"))
+""" IP fields naming the transport protocol. They are part of the
+    pseudo-header and decide how the transport header is read, so they
+    cannot be patched. """
+
+
+def _cover(spans: list[tuple[int, int]]) -> tuple[int, int]:
+    """ Smallest range covering all `spans`. """
+    if not spans:
+        return 0, 0
+    return min(a for a, _ in spans), max(b for _, b in spans)
+
+
+class PacketTemplate:
+    """ IP packet built once and patched in place for every send.
+
+        The IP and transport headers are serialized once with both
+        checksums computed, the transport one over the pseudo-header for
+        TCP and UDP. Every packet then only packs the fields named in
+        `ip_fields` and `transport_fields`, in that order, and adjusts
+        both checksums incrementally (RFC 1624). The output is identical
+        to zeroing the checksums, assigning the same field values and
+        computing the checksums on the headers by hand.
+
+        Only byte-aligned fields (see `Header._field_offsets`) can be
+        patched. Changing `src_addr` or `dst_addr` also updates the TCP or
+        UDP checksum. The IPv4 `protocol` and IPv6 `next_header` fields
+        cannot be patched, as the transport header depends on them.
+
+        With an `IPv6Header` there is no IP checksum to adjust, and ICMP
+        is ICMPv6, whose checksum covers the pseudo-header like TCP and
+        UDP. The header is used as given: fill in its payload length and
+        next header chain through `Packet.fill_in()` first.
+    """
+    __slots__ = (
+        "_base",
+        "_scratch",
+        "_patches",
+        "_ip_sum",
+        "_ip_spans",
+        "_ip_csum",
+        "_tp_sum",
+        "_tp_spans",
+        "_tp_csum",
+        "_udp",
+    )
+
+    def __init__(self, ip: IPHeader | IPv6Header, transport: TCPHeader | UDPHeader | ICMPHeader,
+                 ip_fields: Iterable[str] = (), transport_fields: Iterable[str] = ()) -> None:
+        if not isinstance(transport, (TCPHeader, UDPHeader, ICMPHeader)):
+            raise TypeError(f"unsupported transport header {type(transport).__name__}")
+        v6 = isinstance(ip, IPv6Header)
+        ip = replace(ip) if v6 else replace(ip, checksum=0)
+        transport = replace(transport, checksum=0)
+        pseudo = v6 or not isinstance(transport, ICMPHeader)
+        if pseudo:
+            transport.checksum = inet_transport_checksum(bytes(transport), ip)
+        else:
+            transport.checksum = inet_checksum(bytes(transport))
+        if not v6:
+            ip.checksum = inet_checksum(bytes(ip))
+
+        ip_bytes = bytes(ip)
+        self._base = ip_bytes + bytes(transport)
+        self._scratch = bytearray(len(self._base))
+        self._udp = isinstance(transport, UDPHeader)
+
+        self._patches = []
+        ip_spans = []
+        tp_spans = []
+        for hdr, names, start in ((ip, ip_fields, 0), (transport, transport_fields, len(ip_bytes))):
+            hdr_spans = []
+            for name in names:
+                if (name == "checksum" or name not in hdr._field_offsets
+                        or hdr is ip and name in _PROTOCOL_FIELDS):
+                    raise ValueError(f"{type(hdr).__name__}.{name} cannot be patched")
+                at, layout, convert = hdr._field_offsets[name]
+                at += start
+                self._patches.append((at, layout.pack_into, convert))
+                # The 16-bit aligned words holding the field, as summed
+                # by the checksum(s) covering it.
+                span = (at & ~1, (at + layout.size + 1) & ~1)
+                hdr_spans.append(span)
+                if hdr is ip and pseudo and name in ("src_addr", "dst_addr"):
+                    tp_spans.append(span)
+            if hdr is ip:
+                if not v6:
+                    ip_spans.append(hdr_spans)
+            else:
+                tp_spans = [tp_spans, hdr_spans]
+
+        self._ip_csum = None
+        self._ip_sum = 0
+        if not v6:
+            at, layout, _ = IPHeader._field_offsets["checksum"]
+            self._ip_csum = at, layout.pack_into
+            self._ip_sum = ~ip.checksum & 0xFFFF
+        at, layout, _ = transport._field_offsets["checksum"]
+        self._tp_csum = len(ip_bytes) + at, layout.pack_into
+        self._tp_sum = ~transport.checksum & 0xFFFF
+        # Each group of spans is read back as one range per packet; the
+        # unpatched words in between (checksum included) cancel out.
+        self._ip_spans = [(a, b, int.from_bytes(self._base[a:b], "big"))
+                          for a, b in map(_cover, ip_spans) if a < b]
+        self._tp_spans = [(a, b, int.from_bytes(self._base[a:b], "big"))
+                          for a, b in map(_cover, tp_spans) if a < b]
+
+    def __len__(self) -> int:
+        return len(self._base)
+
+    def pack_into(self, buffer: bytearray | memoryview, offset: int, *values: Any) -> int:
+        """ Write the packet with the given field values into `buffer`. """
+        size = len(self._base)
+        check_room(buffer, offset, size)
+        buffer[offset:offset + size] = self._base
+        for (at, pack_into, convert), value in zip(self._patches, values, strict=True):
+            pack_into(buffer, offset + at, value if convert is None else convert(value))
+
+        # Patched words only change the sums by (new - old) modulo 0xFFFF.
+        # Packets are never all zeros, so a zero residue folds to 0xFFFF.
+        tp_sum = self._tp_sum
+        for a, b, old in self._tp_spans:
+            tp_sum += int.from_bytes(buffer[offset + a:offset + b], "big") - old
+        if self._ip_csum is not None:
+            ip_sum = self._ip_sum
+            for a, b, old in self._ip_spans:
+                ip_sum += int.from_bytes(buffer[offset + a:offset + b], "big") - old
+            at, pack_into = self._ip_csum
+            pack_into(buffer, offset + at, 0xFFFF - (ip_sum % 0xFFFF or 0xFFFF))
+
+        checksum = 0xFFFF - (tp_sum % 0xFFFF or 0xFFFF)
+        if not checksum and self._udp:
+            checksum = 0xFFFF
+        at, pack_into = self._tp_csum
+        pack_into(buffer, offset + at, checksum)
+        return size
+
+    def build(self, *values: Any) -> bytes:
+        """ Build one packet from the given field values. """
+        self.pack_into(self._scratch, 0, *values)
+        return bytes(self._scratch)
+
+    def packets(self, rows: Iterable[Iterable[Any]]) -> Iterator[bytes]:
+        """ Build one packet per row of field values. """
+        for values in rows:
+            yield self.build(*values)
@@ -0,0 +1,459 @@
+#  This file is part of protohdr-python3
+#  Copyright (C) 2022 ecriminal
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+
+from collections import deque
+from dataclasses import dataclass, field, replace
+from os import urandom
+from select import select
+from socket import (
+    AF_INET, IPPROTO_ICMP, IPPROTO_TCP, IPPROTO_UDP, MSG_DONTWAIT, SOCK_DGRAM, inet_ntoa, socket,
+)
+from struct import Struct
+from time import monotonic, monotonic_ns
+from typing import Any, Iterable, Iterator, Sequence
+
+from ._headers import *
+from ._packet import *
+from ._pacer import *
+from ._sender import *
+from ._template import *
+from ._wheel import *
+
+
+__all__ = (
+    "Route",
+    "TraceHop",
+    "TraceStats",
+    "Tracer",
+)
+
+
+_MAX_PACKET = 0x10000
+""" Receive buffer size, enough for any IPv4 packet. """
+
+_PORTS = Struct("!HH")
+_TCP_SEQ = Struct("!HHI")
+_ICMP_ECHO = Struct("!BBHHH")
+
+_DEFAULT_PORTS = {
+    IPPROTO_UDP:    33434,
+    IPPROTO_TCP:    80,
+    IPPROTO_ICMP:   0,
+}
+""" Destination (base) port per probe protocol, as traceroute(8). """
+
+
+@dataclass(slots=True)
+class TraceHop:
+    """ Answer to the probe with one TTL towards one destination. """
+    dst: str
+    """ Destination traced. """
+
+    ttl: int
+    """ TTL of the probe. """
+
+    addr: str | None
+    """ Address that answered, None if none did in time. """
+
+    rtt: float | None
+    """ Round-trip time in seconds since the last attempt was sent. """
+
+    reached: bool = False
+    """ Whether the destination itself answered. """
+
+    icmp_type: int | None = None
+    """ Type of the ICMP answer, None for TCP answers and timeouts. """
+
+    icmp_code: int | None = None
+    """ Code of the ICMP answer. """
+
+
+@dataclass(slots=True)
+class Route:
+    """ Hop table of one destination, filled in as answers arrive. """
+    dst: str
+    """ Destination traced. """
+
+    hops: dict[int, TraceHop] = field(default_factory=dict)
+    """ Answers by TTL, none beyond `reached`. """
+
+    reached: int | None = None
+    """ Lowest TTL at which the destination answered. """
+
+    @property
+    def path(self) -> list[str | None]:
+        """ Answering addresses from TTL 1 on, None where no one did. """
+        last = self.reached or max(self.hops, default=0)
+        return [hop.addr if (hop := self.hops.get(ttl)) is not None else None
+                for ttl in range(1, last + 1)]
+
+
+@dataclass(slots=True)
+class TraceStats:
+    """ Counters of one `Tracer` run. """
+    sent: int = 0
+    """ Probes sent, retries included. """
+
+    replies: int = 0
+    """ Probes answered. """
+
+    retries: int = 0
+    """ Probes sent again after a timeout. """
+
+    timeouts: int = 0
+    """ Probes never answered. """
+
+    unmatched: int = 0
+    """ ICMP errors, TCP segments and echo replies received that answer
+        none of the pending probes, e.g. late duplicates. """
+
+    elapsed: float = 0.0
+    """ Wall-clock seconds of the run. """
+
+
+class Tracer:
+    """ Traceroute of many destinations at once.
+
+        Every destination gets one probe per TTL from `first_ttl` to
+        `max_ttl`, all sent up front in batches through a `Sender`,
+        paced by `pacer` if given, while at most `max_pending` probes
+        await an answer. Probes are UDP datagrams to `port` plus the TTL
+        (as traceroute(8)), TCP SYNs to `port` or ICMP echo requests,
+        after `protocol`.
+
+        Routers answer with TIME_EXCEEDED and the destination with a
+        DESTINATION_UNREACHABLE (UDP), a SYN-ACK or RST (TCP) or an
+        ECHO_REPLY (ICMP). ICMP errors quote the probe's IP header and
+        the first 8 bytes of its transport header, which hold the ports
+        and the TCP sequence number or ICMP identifier and sequence
+        number; the TTL is encoded there (and in the TCP or echo
+        sequence number answered by the destination) together with a
+        random per-tracer cookie, so answers are matched to probes
+        through a dict keyed by destination and TTL. TCP and ICMP probes
+        to one destination keep the same ports or identifier, i.e. the
+        same flow through load balancers.
+
+        Unanswered probes are sent again up to `retries` times after
+        `timeout` seconds, tracked in a `TimerWheel` with `tick`
+        resolution. Per destination, probes beyond the lowest TTL the
+        destination answered at are dropped.
+
+        `sock` sends the probes: a raw socket with IP_HDRINCL set, which
+        also receives the ICMP answers if it is an IPPROTO_ICMP one.
+        Answers are read from `listen` as well, e.g. a raw IPPROTO_TCP
+        socket for the TCP answers of the destinations. For testing,
+        `sock` can be one end of a socketpair() whose other end answers.
+        Many routers rate-limit ICMP errors, so pace large runs.
+
+        The IP headers are `ip` with TTL and destination filled in. TCP
+        and UDP checksums cover the source address, so unless `ip` has
+        one, it is looked up in the routing table per destination.
+    """
+    __slots__ = (
+        "_sock",
+        "_listen",
+        "_sender",
+        "_template",
+        "_protocol",
+        "_port",
+        "_src_port",
+        "_src_addr",
+        "_identifier",
+        "_cookie",
+        "_ttls",
+        "_timeout",
+        "_retries",
+        "_pacer",
+        "_batch_size",
+        "_max_pending",
+        "_tick",
+        "routes",
+        "stats",
+    )
+
+    def __init__(self, sock: socket, protocol: int = IPPROTO_UDP, *,
+                 listen: Sequence[socket] = (), ip: IPHeader | None = None,
+                 port: int | None = None, first_ttl: int = 1, max_ttl: int = 30,
+                 timeout: float = 2.0, retries: int = 0, pacer: Pacer | None = None,
+                 batch_size: int = 64, max_pending: int = 0x10000,
+                 tick: float = 0.01) -> None:
+        if protocol not in _DEFAULT_PORTS:
+            raise ValueError(f"unsupported probe protocol {protocol}")
+        if not 1 <= first_ttl <= max_ttl <= 0xFF:
+            raise ValueError(f"invalid TTL range {first_ttl}..{max_ttl}")
+        if timeout <= 0 or retries < 0 or max_pending < max_ttl - first_ttl + 1:
+            raise ValueError("invalid timeout, retries or pending limit")
+        if port is None:
+            port = _DEFAULT_PORTS[protocol]
+        if protocol == IPPROTO_UDP and port + max_ttl > 0xFFFF:
+            raise ValueError(f"UDP port {port} too high for TTL {max_ttl}")
+        if ip is None:
+            ip = IPHeader(version=4, header_len=20, tos=0, total_len=0, identifier=0,
+                          flags=0, frag_offset=0, ttl=0, protocol=protocol,
+                          checksum=0, src_addr="0.0.0.0", dst_addr="0.0.0.0")
+        rand = int.from_bytes(urandom(8), "big")
+        self._sock = sock
+        self._listen = (sock, *listen)
+        self._sender = Sender(sock, batch_size=batch_size)
+        self._protocol = protocol
+        self._port = port
+        self._src_port = 32768 + (rand & 0x3FFF)
+        self._src_addr = ip.src_addr
+        self._identifier = (rand >> 16) & 0xFFFF
+        self._cookie = rand >> 32
+        self._ttls = range(first_ttl, max_ttl + 1)
+        self._timeout = timeout
+        self._retries = retries
+        self._pacer = pacer
+        self._batch_size = batch_size
+        self._max_pending = max_pending
+        self._tick = tick
+        self._template = self._make_template(ip)
+        self.routes = {}
+        self.stats = TraceStats()
+
+    def _make_template(self, ip: IPHeader) -> PacketTemplate:
+        """ Template patching the destination, TTL and the transport
+            field encoding the TTL. """
+        ip = replace(ip, protocol=self._protocol)
+        if self._protocol == IPPROTO_UDP:
+            transport = UDPHeader(src_port=self._src_port, dst_port=self._port,
+                                  header_len=0, checksum=0, data=b"")
+            field_name = "dst_port"
+        elif self._protocol == IPPROTO_TCP:
+            transport = TCPHeader(src_port=self._src_port, dst_port=self._port, seq_num=0,
+                                  ack_num=0, data_offset=0, flags=TCPFlag.SYN,
+                                  window=0xFFFF, checksum=0, urg_ptr=0)
+            field_name = "seq_num"
+        else:
+            transport = ICMPHeader(type=ICMPMessage.ECHO, code=0, checksum=0,
+                                   identifier=self._identifier, seq_num=0)
+            field_name = "seq_num"
+        Packet(ip, transport).fill_in()
+        return PacketTemplate(ip, transport, ("ttl", "src_addr", "dst_addr"), (field_name,))
+
+    def _source(self, dst: str) -> str:
+        """ Source address of the probes to `dst`. """
+        if self._src_addr != "0.0.0.0" or self._protocol == IPPROTO_ICMP:
+            return self._src_addr
+        # Connecting a UDP socket only picks the route, nothing is sent.
+        with socket(AF_INET, SOCK_DGRAM) as sock:
+            try:
+                sock.connect((dst, self._port or 9))
+            except OSError:
+                return self._src_addr
+            return sock.getsockname()[0]
+
+    def _encode(self, ttl: int) -> int:
+        """ Transport field value of the probe with `ttl`. """
+        if self._protocol == IPPROTO_UDP:
+            return self._port + ttl
+        if self._protocol == IPPROTO_TCP:
+            return (self._cookie & 0xFFFFFF) << 8 | ttl
+        return (self._cookie & 0xFF) << 8 | ttl
+
+    def trace(self, targets: Iterable[Any]) -> Iterator[TraceHop]:
+        """ Trace the route to every destination of `targets`. Yields
+            every answer as it arrives and every probe that stays
+            unanswered (with `addr` None) once it ran out of attempts.
+
+            `targets` are addresses as strings, `IPv4Address` objects or
+            integers; duplicates are traced once. The hop table of every
+            destination is kept up to date in `routes` along the way,
+            the counters of the run in `stats`. An answer yielded for a
+            TTL beyond where the destination turns out to answer (when
+            answers arrive out of order) is dropped from `routes`.
+        """
+        self.routes = routes = {}
+        stats = self.stats = TraceStats()
+        start = monotonic()
+        pacer = self._pacer
+        wheel = TimerWheel(self._tick, now=start)
+        # (destination, TTL) -> [send time in ns, attempts]
+        pending = {}
+        retry = deque()
+        # Probes of the current destinations not sent yet.
+        queue = deque()
+        sources = {}
+        dsts = iter(targets)
+        exhausted = False
+        fds = [s.fileno() for s in self._listen]
+        buf = bytearray(_MAX_PACKET)
+        view = memoryview(buf)
+        ttls = self._ttls
+
+        while True:
+            # Admit destinations while their probes fit.
+            while not exhausted and not queue and len(pending) + len(ttls) <= self._max_pending:
+                dst = next(dsts, None)
+                if dst is None:
+                    exhausted = True
+                    break
+                dst = inet_ntoa(dst.to_bytes(4, "big")) if type(dst) is int else str(dst)
+                if dst in routes:
+                    continue
+                routes[dst] = Route(dst)
+                sources[dst] = self._source(dst)
+                queue.extend((dst, ttl) for ttl in ttls)
+
+            # Send a batch of retries and new probes, if the pacer lets us.
+            ready = bool(retry or queue)
+            delay = pacer.delay() if ready and pacer is not None else 0.0
+            if ready and not delay:
+                batch = []
+                now = monotonic()
+                while (retry or queue) and len(batch) < self._batch_size:
+                    if retry:
+                        key = retry.popleft()
+                        probe = pending.get(key)
+                        if probe is None:
+                            # Answered after all.
+                            continue
+                    else:
+                        key = queue.popleft()
+                        probe = pending[key] = [0, 0]
+                    dst, ttl = key
+                    probe[0] = monotonic_ns()
+                    probe[1] += 1
+                    batch.append(self._template.build(ttl, sources[dst], dst, self._encode(ttl)))
+                    wheel.schedule(now + self._timeout, (key, probe[1]))
+                if batch:
+                    if pacer is not None:
+                        pacer.wait(len(batch), sum(map(len, batch)))
+                    self._sender.send(batch)
+                    stats.sent += len(batch)
+                ready = bool(retry or queue)
+                delay = pacer.delay() if ready and pacer is not None else 0.0
+            if exhausted and not pending and not queue:
+                break
+
+            # Take in answers until more may be sent or the next tick.
+            wait = max(0.0, wheel.next_tick() - monotonic())
+            if ready:
+                wait = min(wait, delay)
+            for fd in select(fds, (), (), wait)[0]:
+                sock = self._listen[fds.index(fd)]
+                while True:
+                    try:
+                        n = sock.recv_into(buf, _MAX_PACKET, MSG_DONTWAIT)
+                    except (BlockingIOError, InterruptedError):
+                        break
+                    hop = self._answer(view[:n], pending)
+                    if hop is not None and self._record(routes[hop.dst], hop):
+                        stats.replies += 1
+                        yield hop
+
+            # Ask again or give up on the probes that timed out.
+            for key, attempt in wheel.expire(monotonic()):
+                probe = pending.get(key)
+                if probe is None or probe[1] != attempt:
+                    continue
+                dst, ttl = key
+                route = routes[dst]
+                if route.reached is not None and ttl > route.reached:
+                    del pending[key]
+                    continue
+                if attempt <= self._retries:
+                    retry.append(key)
+                    stats.retries += 1
+                    continue
+                del pending[key]
+                stats.timeouts += 1
+                hop = TraceHop(dst, ttl, None, None)
+                route.hops[ttl] = hop
+                yield hop
+        stats.elapsed = monotonic() - start
+
+    def _record(self, route: Route, hop: TraceHop) -> bool:
+        """ Enter `hop` into `route`. Returns False if it lies beyond the
+            destination. """
+        if route.reached is not None and hop.ttl > route.reached:
+            return False
+        if hop.reached:
+            route.reached = hop.ttl
+            for ttl in [ttl for ttl in route.hops if ttl > hop.ttl]:
+                del route.hops[ttl]
+        route.hops[hop.ttl] = hop
+        return True
+
+    def _answer(self, packet: memoryview, pending: dict[tuple[str, int], list]) -> TraceHop | None:
+        """ Hop a received packet answers, if any. """
+        now = monotonic_ns()
+        try:
+            ip, transport = view_packet(packet)
+            icmp_type = icmp_code = None
+            if type(transport) is ICMPView:
+                icmp_type, icmp_code = transport.type, transport.code
+                if icmp_type in (ICMPMessage.TIME_EXCEEDED, ICMPMessage.DESTINATION_UNREACHABLE):
+                    key = self._quoted(transport.data)
+                    reached = (key is not None and icmp_type == ICMPMessage.DESTINATION_UNREACHABLE
+                               and ip.src_addr == key[0])
+                elif icmp_type == ICMPMessage.ECHO_REPLY and self._protocol == IPPROTO_ICMP:
+                    key = None
+                    seq_num = transport.seq_num
+                    if (transport.identifier == self._identifier
+                            and seq_num >> 8 == self._cookie & 0xFF):
+                        key = ip.src_addr, seq_num & 0xFF
+                    reached = True
+                else:
+                    # E.g. our own echo requests on loopback.
+                    return None
+            elif (type(transport) is TCPView and self._protocol == IPPROTO_TCP
+                    and transport.src_port == self._port and transport.dst_port == self._src_port):
+                seq_num = (transport.ack_num - 1) & 0xFFFFFFFF
+                key = None
+                if seq_num >> 8 == self._cookie & 0xFFFFFF:
+                    key = ip.src_addr, seq_num & 0xFF
+                reached = True
+            else:
+                return None
+        except ValueError:
+            return None
+        probe = pending.pop(key, None) if key is not None else None
+        if probe is None:
+            self.stats.unmatched += 1
+            return None
+        return TraceHop(key[0], key[1], ip.src_addr, (now - probe[0]) / 1e9,
+                        reached, icmp_type, icmp_code)
+
+    def _quoted(self, data: memoryview) -> tuple[str, int] | None:
+        """ Destination and TTL of our probe quoted in an ICMP error. """
+        if len(data) < 20 or data[0] >> 4 != IPVersion.IPV4 or data[9] != self._protocol:
+            return None
+        start = (data[0] & 0xF) * 4
+        if start < 20 or len(data) < start + 8:
+            return None
+        dst = inet_ntoa(bytes(data[16:20]))
+        if self._protocol == IPPROTO_UDP:
+            src_port, dst_port = _PORTS.unpack_from(data, start)
+            ttl = dst_port - self._port
+            if src_port != self._src_port:
+                return None
+        elif self._protocol == IPPROTO_TCP:
+            src_port, dst_port, seq_num = _TCP_SEQ.unpack_from(data, start)
+            ttl = seq_num & 0xFF
+            if ((src_port, dst_port) != (self._src_port, self._port)
+                    or seq_num >> 8 != self._cookie & 0xFFFFFF):
+                return None
+        else:
+            icmp_type, _, _, identifier, seq_num = _ICMP_ECHO.unpack_from(data, start)
+            ttl = seq_num & 0xFF
+            if (icmp_type != ICMPMessage.ECHO or identifier != self._identifier
+                    or seq_num >> 8 != self._cookie & 0xFF):
+                return None
+        return dst, ttl
@@ -0,0 +1,107 @@
+#  This file is part of protohdr-python3
+#  Copyright (C) 2022 ecriminal
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+
+from math import ceil
+from time import monotonic
+from typing import Any
+
+
+__all__ = (
+    "TimerWheel",
+)
+
+
+class TimerWheel:
+    """ Hashed timing wheel for large numbers of timeouts.
+
+        Deadlines are rounded up to multiples of `tick` seconds and kept
+        in one of `size` slots by tick number, so scheduling is O(1) and
+        expire() only visits the slots of the ticks that passed, however
+        many timers are pending. Deadlines more than `size` ticks ahead
+        share slots with nearer ones and are skipped until due.
+
+        Timers cannot be cancelled: the scheduled items should carry
+        enough state (e.g. an attempt number) for the caller to tell
+        stale ones apart when they expire. Times are on the
+        `time.monotonic` clock.
+    """
+    __slots__ = (
+        "_tick",
+        "_slots",
+        "_current",
+        "_count",
+    )
+
+    def __init__(self, tick: float = 0.01, size: int = 1024,
+                 now: float | None = None) -> None:
+        if tick <= 0 or size < 1:
+            raise ValueError("invalid timer wheel tick or size")
+        if now is None:
+            now = monotonic()
+        self._tick = tick
+        self._slots = [[] for _ in range(size)]
+        self._current = int(now / tick)
+        self._count = 0
+
+    def __len__(self) -> int:
+        """ Number of pending timers. """
+        return self._count
+
+    @property
+    def tick(self) -> float:
+        """ Resolution in seconds. """
+        return self._tick
+
+    def schedule(self, deadline: float, item: Any) -> None:
+        """ Have expire() return `item` once `deadline` has passed. """
+        # Timers due in a tick already visited fire on the next one.
+        at = max(ceil(deadline / self._tick), self._current + 1)
+        self._slots[at % len(self._slots)].append((at, item))
+        self._count += 1
+
+    def expire(self, now: float | None = None) -> list[Any]:
+        """ Remove and return the items whose deadline passed by `now`. """
+        if now is None:
+            now = monotonic()
+        target = int(now / self._tick)
+        if target <= self._current:
+            return []
+        slots = self._slots
+        # Every slot is visited at most once, however long ago the
+        # last call was.
+        first = max(self._current + 1, target - len(slots) + 1)
+        self._current = target
+        due = []
+        for i in range(first, target + 1):
+            slot = slots[i % len(slots)]
+            if not slot:
+                continue
+            keep = []
+            for entry in slot:
+                if entry[0] <= target:
+                    due.append(entry[1])
+                else:
+                    keep.append(entry)
+            slots[i % len(slots)] = keep
+        self._count -= len(due)
+        return due
+
+    def next_tick(self) -> float:
+        """ Time at which the next tick ends and expire() may return
+            more items. """
+        return (self._current + 1) * self._tick
@@ -0,0 +1,205 @@
+from protohdr import *
+
+from asyncio import Event, get_running_loop, run, sleep, wait_for
+from socket import AF_UNIX, IPPROTO_ICMP, IPPROTO_UDP, SOCK_DGRAM, socketpair
+
+import pytest
+
+
+def udp_packet(identifier: int) -> Packet:
+    ip = IPHeader(version=4, header_len=20, tos=0, total_len=0, identifier=identifier,
+                  flags=IPFlag.DONT_FRAG, frag_offset=0, ttl=64, protocol=IPPROTO_UDP,
+                  checksum=0, src_addr="10.0.0.1", dst_addr="10.0.0.2")
+    return ip / UDPHeader(src_port=1024, dst_port=53, header_len=0, checksum=0, data=b"query")
+
+
+class Recorder(RawProtocol):
+
+    def __init__(self) -> None:
+        self.events = []
+        self.packets = []
+        self.errors = []
+        self.lost = Event()
+
+    def connection_made(self, transport) -> None:
+        self.events.append("made")
+
+    def packet_received(self, ip, transport, addr) -> None:
+        self.packets.append((ip, transport))
+
+    def error_received(self, exc) -> None:
+        self.errors.append(exc)
+
+    def pause_writing(self) -> None:
+        self.events.append("pause")
+
+    def resume_writing(self) -> None:
+        self.events.append("resume")
+
+    def connection_lost(self, exc) -> None:
+        self.events.append("lost")
+        self.lost.set()
+
+
+async def until(condition, timeout: float = 5.0) -> None:
+    async def poll():
+        while not condition():
+            await sleep(0.001)
+    await wait_for(poll(), timeout)
+
+
+def test_receive_decoded():
+    async def main():
+        sock, peer = socketpair(AF_UNIX, SOCK_DGRAM)
+        transport, protocol = await create_raw_connection(Recorder, sock=sock)
+        with peer:
+            packets = [udp_packet(i) for i in range(10)]
+            for pkt in packets:
+                peer.send(bytes(pkt))
+            peer.send(b"\x45garbage")
+            await until(lambda: len(protocol.packets) == 10 and protocol.errors)
+            transport.close()
+            await protocol.lost.wait()
+        return packets, protocol
+
+    packets, protocol = run(main())
+    for (ip, udp), pkt in zip(protocol.packets, packets):
+        assert ip == pkt.ip
+        assert (udp.dst_port, udp.header_len, udp.checksum, bytes(udp.data)) == (
+            53, pkt.transport.header_len, pkt.transport.checksum, b"query")
+    # Network order fields decode as sent.
+    assert [ip.identifier for ip, _ in protocol.packets] == list(range(10))
+    assert all(ip.flags == IPFlag.DONT_FRAG for ip, _ in protocol.packets)
+    assert len(protocol.errors) == 1 and isinstance(protocol.errors[0], ValueError)
+    assert protocol.events == ["made", "lost"]
+
+
+def test_send():
+    async def main():
+        sock, peer = socketpair(AF_UNIX, SOCK_DGRAM)
+        transport, protocol = await create_raw_connection(Recorder, sock=sock)
+        with peer:
+            pkt = udp_packet(7)
+            transport.sendto(pkt)
+            transport.sendto(pkt.ip)
+            transport.sendto(memoryview(b"raw"))
+            received = [peer.recv(100) for _ in range(3)]
+            transport.close()
+            with pytest.raises(RuntimeError):
+                transport.sendto(b"late")
+            await protocol.lost.wait()
+        return pkt, received
+
+    pkt, received = run(main())
+    assert received == [bytes(pkt), bytes(pkt.ip), b"raw"]
+
+
+def test_flow_control():
+    async def main():
+        sock, peer = socketpair(AF_UNIX, SOCK_DGRAM)
+        transport, protocol = await create_raw_connection(Recorder, sock=sock)
+        with peer:
+            await sleep(0)
+            transport.set_write_buffer_limits(high=4096)
+            assert transport.get_write_buffer_limits() == (1024, 4096)
+            with pytest.raises(ValueError):
+                transport.set_write_buffer_limits(high=1, low=2)
+            sent = 0
+            while "pause" not in protocol.events:
+                transport.sendto(bytes(1000))
+                sent += 1
+            assert transport.get_write_buffer_size() > 4096
+            peer.setblocking(False)
+            received = 0
+            while received < sent:
+                try:
+                    peer.recv(2000)
+                    received += 1
+                except BlockingIOError:
+                    await sleep(0.001)
+            await until(lambda: transport.get_write_buffer_size() == 0)
+            transport.close()
+            await protocol.lost.wait()
+        return protocol
+
+    protocol = run(main())
+    assert protocol.events == ["made", "pause", "resume", "lost"]
+
+
+def test_close_before_reading():
+    async def main():
+        loop = get_running_loop()
+        sock, peer = socketpair(AF_UNIX, SOCK_DGRAM)
+        fileno = sock.fileno()
+        transport, protocol = await create_raw_connection(Recorder, sock=sock)
+        # Closed before the loop ran the callbacks registering the reader.
+        transport.close()
+        await protocol.lost.wait()
+        await sleep(0)
+        peer.close()
+        return loop.remove_reader(fileno), protocol
+
+    registered, protocol = run(main())
+    assert not registered
+    assert protocol.events == ["made", "lost"]
+
+
+def test_abort_drops_buffer():
+    async def main():
+        sock, peer = socketpair(AF_UNIX, SOCK_DGRAM)
+        transport, protocol = await create_raw_connection(Recorder, sock=sock)
+        with peer:
+            while not transport.get_write_buffer_size():
+                transport.sendto(bytes(1000))
+            transport.abort()
+            assert transport.get_write_buffer_size() == 0 and transport.is_closing()
+            await protocol.lost.wait()
+        return protocol
+
+    assert run(main()).events[-1] == "lost"
+
+
+def echo(data: bytes) -> ICMPHeader:
+    icmp = ICMPHeader(type=ICMPMessage.ECHO, code=0, checksum=0, identifier=0x5151,
+                      seq_num=1, data=data)
+    # Filled in by Packet only, which needs an IP header.
+    icmp.checksum = inet_checksum(bytes(icmp))
+    return icmp
+
+
+@pytest.mark.parametrize("hdrincl", [True, False])
+def test_raw_socket_destination(hdrincl):
+    # Bytes 16-20 of the echo request spell an address.
+    data = b"A" * 8 + bytes((127, 0, 0, 2))
+
+    async def main():
+        try:
+            transport, protocol = await create_raw_connection(Recorder, IPPROTO_ICMP,
+                                                              hdrincl=hdrincl)
+        except PermissionError:
+            pytest.skip("raw sockets need privileges")
+        if hdrincl:
+            ip = IPHeader(version=4, header_len=20, tos=0, total_len=0, identifier=0, flags=0,
+                          frag_offset=0, ttl=64, protocol=IPPROTO_ICMP, checksum=0,
+                          src_addr="127.0.0.1", dst_addr="127.0.0.1")
+            # The destination is taken from the IP header.
+            transport.sendto(ip / echo(data))
+        else:
+            # Without IP_HDRINCL there is none in the packet.
+            transport.sendto(echo(data))
+            await until(lambda: protocol.errors)
+            transport.sendto(echo(data), ("127.0.0.1", 0))
+        await until(lambda: any(icmp.type == ICMPMessage.ECHO_REPLY
+                                for _, icmp in protocol.packets))
+        transport.close()
+        await protocol.lost.wait()
+        return protocol
+
+    protocol = run(main())
+    replies = [ip for ip, icmp in protocol.packets if icmp.type == ICMPMessage.ECHO_REPLY]
+    assert replies[0].src_addr == "127.0.0.1"
+    assert all(ip.dst_addr == "127.0.0.1" for ip, _ in protocol.packets)
+    if hdrincl:
+        assert protocol.errors == []
+    else:
+        assert len(protocol.errors) == 1 and isinstance(protocol.errors[0], OSError)
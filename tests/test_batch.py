@@ -0,0 +1,96 @@
+from protohdr import *
+
+from dataclasses import replace
+from socket import IPPROTO_ICMP, IPPROTO_TCP, IPPROTO_UDP
+
+import numpy as np
+import pytest
+
+
+def ip_header(protocol: int) -> IPHeader:
+    return IPHeader(version=4, header_len=20, tos=0, total_len=0, identifier=0x1234,
+                    flags=IPFlag.DONT_FRAG, frag_offset=0, ttl=64, protocol=protocol,
+                    checksum=0, src_addr="10.0.0.1", dst_addr="10.0.0.2")
+
+
+TRANSPORTS = {
+    IPPROTO_TCP: (TCPHeaderBatch, TCPHeader(src_port=1000, dst_port=80, seq_num=1, ack_num=0,
+                                            data_offset=32, flags=TCPFlag.SYN, window=1024,
+                                            checksum=0, urg_ptr=0, options=TCPOption.mss(1460))),
+    IPPROTO_UDP: (UDPHeaderBatch, UDPHeader(src_port=1000, dst_port=53, header_len=0,
+                                            checksum=0, data=b"odd")),
+    IPPROTO_ICMP: (ICMPHeaderBatch, ICMPHeader(type=ICMPMessage.ECHO, code=0, checksum=0,
+                                               identifier=7, seq_num=0, data=b"ping")),
+}
+
+
+def test_rows_match_header_bytes():
+    ip = ip_header(IPPROTO_TCP)
+    batch = IPHeaderBatch.from_header(ip, 3)
+    assert len(batch) == 3 and batch.row_size == 20
+    assert bytes(batch) == bytes(ip) * 3
+    assert batch[1] == ip
+    assert batch["identifier"].tolist() == [0x1234] * 3
+    assert batch["flags"].tolist() == [IPFlag.DONT_FRAG] * 3
+    assert batch["header_len"].tolist() == [20] * 3
+
+
+def test_assign_columns():
+    ip = ip_header(IPPROTO_TCP)
+    batch = IPHeaderBatch.from_header(ip, 4)
+    batch["identifier"] = np.arange(4)
+    batch["frag_offset"] = [0, 1, 2, 0x1FFF]
+    batch["dst_addr"] = ["1.1.1.1", "2.2.2.2", "3.3.3.3", "4.4.4.4"]
+    batch["src_addr"] = "9.9.9.9"
+    for i in range(4):
+        assert batch[i] == replace(ip, identifier=i, frag_offset=[0, 1, 2, 0x1FFF][i],
+                                   dst_addr=f"{i + 1}.{i + 1}.{i + 1}.{i + 1}",
+                                   src_addr="9.9.9.9")
+    # Bit fields sharing a word keep each other.
+    assert batch["flags"].tolist() == [IPFlag.DONT_FRAG] * 4
+
+
+@pytest.mark.parametrize("protocol", TRANSPORTS)
+def test_fill_matches_packet(protocol):
+    cls, transport = TRANSPORTS[protocol]
+    count = 50
+    ip = IPHeaderBatch.from_header(ip_header(protocol), count)
+    tp = cls.from_header(transport, count)
+    ip["identifier"] = np.arange(count)
+    ip["dst_addr"] = np.arange(count, dtype=np.uint32) + 0x0A000100
+    tp["seq_num" if protocol == IPPROTO_ICMP else "src_port"] = np.arange(count) * 977
+    if protocol == IPPROTO_UDP:
+        tp.fill_lengths()
+    ip.fill_lengths(tp)
+    ip.fill_checksums()
+    if protocol == IPPROTO_ICMP:
+        tp.fill_checksums()
+    else:
+        tp.fill_checksums(ip)
+
+    data = pack_batches(ip, tp)
+    size = ip.row_size + tp.row_size
+    assert len(data) == count * size
+    for i in range(count):
+        expected = bytes(Packet(ip[i], tp[i]))
+        assert data[i * size:(i + 1) * size] == expected
+
+
+def test_pack_batches_errors():
+    with pytest.raises(ValueError):
+        pack_batches()
+    ip = IPHeaderBatch.from_header(ip_header(IPPROTO_UDP), 2)
+    udp = UDPHeaderBatch.from_header(TRANSPORTS[IPPROTO_UDP][1], 3)
+    with pytest.raises(ValueError):
+        pack_batches(ip, udp)
+    with pytest.raises(ValueError):
+        udp.fill_checksums(ip)
+
+
+def test_pack_into():
+    ip = IPHeaderBatch.from_header(ip_header(IPPROTO_UDP), 2)
+    buf = bytearray(42)
+    assert ip.pack_into(buf, 2) == 40
+    assert buf[2:] == bytes(ip)
+    with pytest.raises(ValueError):
+        ip.pack_into(buf, 3)
@@ -0,0 +1,178 @@
+from protohdr import *
+
+from random import Random
+from socket import (
+    AF_UNIX, IPPROTO_ICMP, IPPROTO_TCP, IPPROTO_UDP, SOCK_DGRAM, socketpair,
+)
+
+import pytest
+
+
+IP = filter_fields(IPHeader)
+TCP = filter_fields(TCPHeader)
+UDP = filter_fields(UDPHeader)
+ICMP = filter_fields(ICMPHeader)
+FIELDS = [(ns, name) for ns in (IP, TCP, UDP, ICMP) for name in vars(ns)]
+
+
+def run_bpf(program: list[tuple[int, int, int, int]], packet: bytes) -> int:
+    """ Classic BPF interpreter for the instructions PacketFilter emits. """
+    a = x = 0
+    pc = 0
+    while True:
+        code, jt, jf, k = program[pc]
+        pc += 1
+        cls = code & 0x07
+        if cls == 0x06:                                 # ret k
+            return k
+        if cls == 0x00 or code == 0xB1:                 # ld / ldx msh
+            size = {0x00: 4, 0x08: 2, 0x10: 1}[code & 0x18]
+            at = k + (x if code & 0xE0 == 0x40 else 0)
+            if at + size > len(packet):
+                return 0
+            value = int.from_bytes(packet[at:at + size], "big")
+            if code == 0xB1:
+                x = (value & 0x0F) * 4
+            else:
+                a = value
+        elif cls == 0x04:                               # alu k
+            op = code & 0xF0
+            a = {0x50: a & k, 0x60: a << k, 0x70: a >> k}[op] & 0xFFFFFFFF
+        elif cls == 0x05:                               # jmp k
+            op = code & 0xF0
+            taken = {0x10: a == k, 0x20: a > k, 0x30: a >= k}[op]
+            pc += jt if taken else jf
+        else:
+            raise AssertionError(f"unexpected opcode {code:#x}")
+
+
+def random_packet(rng: Random) -> bytes:
+    protocol = rng.choice((IPPROTO_TCP, IPPROTO_UDP, IPPROTO_ICMP, 47))
+    ip = IPHeader(version=4, header_len=20, tos=rng.getrandbits(8), total_len=0,
+                  identifier=rng.getrandbits(16), flags=rng.choice((0, 1, 2)),
+                  frag_offset=rng.choice((0, 0, 0, rng.getrandbits(13))), ttl=rng.getrandbits(8),
+                  protocol=protocol, checksum=0, src_addr=f"10.0.0.{rng.randrange(4)}",
+                  dst_addr=f"10.0.1.{rng.randrange(4)}")
+    ports = (rng.choice((22, 53, 80, 443, 8080)), rng.choice((22, 53, 80, 443, 40000)))
+    if protocol == IPPROTO_TCP:
+        transport = TCPHeader(src_port=ports[0], dst_port=ports[1], seq_num=rng.getrandbits(32),
+                              ack_num=rng.getrandbits(32), data_offset=0,
+                              flags=rng.getrandbits(9), window=rng.getrandbits(16), checksum=0,
+                              urg_ptr=0, options=rng.randbytes(4 * rng.randrange(3)))
+    elif protocol == IPPROTO_UDP:
+        transport = UDPHeader(src_port=ports[0], dst_port=ports[1], header_len=0, checksum=0,
+                              data=rng.randbytes(rng.randrange(8)))
+    else:
+        transport = ICMPHeader(type=rng.choice((0, 3, 8, 11)), code=rng.randrange(4), checksum=0,
+                               identifier=rng.getrandbits(16), seq_num=rng.getrandbits(16))
+    data = bytes(ip / transport)
+    # IP options move the transport header.
+    options = rng.randbytes(4 * rng.choice((0, 0, 1, 2)))
+    data = bytes([0x45 + len(options) // 4]) + data[1:20] + options + data[20:]
+    if rng.random() < 0.1:
+        data = data[:rng.randrange(len(data))]
+    return data
+
+
+def random_value(rng: Random, field: FilterField) -> int:
+    if field.name.endswith("_addr"):
+        return f"10.0.{rng.randrange(2)}.{rng.randrange(4)}"
+    if field.name.endswith("_port"):
+        return rng.choice((22, 53, 80, 443, 40000))
+    bits = field._size * 8
+    return rng.choice((0, 1, 2, rng.getrandbits(min(bits, 4)), rng.getrandbits(bits)))
+
+
+def random_filter(rng: Random, depth: int = 0):
+    choice = rng.random()
+    if depth < 3 and choice < 0.4:
+        left, right = random_filter(rng, depth + 1), random_filter(rng, depth + 1)
+        return left & right if rng.random() < 0.5 else left | right
+    if depth < 3 and choice < 0.5:
+        return ~random_filter(rng, depth + 1)
+    ns, name = rng.choice(FIELDS)
+    field = getattr(ns, name)
+    kind = rng.randrange(5)
+    if kind == 0:
+        return field & rng.getrandbits(8)
+    if kind == 1:
+        return field.isin([random_value(rng, field) for _ in range(rng.randrange(1, 4))])
+    if kind == 2:
+        low = random_value(rng, field)
+        return field.between(low, random_value(rng, field))
+    op = rng.choice(("__eq__", "__ne__", "__lt__", "__le__", "__gt__", "__ge__"))
+    return getattr(field, op)(random_value(rng, field))
+
+
+def test_match_agrees_with_program():
+    rng = Random(21)
+    packets = [random_packet(rng) for _ in range(200)]
+    for _ in range(300):
+        pred = random_filter(rng)
+        program = pred.compile()
+        shifted = pred.compile(14)
+        for packet in packets:
+            expected = pred.match(packet)
+            assert (run_bpf(program, packet) != 0) == expected, (pred, packet.hex())
+            assert (run_bpf(shifted, bytes(14) + packet) != 0) == expected
+            assert pred.match(bytes(14) + packet, 14) == expected
+
+
+def test_known_filters():
+    syn = bytes(IPHeader(version=4, header_len=20, tos=0, total_len=0, identifier=0x1234,
+                         flags=IPFlag.DONT_FRAG, frag_offset=0, ttl=64, protocol=IPPROTO_TCP,
+                         checksum=0, src_addr="192.0.2.1", dst_addr="192.0.2.2")
+                / TCPHeader(src_port=40000, dst_port=443, seq_num=1, ack_num=0, data_offset=0,
+                            flags=TCPFlag.SYN, window=1024, checksum=0, urg_ptr=0))
+    assert (TCP.flags & TCPFlag.SYN).match(syn)
+    assert not (TCP.flags & TCPFlag.ACK).match(syn)
+    assert ((TCP.dst_port == 443) & (IP.src_addr == "192.0.2.1")).match(syn)
+    assert (IP.identifier == 0x1234).match(syn) and (IP.flags == IPFlag.DONT_FRAG).match(syn)
+    assert not (UDP.dst_port == 443).match(syn)
+    assert (~(UDP.dst_port == 443)).match(syn)
+    assert not (TCP.dst_port == 443).match(syn[:22])
+
+
+def test_kernel_agrees():
+    rng = Random(7)
+    raw = [random_packet(rng) for _ in range(100)]
+    for _ in range(20):
+        pred = random_filter(rng)
+        tx, rx = socketpair(AF_UNIX, SOCK_DGRAM)
+        with tx, rx:
+            try:
+                attach_filter(rx, pred)
+            except OSError:
+                pytest.skip("SO_ATTACH_FILTER unsupported")
+            rx.setblocking(False)
+            # An index appended to every packet tells them apart; as it may
+            # complete a truncated field, the filter is matched with it.
+            packets = [packet + i.to_bytes(2, "big") for i, packet in enumerate(raw)]
+            for packet in packets:
+                tx.send(packet)
+            received = []
+            while True:
+                try:
+                    received.append(rx.recv(65536))
+                except BlockingIOError:
+                    break
+            expected = [packet for packet in packets if pred.match(packet)]
+            assert received == expected
+            detach_filter(rx)
+
+
+def test_errors():
+    with pytest.raises(TypeError):
+        bool(IP.ttl == 1)
+    with pytest.raises(TypeError):
+        (IP.ttl == 1) and (IP.ttl == 2)
+    with pytest.raises(ValueError):
+        FilterField(IPHeader, "options")
+    with pytest.raises(TypeError):
+        filter_fields(IPv6Header)
+    with pytest.raises(ValueError):
+        IP.ttl.isin([])
+    with pytest.raises(TypeError):
+        IP.ttl == "x"
+    with pytest.raises(ValueError):
+        IP.identifier == -1
@@ -0,0 +1,57 @@
+from protohdr import *
+
+from random import Random
+
+import pytest
+
+
+def test_matches_inet_checksum():
+    rng = Random(2)
+    lengths = [0, 1, 2, 3, 0, 7, 20, 21, 0, 1400, 1401, 0] + [rng.randrange(80) for _ in range(500)]
+    buffers = [rng.randbytes(n) for n in lengths]
+    expected = [inet_checksum(b) for b in buffers]
+
+    assert inet_checksum_batch(buffers).tolist() == expected
+    assert inet_checksum_batch([bytearray(b) for b in buffers]).tolist() == expected
+    assert inet_checksum_batch([memoryview(b) for b in buffers]).tolist() == expected
+
+
+def test_segments_at_odd_offsets():
+    rng = Random(3)
+    buf = rng.randbytes(5000)
+    offsets = [rng.randrange(len(buf)) for _ in range(500)] + [0, 1, len(buf) - 1, len(buf)]
+    lengths = [rng.randrange(len(buf) - o + 1) for o in offsets]
+    lengths[:20] = [0, 1] * 10
+    expected = [inet_checksum(buf[o:o + n]) for o, n in zip(offsets, lengths)]
+    assert inet_checksum_batch(buf, offsets, lengths).tolist() == expected
+
+
+def test_segment_ending_at_buffer_end():
+    buf = Random(4).randbytes(101)
+    for start in range(0, 101):
+        got = inet_checksum_batch(buf, [start], [101 - start])
+        assert got.tolist() == [inet_checksum(buf[start:])]
+
+
+def test_empty():
+    assert inet_checksum_batch([]).tolist() == []
+    assert inet_checksum_batch(b"", [], []).tolist() == []
+    assert inet_checksum_batch([b""]).tolist() == [inet_checksum(b"")]
+
+
+def test_long_segments_use_wide_sums():
+    buf = b"\xff" * 0x50000
+    assert inet_checksum_batch(buf, [0, 1], [0x50000, 0x4FFFF]).tolist() == [
+        inet_checksum(buf), inet_checksum(buf[1:])]
+
+
+@pytest.mark.parametrize("offsets, lengths", [
+    ([0], None),
+    (None, [1]),
+    ([0, 1], [1]),
+    ([-1], [1]),
+    ([0], [11]),
+])
+def test_invalid_segments(offsets, lengths):
+    with pytest.raises(ValueError):
+        inet_checksum_batch(bytes(10), offsets, lengths)
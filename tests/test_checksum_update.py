@@ -0,0 +1,93 @@
+from protohdr import *
+
+from random import Random
+from socket import IPPROTO_TCP, IPPROTO_UDP
+
+import pytest
+
+
+def ip_header(**fields) -> IPHeader:
+    ip = IPHeader(version=4, header_len=20, tos=0, total_len=60, identifier=0x1234,
+                  flags=IPFlag.DONT_FRAG, frag_offset=0, ttl=64, protocol=IPPROTO_TCP,
+                  checksum=0, src_addr="10.0.0.1", dst_addr="10.0.0.2")
+    for name, value in fields.items():
+        setattr(ip, name, value)
+    ip.checksum = inet_checksum(bytes(ip))
+    return ip
+
+
+def test_inet_checksum_update_matches_recompute():
+    rng = Random(1)
+    for _ in range(1000):
+        data = bytearray(rng.randbytes(2 * rng.randrange(2, 40)))
+        checksum = inet_checksum(data)
+        at = 2 * rng.randrange(len(data) // 2 - 1)
+        bits = rng.choice((16, 32)) if at + 4 <= len(data) else 16
+        size = bits // 8
+        old = int.from_bytes(data[at:at + size], "big")
+        new = rng.getrandbits(bits)
+        data[at:at + size] = new.to_bytes(size, "big")
+        assert inet_checksum_update(checksum, old, new, bits) == inet_checksum(data)
+
+
+def test_inet_checksum_update_rejects_unaligned_width():
+    with pytest.raises(ValueError):
+        inet_checksum_update(0, 0, 1, 8)
+
+
+@pytest.mark.parametrize("fields", [
+    {"identifier": 0xBEEF},
+    {"ttl": 1},
+    {"total_len": 1500, "tos": 0x10},
+    {"flags": IPFlag.MORE_FRAGS, "frag_offset": 185},
+    {"src_addr": "192.168.1.1", "dst_addr": "8.8.8.8"},
+])
+def test_ip_update(fields):
+    ip = ip_header()
+    ip.update(**fields)
+    assert ip == ip_header(**fields)
+
+
+def test_tcp_update_keeps_transport_checksum():
+    ip = ip_header()
+    tcp = TCPHeader(src_port=0x1234, dst_port=80, seq_num=0x12345678, ack_num=0,
+                    data_offset=32, flags=TCPFlag.SYN, window=0xFFFF, checksum=0,
+                    urg_ptr=0, data=b"payload")
+    tcp.checksum = inet_transport_checksum(bytes(tcp), ip)
+    for seq_num in (0, 1, 0xFFFFFFFF, 0x9ABCDEF0):
+        tcp.update(seq_num=seq_num, src_port=seq_num & 0xFFFF)
+        checksum = tcp.checksum
+        tcp.checksum = 0
+        assert checksum == inet_transport_checksum(bytes(tcp), ip)
+        tcp.checksum = checksum
+
+
+def test_udp_and_icmp_update():
+    ip = ip_header(protocol=IPPROTO_UDP)
+    udp = UDPHeader(src_port=5353, dst_port=53, header_len=12, checksum=0, data=b"abcd")
+    udp.checksum = inet_transport_checksum(bytes(udp), ip)
+    udp.update(dst_port=5300)
+    checksum, udp.checksum = udp.checksum, 0
+    assert checksum == inet_transport_checksum(bytes(udp), ip)
+
+    icmp = ICMPHeader(type=ICMPMessage.ECHO, code=0, checksum=0, identifier=7, seq_num=1,
+                      data=b"ping")
+    icmp.checksum = inet_checksum(bytes(icmp))
+    icmp.update(seq_num=2, type=ICMPMessage.ECHO_REPLY)
+    checksum, icmp.checksum = icmp.checksum, 0
+    assert checksum == inet_checksum(bytes(icmp))
+
+
+def test_update_rejects_uncovered_fields():
+    icmp = ICMPHeader(type=ICMPMessage.ECHO, code=0, checksum=0, identifier=7, seq_num=1)
+    with pytest.raises(ValueError):
+        icmp.update(seq_num=2, data=b"more")
+    # Nothing is assigned if any field is rejected.
+    assert icmp.seq_num == 1 and icmp.checksum == 0
+
+
+def test_plain_assignment_leaves_checksum():
+    ip = ip_header()
+    checksum = ip.checksum
+    ip.ttl = 1
+    assert ip.checksum == checksum
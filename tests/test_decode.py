@@ -0,0 +1,124 @@
+from protohdr import *
+
+from socket import IPPROTO_TCP, inet_aton
+from struct import pack
+
+import pytest
+
+
+WIRE_IP = pack("!BBHHHBBH4s4s", 0x45, 0x10, 40, 0x1234, 0x4000 | 185, 64, IPPROTO_TCP,
+               0xBEEF, inet_aton("10.0.0.1"), inet_aton("10.0.0.2"))
+""" Network-order IPv4 header: DF set and fragment offset 185. """
+
+
+def tcp_packet(**ip_fields) -> bytes:
+    ip = IPHeader(version=4, header_len=20, tos=0, total_len=0, identifier=0x1234,
+                  flags=IPFlag.DONT_FRAG, frag_offset=0, ttl=64, protocol=IPPROTO_TCP,
+                  checksum=0, src_addr="10.0.0.1", dst_addr="10.0.0.2")
+    for name, value in ip_fields.items():
+        setattr(ip, name, value)
+    tcp = TCPHeader(src_port=1234, dst_port=80, seq_num=7, ack_num=0, data_offset=0,
+                    flags=TCPFlag.SYN, window=512, checksum=0, urg_ptr=0,
+                    options=TCPOption.mss(1460), data=b"payload")
+    return bytes(ip / tcp)
+
+
+def test_ip_from_network_order():
+    for ip in (IPHeader.from_bytes(WIRE_IP), IPHeader.from_buffer(bytearray(WIRE_IP))):
+        assert ip == IPHeader(version=4, header_len=20, tos=0x10, total_len=40,
+                              identifier=0x1234, flags=IPFlag.DONT_FRAG, frag_offset=185,
+                              ttl=64, protocol=IPPROTO_TCP, checksum=0xBEEF,
+                              src_addr="10.0.0.1", dst_addr="10.0.0.2")
+        assert bytes(ip) == WIRE_IP
+
+
+def test_ip_pack_into_network_order():
+    buf = bytearray(22)
+    IPHeader.from_bytes(WIRE_IP).pack_into(buf, 2)
+    assert buf[2:] == WIRE_IP
+
+
+def test_ip_from_buffer_offset():
+    ip = IPHeader.from_buffer(b"\x00" * 3 + WIRE_IP, 3)
+    assert ip.identifier == 0x1234 and ip.dst_addr == "10.0.0.2"
+
+
+def test_ip_checksum_is_valid_on_the_wire():
+    pkt = tcp_packet()
+    assert inet_checksum(pkt[:20]) == 0
+    ip = IPHeader.from_bytes(pkt)
+    assert ip.total_len == len(pkt)
+    assert pkt[2:4] == len(pkt).to_bytes(2, "big")
+    assert pkt[6:8] == b"\x40\x00"
+
+
+def test_truncated_headers():
+    with pytest.raises(ValueError):
+        IPHeader.from_bytes(WIRE_IP[:19])
+    with pytest.raises(ValueError):
+        IPHeader.from_bytes(WIRE_IP, 1)
+    with pytest.raises(ValueError):
+        TCPHeader.from_bytes(bytes(19))
+    with pytest.raises(ValueError):
+        UDPHeader.from_bytes(bytes(7))
+    with pytest.raises(ValueError):
+        ICMPHeader.from_bytes(bytes(7))
+
+
+def test_tcp_data_offset_checked():
+    tcp = bytearray(tcp_packet()[20:])
+    tcp[12] = 4 << 4
+    with pytest.raises(ValueError):
+        TCPHeader.from_bytes(tcp)
+    tcp[12] = 15 << 4
+    with pytest.raises(ValueError):
+        TCPHeader.from_bytes(tcp[:40])
+
+
+def test_decode_packet():
+    pkt = tcp_packet()
+    ip, tcp = decode_packet(pkt)
+    assert ip.flags == IPFlag.DONT_FRAG and ip.frag_offset == 0
+    assert type(tcp) is TCPHeader
+    assert (tcp.src_port, tcp.dst_port, tcp.seq_num) == (1234, 80, 7)
+    assert type(tcp.data) is memoryview and tcp.data == b"payload"
+    assert tcp.options[:4] == TCPOption.mss(1460)
+    assert inet_transport_checksum(pkt[20:], ip) == 0
+
+
+def test_from_bytes_copies_variable_fields():
+    tcp = TCPHeader.from_bytes(bytearray(tcp_packet()), 20)
+    assert type(tcp.options) is bytes and type(tcp.data) is bytes
+
+
+def test_decode_packet_fragments():
+    ip, tcp = decode_packet(tcp_packet(flags=IPFlag.MORE_FRAGS))
+    assert type(tcp) is TCPHeader
+    # Later fragments carry no transport header, only payload.
+    ip, tcp = decode_packet(tcp_packet(flags=0, frag_offset=3))
+    assert ip.frag_offset == 3 and tcp is None
+
+
+def test_decode_packet_other_protocols():
+    pkt = bytearray(tcp_packet())
+    pkt[9] = 47
+    ip, transport = decode_packet(pkt)
+    assert ip.protocol == 47 and transport is None
+
+
+def test_decode_packet_rejects_bad_headers():
+    pkt = bytearray(tcp_packet())
+    pkt[0] = 0x44
+    with pytest.raises(ValueError):
+        decode_packet(pkt)
+    pkt[0] = 0x35
+    with pytest.raises(ValueError):
+        decode_packet(pkt)
+
+
+def test_udp_and_icmp_round_trip():
+    udp = UDPHeader(src_port=53, dst_port=5353, header_len=12, checksum=0x1234, data=b"abcd")
+    assert UDPHeader.from_bytes(bytes(udp)) == udp
+    icmp = ICMPHeader(type=ICMPMessage.ECHO, code=0, checksum=0x4321, identifier=7,
+                      seq_num=9, data=b"ping")
+    assert ICMPHeader.from_bytes(bytes(icmp)) == icmp
@@ -0,0 +1,152 @@
+from protohdr import *
+
+from random import Random
+from socket import IPPROTO_UDP
+
+import pytest
+
+
+def udp_packet(rng: Random, size: int, identifier: int = 0x1234) -> bytes:
+    ip = IPHeader(version=4, header_len=20, tos=0, total_len=0, identifier=identifier, flags=0,
+                  frag_offset=0, ttl=64, protocol=IPPROTO_UDP, checksum=0,
+                  src_addr="192.0.2.1", dst_addr="192.0.2.2")
+    udp = UDPHeader(src_port=1234, dst_port=53, header_len=0, checksum=0,
+                    data=rng.randbytes(size))
+    return bytes(ip / udp)
+
+
+def split(packet: bytes, mtu: int) -> list[bytes]:
+    """ Fragments of `packet` as they go on the wire. """
+    ip, _ = decode_packet(packet)
+    return [bytes(hdr) + bytes(data) for hdr, data in fragment(ip, memoryview(packet)[20:], mtu)]
+
+
+def feed(reassembler: Reassembler, wire: bytes, now: float = 0.0):
+    ip = IPView(wire)
+    return reassembler.add(ip, memoryview(wire)[ip.header_len:], now)
+
+
+def test_fragments_on_the_wire():
+    wire = split(udp_packet(Random(1), 92), 60)
+    assert [len(frag) for frag in wire] == [60, 60, 40]
+    for i, frag in enumerate(wire):
+        # Flags and offset in network order, as any stack reads them.
+        flags_offset = int.from_bytes(frag[6:8], "big")
+        assert flags_offset >> 13 == (IPFlag.MORE_FRAGS if i < 2 else 0)
+        assert flags_offset & 0x1FFF == 5 * i
+        assert int.from_bytes(frag[2:4], "big") == len(frag)
+        assert inet_checksum(frag[:20]) == 0
+        ip, transport = decode_packet(frag)
+        assert (ip.flags, ip.frag_offset) == (IPFlag.MORE_FRAGS if i < 2 else 0, 5 * i)
+        assert (transport is None) == (i > 0)
+
+
+@pytest.mark.parametrize("mtu", [28, 68, 576, 1500])
+def test_round_trip(mtu):
+    rng = Random(mtu)
+    reassembler = Reassembler()
+    for size in (0, 1, 7, 8, 100, 1472, 4000):
+        packet = udp_packet(rng, size)
+        wire = split(packet, mtu)
+        rng.shuffle(wire)
+        results = [feed(reassembler, frag) for frag in wire]
+        assert results[:-1] == [None] * (len(wire) - 1)
+        ip, payload = results[-1]
+        assert bytes(ip) + payload == packet
+    assert len(reassembler) == 0 and reassembler.nbytes == 0
+
+
+def test_refragment():
+    packet = udp_packet(Random(2), 2000)
+    reassembler = Reassembler()
+    for frag in split(packet, 1500):
+        # Fragments split again on a smaller link.
+        for piece in split(frag, 576):
+            result = feed(reassembler, piece)
+    assert bytes(result[0]) + result[1] == packet
+    assert reassembler.stats.reassembled == 1
+
+
+def test_scapy_reassembles():
+    scapy = pytest.importorskip("scapy.all")
+    packet = udp_packet(Random(3), 3000)
+    wire = [scapy.IP(frag) for frag in split(packet, 1000)]
+    whole, = scapy.defragment(wire)
+    assert bytes(whole[scapy.IP].payload) == packet[20:]
+    # And ours takes scapy's fragments.
+    reassembler = Reassembler()
+    for frag in scapy.fragment(scapy.IP(packet), 800):
+        result = feed(reassembler, bytes(frag))
+    assert result[1] == packet[20:]
+
+
+def test_dont_fragment():
+    packet = bytearray(udp_packet(Random(4), 100))
+    ip, _ = decode_packet(bytes(packet))
+    ip.flags = IPFlag.DONT_FRAG
+    with pytest.raises(ValueError):
+        fragment(ip, packet[20:], 60)
+    assert len(fragment(ip, packet[20:], 1500)) == 1
+    with pytest.raises(ValueError):
+        fragment(ip, packet[20:], 27)
+    with pytest.raises(ValueError):
+        fragment(ip, bytes(0x10000), 1500)
+
+
+def test_duplicates_and_overlaps():
+    wire = split(udp_packet(Random(5), 200), 60)
+    reassembler = Reassembler()
+    assert feed(reassembler, wire[0]) is None
+    assert feed(reassembler, wire[0]) is None
+    assert reassembler.stats.duplicates == 1 and len(reassembler) == 1
+
+    # A fragment overlapping another discards the datagram.
+    other = split(udp_packet(Random(5), 200), 76)
+    assert feed(reassembler, other[0]) is None
+    assert reassembler.stats.invalid == 1 and len(reassembler) == 0
+    assert reassembler.nbytes == 0
+
+    # As does a last fragment ending before data already held.
+    assert feed(reassembler, wire[3]) is None
+    assert feed(reassembler, wire[1]) is None
+    last = bytearray(wire[-1][:28])
+    last[6:8] = (1).to_bytes(2, "big")
+    assert feed(reassembler, bytes(last)) is None
+    assert reassembler.stats.invalid == 2 and len(reassembler) == 0
+
+
+def test_memory_bound():
+    rng = Random(6)
+    reassembler = Reassembler(max_datagram_bytes=1000, max_bytes=3000)
+    # A flood of tiny fragments hits the per-datagram cap.
+    wire = split(udp_packet(rng, 4000), 28)
+    for frag in wire[:-1]:
+        feed(reassembler, frag)
+        assert reassembler.nbytes <= 1000
+    assert reassembler.stats.invalid >= 1
+
+    reassembler = Reassembler(max_datagram_bytes=2000, max_bytes=3000)
+    for identifier in range(50):
+        first = split(udp_packet(rng, 2000, identifier), 1000)[0]
+        feed(reassembler, first)
+        assert reassembler.nbytes <= 3000
+    # Only the newest datagrams are kept.
+    assert len(reassembler) == 2 and reassembler.stats.evicted == 48
+    assert reassembler.stats.invalid == 0
+
+
+def test_timeout():
+    reassembler = Reassembler(timeout=10)
+    for identifier in range(3):
+        feed(reassembler, split(udp_packet(Random(7), 100, identifier), 60)[0], now=identifier)
+    assert reassembler.expire(10.5) == 1 and len(reassembler) == 2
+    wire = split(udp_packet(Random(7), 100, 2), 60)
+    # The first fragment of datagram 2 timed out, so it is incomplete.
+    assert [feed(reassembler, frag, now=12.5) for frag in wire[1:]] == [None, None]
+    assert reassembler.stats.timeouts == 3 and len(reassembler) == 1
+
+
+def test_not_fragmented():
+    packet = udp_packet(Random(8), 10)
+    ip, payload = feed(Reassembler(), packet)
+    assert bytes(ip) + payload == packet
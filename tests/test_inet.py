@@ -0,0 +1,47 @@
+from protohdr import *
+
+from random import Random
+
+import pytest
+
+
+def reference_checksum(data: bytes) -> int:
+    """ RFC 1071 checksum, one 16-bit word at a time. As always in
+        protohdr, an odd trailing byte is summed as a low-order byte. """
+    s = 0
+    for i in range(0, len(data), 2):
+        s += data[i] << 8 | data[i + 1] if i + 1 < len(data) else data[i]
+        s = (s & 0xFFFF) + (s >> 16)
+    return ~s & 0xFFFF
+
+
+def test_rfc1071_example():
+    # RFC 1071 section 3: the words sum to 0xDDF2.
+    assert inet_checksum(bytes.fromhex("0001f203f4f5f6f7")) == ~0xDDF2 & 0xFFFF
+
+
+@pytest.mark.parametrize("size", [0, 1, 2, 3, 20, 21, 511, 512, 513, 1400, 1401, 9001])
+def test_matches_reference(size):
+    rng = Random(size)
+    data = rng.randbytes(size)
+    expected = reference_checksum(data)
+    assert inet_checksum(data) == expected
+    assert inet_checksum(bytearray(data)) == expected
+    assert inet_checksum(memoryview(data)) == expected
+
+
+def test_odd_tail_is_low_order_byte():
+    assert inet_checksum(b"\x01") == ~0x0001 & 0xFFFF
+    assert inet_checksum(b"\x00\x00\x01") == ~0x0001 & 0xFFFF
+
+
+@pytest.mark.parametrize("size", [64, 1 << 20])
+def test_carries_fold_for_large_buffers(size):
+    data = b"\xff" * size
+    assert inet_checksum(data) == reference_checksum(data) == 0
+
+
+def test_memoryview_slice():
+    data = Random(7).randbytes(2001)
+    view = memoryview(data)[1:1999]
+    assert inet_checksum(view) == reference_checksum(data[1:1999])
@@ -0,0 +1,137 @@
+from protohdr import *
+
+from dataclasses import replace
+from socket import IPPROTO_ICMPV6, IPPROTO_TCP, IPPROTO_UDP
+
+import pytest
+
+
+def ipv6(**fields) -> IPv6Header:
+    values = dict(version=6, traffic_class=0x2E, flow_label=0x12345, payload_len=0,
+                  next_header=0, hop_limit=64, src_addr="2001:db8::1",
+                  dst_addr="2001:db8:ffff::abcd")
+    values.update(fields)
+    return IPv6Header(**values)
+
+
+def tcp() -> TCPHeader:
+    return TCPHeader(src_port=1234, dst_port=80, seq_num=7, ack_num=0, data_offset=0,
+                     flags=TCPFlag.SYN, window=1024, checksum=0, urg_ptr=0, data=b"hello")
+
+
+def udp() -> UDPHeader:
+    return UDPHeader(src_port=53, dst_port=5353, header_len=0, checksum=0, data=b"abc")
+
+
+def icmp() -> ICMPHeader:
+    return ICMPHeader(type=ICMPv6Message.ECHO, code=0, checksum=0, identifier=7, seq_num=9,
+                      data=b"ping!")
+
+
+EXTENSIONS = [
+    (),
+    (IPv6ExtHeader(ext_type=IPv6ExtType.HOP_BY_HOP, next_header=0, data=b"\x05\x02\x00\x00"),
+     IPv6ExtHeader(ext_type=IPv6ExtType.DEST_OPTIONS, next_header=0)),
+]
+
+
+@pytest.mark.parametrize("extensions", EXTENSIONS)
+@pytest.mark.parametrize("make, protocol", [(tcp, IPPROTO_TCP), (udp, IPPROTO_UDP),
+                                            (icmp, IPPROTO_ICMPV6)])
+def test_packet(make, protocol, extensions):
+    ip = ipv6(extensions=extensions)
+    data = bytes(ip / make())
+    assert len(data) % 8 == len(make()) % 8 and ip.protocol == protocol
+    assert int.from_bytes(data[4:6], "big") == len(data) - 40 == ip.payload_len
+
+    decoded, transport = decode_packet(data)
+    assert decoded.protocol == protocol and len(decoded) == len(ip)
+    assert [(ext.ext_type, ext.next_header) for ext in decoded.extensions] == \
+        [(ext.ext_type, ext.next_header) for ext in ip.extensions]
+    assert bytes(decoded) + bytes(transport) == data
+    # The pseudo-header covers the upper-layer protocol, not the chain.
+    assert inet_transport_checksum(data[len(ip):], decoded) in (0, 0xFFFF)
+
+    view, transport_view = view_packet(data)
+    assert (view.version, view.traffic_class, view.flow_label) == (6, 0x2E, 0x12345)
+    assert (view.protocol, view.header_len, view.frag_offset) == (protocol, len(ip), 0)
+    assert (view.src_addr, view.dst_addr) == (ip.src_addr, ip.dst_addr)
+    assert transport_view.checksum == transport.checksum
+    assert bytes(view.to_header()) == bytes(ip)
+
+
+def test_scapy_checksums():
+    scapy = pytest.importorskip("scapy.all")
+    layers = {IPPROTO_TCP: scapy.TCP, IPPROTO_UDP: scapy.UDP,
+              IPPROTO_ICMPV6: scapy.ICMPv6EchoRequest}
+    checksum_at = {IPPROTO_TCP: 16, IPPROTO_UDP: 6, IPPROTO_ICMPV6: 2}
+    for make in (tcp, udp, icmp):
+        for extensions in EXTENSIONS:
+            ip = ipv6(extensions=extensions)
+            transport = make()
+            data = bytes(ip / transport)
+            parsed = scapy.IPv6(data)
+            assert parsed.plen == len(data) - 40 and parsed.fl == 0x12345
+            segment = bytearray(data[len(ip):])
+            at = checksum_at[ip.protocol]
+            segment[at:at + 2] = bytes(2)
+            # Scapy walks the extension chain for the pseudo-header itself.
+            underlayer = parsed[layers[ip.protocol]].underlayer
+            assert scapy.in6_chksum(ip.protocol, underlayer, bytes(segment)) == transport.checksum
+
+
+def test_fragment_header():
+    fragment = IPv6FragmentHeader(next_header=0, frag_offset=10, more_frags=1,
+                                  identification=0xDEADBEEF)
+    data = bytes(ipv6(extensions=(fragment,)) / udp())
+    assert data[40:48] == bytes((IPPROTO_UDP, 0)) + (10 << 3 | 1).to_bytes(2, "big") \
+        + (0xDEADBEEF).to_bytes(4, "big")
+    ip, transport = decode_packet(data)
+    # A later fragment has no transport header.
+    assert transport is None and ip.extensions == (fragment,)
+    view, transport_view = view_packet(data)
+    assert transport_view is None and view.frag_offset == 10 and view.protocol == IPPROTO_UDP
+
+    first = replace(fragment, frag_offset=0)
+    ip, transport = decode_packet(bytes(ipv6(extensions=(first,)) / udp()))
+    assert transport.data == b"abc"
+
+
+def test_extension_padding():
+    assert len(IPv6ExtHeader(ext_type=IPv6ExtType.HOP_BY_HOP, next_header=0)) == 8
+    assert len(IPv6ExtHeader(ext_type=IPv6ExtType.DEST_OPTIONS, next_header=0,
+                             data=bytes(7))) == 16
+    routing = IPv6ExtHeader(ext_type=IPv6ExtType.ROUTING, next_header=0, data=b"\x01")
+    assert bytes(routing) == bytes((0, 0, 1)) + bytes(5)
+
+
+def test_truncated():
+    data = bytes(ipv6(extensions=EXTENSIONS[1]) / udp())
+    for size in (39, 47, 50):
+        with pytest.raises(ValueError):
+            decode_packet(data[:size])
+    with pytest.raises(ValueError):
+        view_packet(data[:50])[0].protocol
+
+
+@pytest.mark.parametrize("make", [tcp, udp, icmp])
+def test_template_matches_packet(make):
+    ip, transport = ipv6(), make()
+    # Fill in the payload length and next header first.
+    bytes(ip / transport)
+    transport_fields = ("seq_num",) if make is icmp else ("dst_port",)
+    template = PacketTemplate(ip, transport, ("dst_addr", "hop_limit"), transport_fields)
+    for dst_addr, hop_limit, value in (("2001:db8::77", 3, 443), ("fe80::1", 255, 9)):
+        expected = replace(transport)
+        setattr(expected, transport_fields[0], value)
+        assert template.build(dst_addr, hop_limit, value) == \
+            bytes(replace(ip, dst_addr=dst_addr, hop_limit=hop_limit) / expected)
+
+
+def test_address_cache():
+    assert inet_pack_addr("2001:db8::1", 6) == bytes.fromhex("20010db8" + "0" * 23 + "1")
+    assert inet_pack_addr("192.0.2.1") == bytes((192, 0, 2, 1))
+    with pytest.raises(OSError):
+        inet_pack_addr("::1")
+    with pytest.raises(OSError):
+        inet_pack_addr("192.0.2.1", 6)
@@ -0,0 +1,79 @@
+from protohdr import *
+
+from random import Random
+from socket import IPPROTO_TCP, IPPROTO_UDP
+
+
+COUNT = 300
+
+
+def payload(rng: Random, limit: int = 1500) -> bytes:
+    return rng.randbytes(rng.choice((0, 1, rng.randrange(limit))))
+
+
+def test_tcp_len():
+    rng = Random(1)
+    for _ in range(COUNT):
+        # Up to the 40 bytes of options TCP allows, around the padding
+        # to 32 bytes.
+        tcp = TCPHeader(src_port=rng.getrandbits(16), dst_port=rng.getrandbits(16),
+                        seq_num=rng.getrandbits(32), ack_num=rng.getrandbits(32),
+                        data_offset=rng.randrange(20, 61, 4), flags=rng.getrandbits(9),
+                        window=rng.getrandbits(16), checksum=rng.getrandbits(16),
+                        urg_ptr=rng.getrandbits(16), options=rng.randbytes(rng.randrange(41)),
+                        data=payload(rng))
+        assert len(tcp) == len(bytes(tcp))
+
+
+def test_udp_len():
+    rng = Random(2)
+    for _ in range(COUNT):
+        udp = UDPHeader(src_port=rng.getrandbits(16), dst_port=rng.getrandbits(16),
+                        header_len=rng.getrandbits(16), checksum=rng.getrandbits(16),
+                        data=payload(rng))
+        assert len(udp) == len(bytes(udp))
+
+
+def test_icmp_len():
+    rng = Random(3)
+    for _ in range(COUNT):
+        icmp = ICMPHeader(type=rng.getrandbits(8), code=rng.getrandbits(8),
+                          checksum=rng.getrandbits(16), identifier=rng.getrandbits(16),
+                          seq_num=rng.getrandbits(16), data=payload(rng))
+        assert len(icmp) == len(bytes(icmp))
+
+
+def test_ip_len():
+    rng = Random(4)
+    for _ in range(COUNT):
+        ip = IPHeader(version=4, header_len=20, tos=rng.getrandbits(8),
+                      total_len=rng.getrandbits(16), identifier=rng.getrandbits(16),
+                      flags=rng.getrandbits(3), frag_offset=rng.getrandbits(13),
+                      ttl=rng.getrandbits(8), protocol=rng.choice((IPPROTO_TCP, IPPROTO_UDP)),
+                      checksum=rng.getrandbits(16), src_addr=f"10.0.0.{rng.randrange(256)}",
+                      dst_addr=f"192.168.{rng.randrange(256)}.1")
+        assert len(ip) == len(bytes(ip))
+
+
+def test_ipv6_len():
+    rng = Random(5)
+    for _ in range(COUNT):
+        extensions = []
+        for _ in range(rng.randrange(4)):
+            if rng.random() < 0.25:
+                extensions.append(IPv6FragmentHeader(
+                    next_header=0, frag_offset=rng.getrandbits(13),
+                    more_frags=rng.getrandbits(1), identification=rng.getrandbits(32)))
+            else:
+                ext_type = rng.choice((IPv6ExtType.HOP_BY_HOP, IPv6ExtType.ROUTING,
+                                       IPv6ExtType.DEST_OPTIONS))
+                extensions.append(IPv6ExtHeader(ext_type=ext_type, next_header=0,
+                                                data=payload(rng, 40)))
+        ip = IPv6Header(version=6, traffic_class=rng.getrandbits(8),
+                        flow_label=rng.getrandbits(20), payload_len=rng.getrandbits(16),
+                        next_header=IPPROTO_TCP, hop_limit=rng.getrandbits(8),
+                        src_addr="2001:db8::1", dst_addr="2001:db8::2",
+                        extensions=tuple(extensions))
+        assert len(ip) == len(bytes(ip))
+        for ext in extensions:
+            assert len(ext) == len(bytes(ext))
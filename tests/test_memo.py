@@ -0,0 +1,96 @@
+from protohdr import *
+
+from socket import IPPROTO_UDP
+
+import pytest
+
+
+def ip_header() -> IPHeader:
+    return IPHeader(version=4, header_len=20, tos=0, total_len=28, identifier=1, flags=0,
+                    frag_offset=0, ttl=64, protocol=IPPROTO_UDP, checksum=0,
+                    src_addr="10.0.0.1", dst_addr="10.0.0.2")
+
+
+def tcp_header(data: bytes | bytearray = b"") -> TCPHeader:
+    return TCPHeader(src_port=1234, dst_port=80, seq_num=7, ack_num=0, data_offset=32,
+                     flags=TCPFlag.ACK, window=1024, checksum=0, urg_ptr=0, data=data)
+
+
+def test_bytes_memoized():
+    tcp = tcp_header()
+    assert bytes(tcp) is bytes(tcp)
+    ipv6 = IPv6Header(version=6, traffic_class=0, flow_label=0, payload_len=0, next_header=0,
+                      hop_limit=64, src_addr="2001:db8::1", dst_addr="2001:db8::2",
+                      extensions=(IPv6ExtHeader(ext_type=IPv6ExtType.HOP_BY_HOP,
+                                                next_header=0),))
+    assert bytes(ipv6) is bytes(ipv6)
+    assert bytes(ipv6.extensions[0]) is bytes(ipv6.extensions[0])
+
+
+def test_fixed_headers_not_memoized():
+    ip = ip_header()
+    assert bytes(ip) == bytes(ip) and bytes(ip) is not bytes(ip)
+
+
+def test_assignment_invalidates():
+    tcp = tcp_header()
+    old = bytes(tcp)
+    tcp.window = 1
+    assert bytes(tcp)[14:16] == bytes((0, 1)) and bytes(tcp) != old
+    tcp.dst_port = 443
+    assert bytes(tcp)[2:4] == (443).to_bytes(2, "big")
+    tcp.window = 1024
+    tcp.dst_port = 80
+    assert bytes(tcp) == old
+
+
+def test_same_value_keeps_memo():
+    tcp = tcp_header()
+    data = bytes(tcp)
+    tcp.window = 1024
+    assert bytes(tcp) is data
+
+
+def test_update_invalidates():
+    tcp = tcp_header()
+    tcp.checksum = inet_checksum(bytes(tcp))
+    tcp.update(seq_num=8)
+    assert bytes(tcp) == bytes(TCPHeader.from_bytes(bytes(tcp)))
+    assert inet_checksum(bytes(tcp)) == 0
+
+
+def test_variable_fields_invalidate():
+    tcp = tcp_header(b"ab")
+    assert bytes(tcp).endswith(b"ab")
+    tcp.data = b"cd"
+    assert bytes(tcp).endswith(b"cd")
+
+
+def test_in_place_changes_need_invalidate():
+    payload = bytearray(b"ab")
+    tcp = tcp_header(payload)
+    assert bytes(tcp).endswith(b"ab")
+    payload[:] = b"cd"
+    assert bytes(tcp).endswith(b"ab")
+    tcp.invalidate()
+    assert bytes(tcp).endswith(b"cd")
+    # Headers that are not memoized see the change right away.
+    udp = UDPHeader(src_port=1, dst_port=2, header_len=10, checksum=0, data=payload)
+    assert bytes(udp).endswith(b"cd")
+    payload[:] = b"ef"
+    assert bytes(udp).endswith(b"ef")
+
+
+def test_decoded_header_memo():
+    buf = bytearray(bytes(tcp_header()))
+    tcp = TCPHeader.from_buffer(buf)
+    assert bytes(tcp) == buf
+    tcp.urg_ptr = 0x10
+    assert bytes(tcp)[19] == 0x10
+
+
+def test_slotted():
+    ip = ip_header()
+    assert not hasattr(ip, "__dict__")
+    with pytest.raises(AttributeError):
+        ip.no_such_field = 1
@@ -0,0 +1,90 @@
+from protohdr import *
+
+from time import perf_counter, sleep
+
+import pytest
+
+
+def test_batch_size():
+    assert Pacer(pps=100_000).batch_size == 100
+    assert Pacer(pps=100_000, interval=0.0005).batch_size == 50
+    assert Pacer(pps=10).batch_size == 1
+    assert Pacer(bps=1e9).batch_size is None
+
+
+@pytest.mark.parametrize("kwargs", [{}, {"pps": 0}, {"bps": -1}, {"pps": 1, "interval": 0},
+                                    {"pps": 1, "spin": -1}, {"pps": 1, "burst": -1}])
+def test_invalid(kwargs):
+    with pytest.raises(ValueError):
+        Pacer(**kwargs)
+
+
+def test_batches_by_packet_rate():
+    pacer = Pacer(pps=50_000, interval=0.001)
+    batches = list(pacer.batches(range(1234)))
+    assert [len(batch) for batch in batches] == [50] * 24 + [34]
+    assert [x for batch in batches for x in batch] == list(range(1234))
+    stats = pacer.stats
+    assert (stats.batches, stats.packets, stats.nbytes) == (25, 1234, 0)
+    assert stats.elapsed >= 1234 / 50_000
+
+
+def test_batches_by_bit_rate():
+    pacer = Pacer(bps=8_000_000, interval=0.001)
+    packets = [bytes(300)] * 100
+    batches = list(pacer.batches(packets))
+    # 1000 bytes per interval: batches are filled up to that.
+    assert [len(batch) for batch in batches] == [4] * 25
+    assert pacer.stats.nbytes == 30_000
+    assert pacer.stats.bps == pytest.approx(8_000_000, rel=0.2)
+
+
+def test_both_rates_take_the_slower():
+    pacer = Pacer(pps=1_000_000, bps=8_000_000, interval=0.001)
+    list(pacer.batches([bytes(1000)] * 20))
+    # 8 Mbit/s of 1000 byte packets are 1000 packets per second.
+    assert pacer.stats.elapsed == pytest.approx(0.02, rel=0.2)
+
+
+@pytest.mark.parametrize("pps", [10_000, 100_000])
+def test_rate_accuracy(pps):
+    pacer = Pacer(pps=pps)
+    count = pps // 10
+    start = perf_counter()
+    for batch in pacer.batches(range(count)):
+        pass
+    wall = perf_counter() - start
+    # The last batch ends one interval after its release.
+    assert wall + 0.001 == pytest.approx(count / pps, rel=0.1)
+    assert pacer.stats.pps == pytest.approx(pps, rel=0.1)
+    stats = pacer.stats
+    assert 0 <= stats.lateness <= stats.max_lateness and stats.jitter >= 0
+
+
+def test_catch_up_limited_to_burst():
+    pacer = Pacer(pps=1000, interval=0.001, burst=0.005)
+    pacer.wait()
+    sleep(0.05)
+    immediate = 0
+    while pacer.delay() == 0 and immediate < 50:
+        pacer.wait()
+        immediate += 1
+    # One batch due now plus at most the bucket depth of 5 more.
+    assert 1 <= immediate <= 7
+
+
+def test_delay_and_reset():
+    pacer = Pacer(pps=100, interval=0.01)
+    assert pacer.delay() == 0
+    pacer.wait()
+    assert 0 < pacer.delay() <= 0.01
+    assert pacer.wait() >= 0
+    pacer.reset()
+    assert pacer.delay() == 0 and pacer.stats == PacerStats()
+    assert PacerStats().pps == PacerStats().bps == 0.0
+
+
+def test_empty():
+    pacer = Pacer(pps=1000)
+    assert list(pacer.batches([])) == []
+    assert pacer.stats.batches == 0 and pacer.stats.elapsed == 0.0
@@ -0,0 +1,57 @@
+from protohdr import *
+
+from socket import IPPROTO_TCP
+
+import pytest
+
+
+HEADERS = [
+    IPHeader(version=4, header_len=20, tos=0, total_len=60, identifier=0x1234,
+             flags=IPFlag.DONT_FRAG, frag_offset=0, ttl=64, protocol=IPPROTO_TCP,
+             checksum=0xABCD, src_addr="10.0.0.1", dst_addr="10.0.0.2"),
+    TCPHeader(src_port=0x1234, dst_port=80, seq_num=0x12345678, ack_num=0,
+              data_offset=32, flags=TCPFlag.SYN, window=0xFFFF, checksum=0,
+              urg_ptr=0, options=TCPOption.mss(1460), data=b"hello"),
+    TCPHeader(src_port=1, dst_port=2, seq_num=3, ack_num=4, data_offset=40,
+              flags=TCPFlag.ACK, window=5, checksum=6, urg_ptr=7,
+              options=TCPOption.nop() * 4 + TCPOption.ts(1, 2) + TCPOption.sack(3, 4)),
+    UDPHeader(src_port=5353, dst_port=53, header_len=12, checksum=0, data=b"abcd"),
+    ICMPHeader(type=ICMPMessage.ECHO, code=0, checksum=0, identifier=7, seq_num=1,
+               data=ICMPPayload.echo(b"x" * 56)),
+    IPv6Header(version=6, traffic_class=0, flow_label=0x12345, payload_len=0,
+               next_header=IPPROTO_TCP, hop_limit=64, src_addr="2001:db8::1",
+               dst_addr="2001:db8::2"),
+]
+
+
+@pytest.mark.parametrize("hdr", HEADERS, ids=lambda h: type(h).__name__)
+@pytest.mark.parametrize("offset", [0, 3])
+def test_pack_into_matches_bytes(hdr, offset):
+    data = bytes(hdr)
+    buf = bytearray(b"\xee" * (offset + len(data) + 2))
+    assert hdr.pack_into(buf, offset) == len(data)
+    assert buf[offset:offset + len(data)] == data
+    assert buf[:offset] == b"\xee" * offset and buf[-2:] == b"\xee\xee"
+
+    view = memoryview(bytearray(len(data) + offset))
+    hdr.pack_into(view, offset)
+    assert view[offset:] == data
+
+
+@pytest.mark.parametrize("hdr", HEADERS, ids=lambda h: type(h).__name__)
+def test_pack_into_without_room(hdr):
+    buf = bytearray(len(hdr))
+    with pytest.raises(ValueError):
+        hdr.pack_into(buf, 1)
+    with pytest.raises(ValueError):
+        hdr.pack_into(buf, -1)
+    assert buf == bytes(len(hdr))
+
+
+def test_check_helpers():
+    check_room(bytearray(4), 1, 3)
+    check_avail(b"abcd", 0, 4, "test header")
+    with pytest.raises(ValueError, match="do not fit"):
+        check_room(bytearray(4), 2, 3)
+    with pytest.raises(ValueError, match="truncated test header"):
+        check_avail(b"abcd", 1, 4, "test header")
@@ -0,0 +1,155 @@
+from protohdr import *
+
+from socket import IPPROTO_ICMP, IPPROTO_ICMPV6, IPPROTO_TCP, IPPROTO_UDP
+
+import pytest
+
+
+def ip_header(v6: bool, protocol: int = IPPROTO_TCP) -> IPHeader | IPv6Header:
+    if v6:
+        return IPv6Header(version=6, traffic_class=0, flow_label=0, payload_len=0,
+                          next_header=0, hop_limit=64, src_addr="2001:db8::1",
+                          dst_addr="2001:db8::2")
+    return IPHeader(version=4, header_len=0, tos=0, total_len=0, identifier=1,
+                    flags=IPFlag.DONT_FRAG, frag_offset=0, ttl=64, protocol=protocol,
+                    checksum=0, src_addr="10.0.0.1", dst_addr="10.0.0.2")
+
+
+def verified(segment: bytes, ip: IPHeader | IPv6Header, protocol: int) -> bool:
+    # Summing a valid segment gives zero, which UDP reports as all ones.
+    return inet_transport_checksum(segment, ip) == (0xFFFF if protocol == IPPROTO_UDP else 0)
+
+
+def transport_header(protocol: int, data: bytes = b"odd") -> Header:
+    if protocol == IPPROTO_TCP:
+        return TCPHeader(src_port=1000, dst_port=80, seq_num=1, ack_num=0, data_offset=0,
+                         flags=TCPFlag.SYN, window=1024, checksum=0xFFFF, urg_ptr=0,
+                         options=TCPOption.mss(1460), data=data)
+    if protocol == IPPROTO_UDP:
+        return UDPHeader(src_port=1000, dst_port=53, header_len=0, checksum=0xFFFF, data=data)
+    return ICMPHeader(type=ICMPMessage.ECHO, code=0, checksum=0xFFFF, identifier=7,
+                      seq_num=1, data=data)
+
+
+class TaggedTCPHeader(TCPHeader):
+    __slots__ = ()
+
+
+@pytest.mark.parametrize("data", [b"", b"odd", b"even"])
+@pytest.mark.parametrize("protocol", [IPPROTO_TCP, IPPROTO_UDP, IPPROTO_ICMP])
+def test_ipv4_fill_in(protocol, data):
+    ip, transport = ip_header(False, protocol), transport_header(protocol, data)
+    pkt = ip / transport
+    raw = bytes(pkt)
+    assert len(raw) == len(pkt)
+    ip_len = len(ip)
+    assert ip.header_len == ip_len == 20 and ip.total_len == len(raw)
+    assert inet_checksum(raw[:ip_len]) == 0
+    segment = raw[ip_len:]
+    if protocol == IPPROTO_ICMP:
+        assert inet_checksum(segment) == 0
+    else:
+        assert verified(segment, ip, protocol)
+    if protocol == IPPROTO_TCP:
+        assert transport.data_offset == 32
+    elif protocol == IPPROTO_UDP:
+        assert transport.header_len == len(segment)
+    # The filled-in values are assigned to the headers.
+    assert raw == bytes(ip) + bytes(transport)
+
+
+@pytest.mark.parametrize("protocol", [IPPROTO_TCP, IPPROTO_UDP, IPPROTO_ICMP])
+def test_ipv6_fill_in(protocol):
+    ip, transport = ip_header(True), transport_header(protocol)
+    raw = bytes(ip / transport)
+    assert ip.payload_len == len(raw) - 40
+    assert ip.next_header == ip.protocol == (IPPROTO_ICMPV6 if protocol == IPPROTO_ICMP
+                                             else protocol)
+    assert verified(raw[40:], ip, protocol)
+    assert raw == bytes(ip) + bytes(transport)
+
+
+def test_ipv6_extension_chain():
+    ip = ip_header(True)
+    ip.extensions = (IPv6ExtHeader(ext_type=IPv6ExtType.HOP_BY_HOP, next_header=0),
+                     IPv6FragmentHeader(next_header=0, frag_offset=0, more_frags=0,
+                                        identification=9),
+                     IPv6ExtHeader(ext_type=IPv6ExtType.DEST_OPTIONS, next_header=0))
+    raw = bytes(ip / transport_header(IPPROTO_UDP))
+    assert ip.next_header == IPv6ExtType.HOP_BY_HOP
+    assert [ext.next_header for ext in ip.extensions] == [
+        IPv6ExtType.FRAGMENT, IPv6ExtType.DEST_OPTIONS, IPPROTO_UDP]
+    ext_len = sum(len(ext) for ext in ip.extensions)
+    assert ip.payload_len == len(raw) - 40
+    assert verified(raw[40 + ext_len:], ip, IPPROTO_UDP)
+    decoded, udp = decode_packet(raw)
+    assert [(ext.ext_type, ext.next_header) for ext in decoded.extensions] == [
+        (ext.ext_type, ext.next_header) for ext in ip.extensions]
+    assert udp.dst_port == 53
+
+
+def test_keep():
+    ip, tcp = ip_header(False), transport_header(IPPROTO_TCP)
+    ip.total_len = 1234
+    tcp.data_offset = 20
+    raw = bytes(Packet(ip, tcp, ip_keep=("total_len", "checksum"),
+                       transport_keep=("data_offset", "checksum")))
+    assert (ip.total_len, ip.checksum, tcp.data_offset, tcp.checksum) == (1234, 0, 20, 0xFFFF)
+    assert raw[2:4] == (1234).to_bytes(2, "big") and raw[10:12] == bytes(2)
+    assert raw[20 + 12] >> 4 == 5 and raw[20 + 16:20 + 18] == b"\xff\xff"
+    # Fields not kept are still filled in.
+    assert ip.header_len == 20
+
+
+def test_unsupported_headers():
+    ip, tcp = ip_header(False), transport_header(IPPROTO_TCP)
+    with pytest.raises(TypeError):
+        Packet(tcp, tcp)
+    with pytest.raises(TypeError):
+        Packet(ip, ip)
+    with pytest.raises(TypeError):
+        ip / 1
+    assert ip.__truediv__("tcp") is NotImplemented
+    assert ip_header(True).__truediv__(b"") is NotImplemented
+    with pytest.raises(ValueError):
+        Packet(ip, tcp, ip_keep=("ttl",))
+    with pytest.raises(ValueError):
+        Packet(ip, tcp, transport_keep=("header_len",))
+
+
+def test_transport_subclass():
+    for v6 in (False, True):
+        ip = ip_header(v6)
+        tcp = TaggedTCPHeader(src_port=1000, dst_port=80, seq_num=1, ack_num=0, data_offset=0,
+                              flags=TCPFlag.SYN, window=1024, checksum=0, urg_ptr=0,
+                              options=TCPOption.mss(1460))
+        pkt = ip / tcp
+        raw = bytes(pkt)
+        assert raw == bytes(ip / transport_header(IPPROTO_TCP, b""))
+        assert tcp.data_offset == 32
+        assert Packet(ip, tcp, transport_keep=("data_offset",)).transport is tcp
+
+
+def test_pack_into_offset():
+    pkt = ip_header(False, IPPROTO_UDP) / transport_header(IPPROTO_UDP)
+    buf = bytearray(len(pkt) + 3)
+    assert pkt.pack_into(buf, 3) == len(pkt)
+    assert buf[3:] == bytes(pkt)
+    with pytest.raises(ValueError):
+        pkt.pack_into(buf, 4)
+
+
+@pytest.mark.parametrize("v6", [False, True])
+def test_fill_in_only(v6):
+    ip, udp = ip_header(v6, IPPROTO_UDP), transport_header(IPPROTO_UDP)
+    assert Packet(ip, udp).fill_in() == (len(ip), 11)
+    # Lengths as pack_into() fills them in, checksums left alone.
+    assert udp.header_len == 11 and udp.checksum == 0xFFFF
+    if v6:
+        assert ip.payload_len == 11 and ip.next_header == IPPROTO_UDP
+    else:
+        assert ip.total_len == 31 and ip.header_len == 20 and ip.checksum == 0
+    # Packing then only changes the checksums.
+    filled = bytes(ip)
+    bytes(ip / udp)
+    assert bytes(ip)[:10] == filled[:10]
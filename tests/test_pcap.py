@@ -0,0 +1,158 @@
+from protohdr import *
+
+from socket import IPPROTO_TCP, IPPROTO_UDP, inet_aton
+from struct import pack
+
+import pytest
+
+
+TCP_PACKET = pack("!BBHHHBBH4s4s", 0x45, 0, 44, 0x1234, 0x4000, 64, IPPROTO_TCP, 0,
+                  inet_aton("192.0.2.1"), inet_aton("198.51.100.2")) \
+    + pack("!HHIIHHHH", 40000, 443, 0x01020304, 0, 6 << 12 | TCPFlag.SYN, 1024, 0, 0) \
+    + TCPOption.mss(1460)
+UDP_PACKET = pack("!BBHHHBBH4s4s", 0x45, 0, 32, 0xBEEF, 0x2000 | 3, 17, IPPROTO_UDP, 0,
+                  inet_aton("10.0.0.1"), inet_aton("10.0.0.2")) \
+    + pack("!HHHH", 53, 5353, 12, 0) + b"dns!"
+MACS = bytes(range(12))
+
+
+def known_capture(order: str = "<", nanosecond: bool = False) -> bytes:
+    """ Classic Ethernet pcap file: TCP, VLAN tagged UDP, ARP and IPv6. """
+    records = [
+        MACS + b"\x08\x00" + TCP_PACKET,
+        MACS + b"\x81\x00\x00\x05\x08\x00" + UDP_PACKET,
+        MACS + b"\x08\x06" + bytes(28),
+        MACS + b"\x86\xdd" + b"\x60" + bytes(39),
+    ]
+    magic = 0xA1B23C4D if nanosecond else 0xA1B2C3D4
+    data = pack(order + "IHHiIII", magic, 2, 4, 0, 0, 0xFFFF, LinkType.ETHERNET)
+    for i, record in enumerate(records):
+        data += pack(order + "IIII", 1_700_000_000 + i, 250 * i, len(record), len(record))
+        data += record
+    return data
+
+
+@pytest.mark.parametrize("order", ["<", ">"])
+@pytest.mark.parametrize("nanosecond", [False, True])
+def test_read_known_capture(tmp_path, order, nanosecond):
+    path = tmp_path / "known.pcap"
+    path.write_bytes(known_capture(order, nanosecond))
+    with PcapReader(path) as reader:
+        records = [(timestamp, bytes(data)) for timestamp, data in reader]
+        packets = [(timestamp, ip, transport) for timestamp, ip, transport in reader.packets()]
+        assert reader.linktype == LinkType.ETHERNET and reader.skipped == 2
+    scale = 1 if nanosecond else 1000
+    assert [timestamp for timestamp, _ in records] == [
+        (1_700_000_000 + i) * 1_000_000_000 + 250 * i * scale for i in range(4)]
+    assert records[0][1][14:] == TCP_PACKET
+
+    (_, ip, tcp), (_, ip2, udp) = packets
+    assert (ip.total_len, ip.identifier, ip.flags, ip.frag_offset) == (44, 0x1234, IPFlag.DONT_FRAG, 0)
+    assert (ip.src_addr, ip.dst_addr, ip.protocol) == ("192.0.2.1", "198.51.100.2", IPPROTO_TCP)
+    assert (tcp.src_port, tcp.dst_port, tcp.seq_num, tcp.flags) == (40000, 443, 0x01020304, TCPFlag.SYN)
+    assert bytes(tcp.options) == TCPOption.mss(1460)
+    # A later fragment carries no transport header.
+    assert (ip2.identifier, ip2.flags, ip2.frag_offset) == (0xBEEF, IPFlag.MORE_FRAGS, 3)
+    assert udp is None
+
+
+@pytest.mark.parametrize("writer", [PcapWriter, PcapNgWriter])
+def test_round_trip(tmp_path, writer):
+    path = tmp_path / "out.cap"
+    timestamps = [1_700_000_000_123_456_000 + i for i in range(3)]
+    pkt = Packet(*decode_packet(TCP_PACKET))
+    fragment, _ = decode_packet(UDP_PACKET)
+    with writer(path, buffer_size=64) as out:
+        out.write(TCP_PACKET, timestamps[0])
+        assert out.write_many([pkt, fragment], timestamps[1:]) == 2
+    with PcapReader(path) as reader:
+        records = [(timestamp, bytes(data)) for timestamp, data in reader]
+        decoded = [(ip, transport) for _, ip, transport in reader.packets()]
+        assert reader.linktype == LinkType.RAW and reader.skipped == 0
+    if writer is PcapWriter:
+        # Microsecond resolution.
+        timestamps = [timestamp // 1000 * 1000 for timestamp in timestamps]
+    assert records == list(zip(timestamps, [TCP_PACKET, bytes(pkt), bytes(fragment)]))
+    ip, tcp = decoded[1]
+    assert ip == pkt.ip and bytes(ip) + bytes(tcp) == bytes(pkt)
+    assert decoded[2] == (fragment, None)
+
+
+@pytest.mark.parametrize("writer", [PcapWriter, PcapNgWriter])
+def test_snaplen(tmp_path, writer):
+    path = tmp_path / "snap.cap"
+    with writer(path, snaplen=30) as out:
+        out.write(TCP_PACKET, 0)
+        out.write(b"short", 0)
+    with PcapReader(path) as reader:
+        assert [bytes(data) for _, data in reader] == [TCP_PACKET[:30], b"short"]
+        # The truncated TCP header does not decode.
+        assert [transport for _, _, transport in reader.packets()] == []
+        assert reader.skipped == 2
+
+
+def test_not_a_capture(tmp_path):
+    path = tmp_path / "bad.cap"
+    path.write_bytes(b"\x00" * 32)
+    with PcapReader(path) as reader:
+        with pytest.raises(ValueError):
+            list(reader)
+    path.write_bytes(known_capture()[:-10])
+    with PcapReader(path) as reader:
+        with pytest.raises(ValueError):
+            list(reader)
+
+
+def test_truncated_file_header(tmp_path):
+    path = tmp_path / "short.cap"
+    for data in (b"", b"\xd4\xc3", known_capture()[:20]):
+        path.write_bytes(data)
+        with pytest.raises(ValueError, match="truncated pcap file header"):
+            with PcapReader(path) as reader:
+                list(reader)
+    # Files too short to map are closed right away.
+    path.write_bytes(b"")
+    with open(path, "rb") as file:
+        with pytest.raises(ValueError, match="truncated pcap file header"):
+            PcapReader(file)
+        assert file.closed
+
+
+def test_writer_is_abstract():
+    from protohdr._pcap import _Writer
+    with pytest.raises(TypeError):
+        _Writer("unused", 0xFFFF, 0)
+
+
+def test_scapy_interop(tmp_path):
+    scapy = pytest.importorskip("scapy.all")
+    frames = [
+        scapy.Ether() / scapy.IP(src="192.0.2.9", dst="192.0.2.10", id=0x4321, flags="DF", ttl=7)
+        / scapy.TCP(sport=1234, dport=80, seq=99, flags="SA"),
+        scapy.Ether() / scapy.IP(src="192.0.2.9", dst="192.0.2.11", id=2, flags="MF")
+        / scapy.UDP(sport=1, dport=2) / b"payload",
+    ]
+    for name in ("scapy.pcap", "scapy.pcapng"):
+        path = tmp_path / name
+        if name.endswith("ng"):
+            with scapy.PcapNgWriter(str(path)) as out:
+                for frame in frames:
+                    out.write(frame)
+        else:
+            scapy.wrpcap(str(path), frames)
+        with PcapReader(path) as reader:
+            packets = [(ip, transport) for _, ip, transport in reader.packets()]
+        for (ip, transport), frame in zip(packets, frames):
+            assert bytes(ip) == bytes(frame[scapy.IP])[:20]
+            assert (ip.identifier, int(ip.flags), ip.ttl, ip.total_len) == (
+                frame[scapy.IP].id, int(frame[scapy.IP].flags), frame[scapy.IP].ttl,
+                len(frame[scapy.IP]))
+            assert transport.src_port == frame[scapy.IP].payload.sport
+            assert inet_checksum(bytes(ip)) == 0
+
+    # And the other way around.
+    path = tmp_path / "ours.pcapng"
+    with PcapNgWriter(path) as out:
+        out.write(TCP_PACKET, 1_000_000_000)
+    packet, = scapy.rdpcap(str(path))
+    assert (packet.id, int(packet.flags), packet.len, packet.dport) == (0x1234, 2, 44, 443)
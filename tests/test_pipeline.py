@@ -0,0 +1,130 @@
+from protohdr import *
+
+from collections import Counter
+from dataclasses import replace
+from ipaddress import IPv4Network
+from socket import IPPROTO_ICMP, IPPROTO_TCP, IPPROTO_UDP
+
+import pytest
+
+
+def headers(protocol: int):
+    ip = IPHeader(version=4, header_len=20, tos=0, total_len=0, identifier=100, flags=0,
+                  frag_offset=0, ttl=64, protocol=protocol, checksum=0,
+                  src_addr="10.255.0.1", dst_addr="0.0.0.0")
+    if protocol == IPPROTO_TCP:
+        transport = TCPHeader(src_port=40000, dst_port=0, seq_num=0xFFFFFFF0, ack_num=0,
+                              data_offset=0, flags=TCPFlag.SYN, window=1024, checksum=0,
+                              urg_ptr=0, options=TCPOption.mss(1460))
+    elif protocol == IPPROTO_UDP:
+        transport = UDPHeader(src_port=40000, dst_port=0, header_len=0, checksum=0, data=b"x")
+    else:
+        transport = ICMPHeader(type=ICMPMessage.ECHO, code=0, checksum=0, identifier=9,
+                               seq_num=5, data=b"ping")
+    return ip, transport
+
+
+def expected_packet(ip, transport, addr, port, n):
+    ip = replace(ip, identifier=(ip.identifier + n) & 0xFFFF, dst_addr=addr)
+    if isinstance(transport, TCPHeader):
+        transport = replace(transport, dst_port=port, seq_num=(transport.seq_num + n) & 0xFFFFFFFF)
+    elif isinstance(transport, UDPHeader):
+        transport = replace(transport, dst_port=port)
+    else:
+        transport = replace(transport, seq_num=(transport.seq_num + n) & 0xFFFF)
+    return bytes(Packet(ip, transport))
+
+
+def test_shard_range():
+    assert [shard_range(10, 3, i) for i in range(3)] == [range(0, 3), range(3, 6), range(6, 10)]
+    assert [len(shard_range(2, 4, i)) for i in range(4)] == [0, 1, 0, 1]
+    with pytest.raises(ValueError):
+        shard_range(10, 3, 3)
+
+
+def test_ring():
+    ring = ShmRing(3, 4)
+    try:
+        peer = ShmRing.attach(ring.name)
+        assert peer.slot_size == 4
+        for i in range(3):
+            slot = ring.reserve()
+            slot[:] = bytes([i]) * 4
+            slot.release()
+            ring.commit()
+        assert ring.reserve() is None and len(peer) == 3
+        views = peer.peek(2)
+        assert [bytes(view) for view in views] == [bytes(4), b"\x01" * 4]
+        for view in views:
+            view.release()
+        peer.release(2)
+        assert len(ring) == 1 and ring.reserve() is not None
+        assert not peer.closed
+        ring.mark_closed()
+        assert peer.closed
+        peer.close()
+    finally:
+        ring.close()
+    with pytest.raises(ValueError):
+        ShmRing(0, 4)
+
+
+@pytest.mark.parametrize("protocol", [IPPROTO_TCP, IPPROTO_UDP, IPPROTO_ICMP])
+def test_single_worker_numbering(protocol):
+    ip, transport = headers(protocol)
+    ports = [80, 443]
+    with PacketPipeline(ip, transport, IPv4Network("10.0.0.0/29"), ports, workers=1,
+                        slots=4, context="fork") as pipe:
+        assert len(pipe) == 16
+        packets = list(pipe.packets())
+    expected = [expected_packet(ip, transport, f"10.0.0.{i // 2}", ports[i % 2], i)
+                for i in range(16)]
+    assert packets == expected
+
+
+@pytest.mark.parametrize("workers", [2, 3])
+def test_workers_use_own_blocks(workers):
+    ip, transport = headers(IPPROTO_TCP)
+    addresses = ["192.0.2.1", "192.0.2.2", "192.0.2.3", "192.0.2.4", "192.0.2.5"]
+    with PacketPipeline(ip, transport, addresses, [22, 80], workers=workers,
+                        context="fork") as pipe:
+        packets = [decode_packet(pkt) for pkt in pipe.packets()]
+    targets = sorted((hdr.dst_addr, tcp.dst_port) for hdr, tcp in packets)
+    assert targets == sorted((addr, port) for addr in addresses for port in (22, 80))
+    ids, seqs = [], []
+    for index in range(workers):
+        count = len(shard_range(len(packets), workers, index))
+        ids += shard_range(1 << 16, workers, index)[:count]
+        seqs += shard_range(1 << 32, workers, index)[:count]
+    assert sorted(hdr.identifier for hdr, _ in packets) == sorted(
+        (ip.identifier + n) & 0xFFFF for n in ids)
+    assert sorted(tcp.seq_num for _, tcp in packets) == sorted(
+        (transport.seq_num + n) & 0xFFFFFFFF for n in seqs)
+    for hdr, tcp in packets:
+        assert inet_checksum(bytes(hdr)) == 0
+
+
+def test_identifiers_wrap_within_block():
+    ip, transport = headers(IPPROTO_ICMP)
+    ip.identifier = 0
+    per_worker = (1 << 15) + 50
+    with PacketPipeline(ip, transport, range(2 * per_worker), workers=2,
+                        context="fork") as pipe:
+        counts = Counter(decode_packet(pkt)[0].identifier for pkt in pipe.packets())
+    twice = {i for i, n in counts.items() if n == 2}
+    assert set(counts.values()) == {1, 2} and len(counts) == 1 << 16
+    # Each worker starts over at the beginning of its own block.
+    assert twice == set(range(50)) | set(range(1 << 15, (1 << 15) + 50))
+
+
+def test_errors():
+    ip, transport = headers(IPPROTO_UDP)
+    with pytest.raises(ValueError):
+        PacketPipeline(ip, transport, ["10.0.0.1"], ports=())
+    with pytest.raises(ValueError):
+        PacketPipeline(ip, transport, ["10.0.0.1"], workers=(1 << 16) + 1)
+    pipe = PacketPipeline(ip, transport, ["10.0.0.1"], workers=1, context="fork")
+    with pipe:
+        with pytest.raises(RuntimeError):
+            pipe.start()
+        assert list(pipe.packets()) == [expected_packet(ip, transport, "10.0.0.1", 0, 0)]
@@ -0,0 +1,120 @@
+from protohdr import *
+
+from socket import IPPROTO_ICMP, IPPROTO_TCP
+
+import pytest
+
+
+KEY = bytes(range(16))
+
+
+def probe(codec: ProbeCodec, dst_addr: str, dst_port: int = 80):
+    ip = IPHeader(version=4, header_len=20, tos=0, total_len=0, identifier=1, flags=0,
+                  frag_offset=0, ttl=64, protocol=IPPROTO_TCP, checksum=0,
+                  src_addr="10.0.0.1", dst_addr=dst_addr)
+    tcp = TCPHeader(src_port=0, dst_port=dst_port, seq_num=0, ack_num=0, data_offset=0,
+                    flags=TCPFlag.SYN, window=1024, checksum=0, urg_ptr=0)
+    codec.encode(ip, tcp)
+    return ip, tcp
+
+
+def answer(ip: IPHeader, tcp: TCPHeader, ack_num: int | None = None) -> bytes:
+    """ SYN-ACK answering a probe, as received. """
+    reply_ip = IPHeader(version=4, header_len=20, tos=0, total_len=0, identifier=0, flags=0,
+                        frag_offset=0, ttl=60, protocol=IPPROTO_TCP, checksum=0,
+                        src_addr=ip.dst_addr, dst_addr=ip.src_addr)
+    reply = TCPHeader(src_port=tcp.dst_port, dst_port=tcp.src_port, seq_num=12345,
+                      ack_num=(tcp.seq_num + 1) & 0xFFFFFFFF if ack_num is None else ack_num,
+                      data_offset=0, flags=TCPFlag.SYN | TCPFlag.ACK, window=1024,
+                      checksum=0, urg_ptr=0)
+    return bytes(reply_ip / reply)
+
+
+def test_deterministic_per_key():
+    a, b = ProbeCodec(KEY), ProbeCodec(KEY)
+    assert a.tcp("192.0.2.1", 80) == b.tcp("192.0.2.1", 80)
+    assert a.icmp("192.0.2.1") == b.icmp("192.0.2.1")
+    assert ProbeCodec(b"other key").tcp("192.0.2.1", 80) != a.tcp("192.0.2.1", 80)
+    assert ProbeCodec().key != ProbeCodec().key
+    assert a.tcp("192.0.2.1", 80) != a.tcp("192.0.2.1", 81) != a.tcp("192.0.2.2", 81)
+
+
+def test_field_ranges():
+    codec = ProbeCodec(KEY, src_ports=range(40000, 40010))
+    ports = set()
+    for i in range(1000):
+        src_port, seq_num = codec.tcp(f"10.0.{i // 256}.{i % 256}", 443)
+        identifier, icmp_seq = codec.icmp(f"10.0.{i // 256}.{i % 256}")
+        assert 0 <= seq_num <= 0xFFFFFFFF and 0 <= identifier <= 0xFFFF and 0 <= icmp_seq <= 0xFFFF
+        ports.add(src_port)
+    assert ports == set(range(40000, 40010))
+
+
+def test_tcp_replies():
+    codec = ProbeCodec(KEY)
+    for i in range(100):
+        ip, tcp = probe(codec, f"198.51.100.{i}", 80 + i)
+        reply = answer(ip, tcp)
+        assert codec.check(*decode_packet(reply))
+        assert codec.check(*view_packet(reply))
+        # Replies must acknowledge seq_num + 1.
+        assert not codec.check(*decode_packet(answer(ip, tcp, tcp.seq_num)))
+    assert not ProbeCodec(b"other key").check(*decode_packet(reply))
+
+
+def test_tcp_reply_from_other_target():
+    codec = ProbeCodec(KEY)
+    ip, tcp = probe(codec, "198.51.100.1")
+    ip.dst_addr = "198.51.100.2"
+    assert not codec.check(*decode_packet(answer(ip, tcp)))
+    ip, tcp = probe(codec, "198.51.100.1", 80)
+    tcp.dst_port = 81
+    assert not codec.check(*decode_packet(answer(ip, tcp)))
+
+
+def test_icmp_replies():
+    codec = ProbeCodec(KEY)
+    for addr in ("203.0.113.7", "2001:db8::7"):
+        v6 = ":" in addr
+        if v6:
+            ip = IPv6Header(version=6, traffic_class=0, flow_label=0, payload_len=0,
+                            next_header=0, hop_limit=64, src_addr="2001:db8::1", dst_addr=addr)
+        else:
+            ip = IPHeader(version=4, header_len=20, tos=0, total_len=0, identifier=1, flags=0,
+                          frag_offset=0, ttl=64, protocol=IPPROTO_ICMP, checksum=0,
+                          src_addr="10.0.0.1", dst_addr=addr)
+        echo = ICMPHeader(type=ICMPMessage.ECHO, code=0, checksum=0, identifier=0, seq_num=0,
+                          data=b"ping")
+        codec.encode(ip, echo)
+        assert (echo.identifier, echo.seq_num) == codec.icmp(addr)
+        ip.src_addr, ip.dst_addr = ip.dst_addr, ip.src_addr
+        echo.type = ICMPMessage.ECHO_REPLY
+        reply = bytes(ip / echo)
+        assert codec.check(*decode_packet(reply))
+        if not v6:
+            assert codec.check(*view_packet(reply))
+        echo.seq_num ^= 1
+        assert not codec.check(*decode_packet(bytes(ip / echo)))
+
+
+def test_other_protocols():
+    codec = ProbeCodec(KEY)
+    ip, _ = probe(codec, "192.0.2.1")
+    udp = UDPHeader(src_port=1, dst_port=2, header_len=0, checksum=0, data=b"")
+    assert not codec.check(ip, udp)
+    with pytest.raises(TypeError):
+        codec.encode(ip, udp)
+
+
+@pytest.mark.parametrize("ports", [range(0), range(1, 100, 2), range(-1, 10), range(65000, 65537)])
+def test_invalid_port_range(ports):
+    with pytest.raises(ValueError):
+        ProbeCodec(KEY, ports)
+
+
+def test_stateless():
+    codec = ProbeCodec(KEY)
+    assert not hasattr(codec, "__dict__")
+    for i in range(1000):
+        probe(codec, f"10.1.{i // 256}.{i % 256}")
+    assert codec.tcp("10.1.0.0", 80) == ProbeCodec(KEY).tcp("10.1.0.0", 80)
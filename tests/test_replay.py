@@ -0,0 +1,156 @@
+from protohdr import *
+
+from dataclasses import replace
+from ipaddress import IPv4Address
+from random import Random
+from socket import IPPROTO_ICMP, IPPROTO_TCP, IPPROTO_UDP
+
+import pytest
+
+
+def packet(rng: Random, protocol: int, udp_checksum: bool = True) -> Packet:
+    ip = IPHeader(version=4, header_len=20, tos=0, total_len=0, identifier=rng.getrandbits(16),
+                  flags=IPFlag.DONT_FRAG, frag_offset=0, ttl=rng.randrange(1, 256),
+                  protocol=protocol, checksum=0, src_addr=f"10.0.{rng.randrange(4)}.1",
+                  dst_addr=f"192.168.{rng.randrange(4)}.{rng.randrange(256)}")
+    data = rng.randbytes(rng.randrange(16))
+    if protocol == IPPROTO_TCP:
+        transport = TCPHeader(src_port=rng.randrange(1024, 1030), dst_port=rng.choice((80, 443)),
+                              seq_num=rng.getrandbits(32), ack_num=0, data_offset=0,
+                              flags=TCPFlag.ACK, window=1024, checksum=0, urg_ptr=0, data=data)
+    elif protocol == IPPROTO_UDP:
+        transport = UDPHeader(src_port=rng.randrange(1024, 1030), dst_port=53, header_len=0,
+                              checksum=0, data=data)
+    else:
+        transport = ICMPHeader(type=ICMPMessage.ECHO, code=0, checksum=0, identifier=1,
+                               seq_num=2, data=data)
+    if protocol == IPPROTO_UDP and not udp_checksum:
+        return Packet(ip, transport, transport_keep=("checksum",))
+    return Packet(ip, transport)
+
+
+RULES = dict(
+    src_addr={"10.0.0.1": "172.16.0.1", "10.0.1.1": IPv4Address("172.16.0.2")},
+    dst_addr=lambda addr: addr.replace("192.168.", "10.99."),
+    src_port=lambda port: port + 30000,
+    dst_port={53: 5353, 80: 8080},
+    ttl=lambda ttl: max(1, ttl - 1),
+    identifier=0xABCD,
+)
+
+
+def expected(pkt: Packet) -> bytes:
+    """ `pkt` with RULES applied, built from scratch. """
+    ip, transport = pkt.ip, pkt.transport
+    src = {"10.0.0.1": "172.16.0.1", "10.0.1.1": "172.16.0.2"}.get(ip.src_addr, ip.src_addr)
+    ip = replace(ip, src_addr=src, dst_addr=RULES["dst_addr"](ip.dst_addr),
+                 ttl=RULES["ttl"](ip.ttl), identifier=0xABCD)
+    if not isinstance(transport, ICMPHeader):
+        transport = replace(transport, src_port=transport.src_port + 30000,
+                            dst_port=RULES["dst_port"].get(transport.dst_port, transport.dst_port))
+    return bytes(Packet(ip, transport, transport_keep=pkt.transport_keep))
+
+
+@pytest.mark.parametrize("protocol", [IPPROTO_TCP, IPPROTO_UDP, IPPROTO_ICMP])
+def test_rewrite_matches_rebuilt_packet(protocol):
+    rng = Random(protocol)
+    rewriter = Rewriter(**RULES)
+    for _ in range(300):
+        pkt = packet(rng, protocol, udp_checksum=rng.random() < 0.8)
+        buf = bytearray(b"\x00" * 3 + bytes(pkt))
+        rewriter.rewrite(buf, 3)
+        assert buf[3:] == expected(pkt)
+
+
+def test_single_rules():
+    rng = Random(1)
+    for name, rule, value in (("ttl", 9, 9), ("identifier", {}, None),
+                              ("dst_port", lambda port: 7, 7)):
+        pkt = packet(rng, IPPROTO_UDP)
+        buf = bytearray(bytes(pkt))
+        Rewriter(**{name: rule}).rewrite(buf)
+        ip, udp = decode_packet(buf)
+        if value is not None:
+            assert getattr(udp if name == "dst_port" else ip, name) == value
+        assert inet_checksum(buf[:20]) == 0
+        assert inet_transport_checksum(buf[20:], ip) == 0xFFFF
+
+
+def test_later_fragment_keeps_ports():
+    pkt = packet(Random(2), IPPROTO_TCP)
+    buf = bytearray(bytes(pkt))
+    buf[6:8] = (IPFlag.MORE_FRAGS << 13 | 4).to_bytes(2, "big")
+    buf[10:12] = bytes(2)
+    buf[10:12] = inet_checksum(buf[:20]).to_bytes(2, "big")
+    before = bytes(buf[20:])
+    Rewriter(src_addr="1.2.3.4", src_port=1).rewrite(buf)
+    assert buf[20:] == before
+    assert inet_checksum(buf[:20]) == 0 and buf[12:16] == bytes((1, 2, 3, 4))
+
+
+def test_truncated_packets():
+    pkt = packet(Random(3), IPPROTO_TCP)
+    data = bytes(pkt)
+    rewriter = Rewriter(dst_addr="10.9.9.9", dst_port=8080)
+    full = bytearray(data)
+    rewriter.rewrite(full)
+    for size in (20, 22, 24, 30, 36, 37, 38):
+        buf = bytearray(data[:size])
+        rewriter.rewrite(buf)
+        # Patched as far as the capture goes; the checksum only if complete.
+        if size >= 38:
+            assert buf == full[:size]
+        else:
+            assert buf[:min(size, 24)] == full[:min(size, 24)]
+
+
+def test_errors():
+    with pytest.raises(ValueError):
+        Rewriter(ttl=1).rewrite(bytearray(19))
+    with pytest.raises(ValueError):
+        Rewriter(ttl=1).rewrite(bytearray(b"\x60" + bytes(39)))
+    data = bytes(packet(Random(4), IPPROTO_UDP))
+    for rewriter in (Rewriter(ttl=256), Rewriter(dst_port=0x10000)):
+        buf = bytearray(data)
+        with pytest.raises(ValueError):
+            rewriter.rewrite(buf)
+        assert buf == data
+    # A port out of range leaves the IP fields alone as well.
+    for protocol in (IPPROTO_TCP, IPPROTO_UDP):
+        orig = bytes(packet(Random(4), protocol))
+        for rewriter in (Rewriter(identifier=1, src_port=-1),
+                         Rewriter(dst_addr="1.2.3.4", ttl=9, dst_port=70000)):
+            pkt = bytearray(orig)
+            with pytest.raises(ValueError):
+                rewriter.rewrite(pkt)
+            assert pkt == orig
+    with pytest.raises(ValueError):
+        replay([], list, batch_size=0)
+
+
+def test_replay():
+    rng = Random(5)
+    pkts = [packet(rng, rng.choice((IPPROTO_TCP, IPPROTO_UDP))) for _ in range(100)]
+    records = [(i, memoryview(bytes(pkt))) for i, pkt in enumerate(pkts)]
+    sent = []
+    stats = replay(records, sent.append, Rewriter(**RULES), batch_size=32)
+    assert [len(batch) for batch in sent] == [32, 32, 32, 4]
+    assert [pkt for batch in sent for pkt in batch] == [expected(pkt) for pkt in pkts]
+    assert (stats.packets, stats.calls) == (100, 4)
+    assert stats.nbytes == sum(map(len, sent[0] + sent[1] + sent[2] + sent[3]))
+    # The records themselves are left alone.
+    assert [bytes(data) for _, data in records] == [bytes(pkt) for pkt in pkts]
+
+    sent.clear()
+    stats = replay(records, sent.append)
+    assert [pkt for batch in sent for pkt in batch] == [bytes(data) for _, data in records]
+
+
+def test_replay_paced():
+    records = [(0, bytes(packet(Random(i), IPPROTO_UDP))) for i in range(200)]
+    pacer = Pacer(pps=20_000, interval=0.001)
+    sent = []
+    stats = replay(records, lambda batch: sent.append(len(batch)) or SendStats(calls=2),
+                   pacer=pacer)
+    assert sent == [20] * 10 and stats.calls == 20 and stats.packets == 200
+    assert pacer.stats.elapsed == pytest.approx(0.01, rel=0.5)
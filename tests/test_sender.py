@@ -0,0 +1,170 @@
+from protohdr import *
+from protohdr import _sender
+
+from socket import (
+    AF_INET, AF_INET6, AF_UNIX, IP_HDRINCL, IPPROTO_IP, IPPROTO_RAW, IPPROTO_UDP, SOCK_DGRAM,
+    SOCK_RAW, SOCK_STREAM, socket, socketpair,
+)
+from threading import Thread
+
+import pytest
+
+
+@pytest.fixture(params=["sendmmsg", "sendmsg"])
+def syscall(request, monkeypatch):
+    if request.param == "sendmmsg":
+        if _sender._sendmmsg is None:
+            pytest.skip("no sendmmsg(2)")
+    else:
+        monkeypatch.setattr(_sender, "_sendmmsg", None)
+    return request.param
+
+
+def receive(sock: socket, count: int) -> list[bytes]:
+    return [sock.recv(65536) for _ in range(count)]
+
+
+def udp_packet(identifier: int, dst_port: int = 9, data: bytes = b"data") -> Packet:
+    ip = IPHeader(version=4, header_len=20, tos=0, total_len=0, identifier=identifier, flags=0,
+                  frag_offset=0, ttl=64, protocol=IPPROTO_UDP, checksum=0,
+                  src_addr="127.0.0.1", dst_addr="127.0.0.1")
+    return ip / UDPHeader(src_port=1024, dst_port=dst_port, header_len=0, checksum=0, data=data)
+
+
+def test_send_packet_kinds(syscall):
+    tx, rx = socketpair(AF_UNIX, SOCK_DGRAM)
+    with tx, rx:
+        pkt = udp_packet(1)
+        # Fill in the lengths, as the transport header is sent on its own.
+        bytes(pkt)
+        packets = [b"bytes", bytearray(b"bytearray"), memoryview(b"memoryview"), pkt.transport,
+                   pkt, (b"head", bytearray(b"-"), memoryview(b"payload"))]
+        stats = Sender(tx, batch_size=4).send(packets)
+        expected = [b"bytes", b"bytearray", b"memoryview", bytes(pkt.transport), bytes(pkt),
+                    b"head-payload"]
+        assert receive(rx, len(packets)) == expected
+        assert stats.packets == len(packets)
+        assert stats.nbytes == sum(map(len, expected))
+        assert stats.calls == (2 if syscall == "sendmmsg" else len(packets))
+        assert stats.partial == 0
+
+
+def test_send_bytes_batches(syscall):
+    tx, rx = socketpair(AF_UNIX, SOCK_DGRAM)
+    with tx, rx:
+        packets = [bytes([i]) * (i % 7 + 1) for i in range(50)]
+        stats = Sender(tx, batch_size=16).send(packets)
+        assert receive(rx, 50) == packets
+        assert stats.packets == 50 and stats.nbytes == sum(map(len, packets))
+
+
+def test_send_template(syscall):
+    tx, rx = socketpair(AF_UNIX, SOCK_DGRAM)
+    with tx, rx:
+        pkt = udp_packet(0)
+        bytes(pkt)
+        template = PacketTemplate(pkt.ip, pkt.transport, ("identifier",), ("src_port",))
+        rows = [(i, 2000 + i) for i in range(20)]
+        stats = Sender(tx, batch_size=8).send_template(template, rows)
+        assert receive(rx, 20) == [template.build(*row) for row in rows]
+        assert stats.packets == 20
+
+
+def test_non_blocking_waits(syscall):
+    tx, rx = socketpair(AF_UNIX, SOCK_DGRAM)
+    with tx, rx:
+        tx.setblocking(False)
+        packets = [bytes(1000)] * 2000
+        received = []
+        reader = Thread(target=lambda: received.extend(receive(rx, len(packets))))
+        reader.start()
+        stats = Sender(tx, batch_size=64).send(packets)
+        reader.join()
+        assert len(received) == len(packets) and stats.packets == len(packets)
+
+
+def test_stream_partial_sends_rest(monkeypatch):
+    monkeypatch.setattr(_sender, "_sendmmsg", None)
+    tx, rx = socketpair(AF_UNIX, SOCK_STREAM)
+    with tx, rx:
+        tx.setblocking(False)
+        payload = bytes(range(256)) * 8192
+        received = bytearray()
+
+        def read():
+            while len(received) < 1 + len(payload):
+                received.extend(rx.recv(65536))
+
+        reader = Thread(target=read)
+        reader.start()
+        stats = Sender(tx).send([(b"x", payload)])
+        reader.join()
+        assert received == b"x" + payload
+        assert stats.packets == 1 and stats.nbytes == len(received)
+        assert stats.partial > 0 and stats.calls == stats.partial + 1
+
+
+def test_raw_socket_destination(syscall):
+    try:
+        tx = socket(AF_INET, SOCK_RAW, IPPROTO_RAW)
+    except PermissionError:
+        pytest.skip("raw sockets need privileges")
+    rx = socket(AF_INET, SOCK_DGRAM)
+    with tx, rx:
+        rx.bind(("127.0.0.1", 0))
+        rx.settimeout(5)
+        port = rx.getsockname()[1]
+        packets = [udp_packet(i, port, bytes([i]) * 3) for i in range(10)]
+        Sender(tx, batch_size=4).send([bytes(pkt) for pkt in packets])
+        assert receive(rx, 10) == [bytes([i]) * 3 for i in range(10)]
+
+
+def test_raw_socket_without_header(syscall):
+    try:
+        tx = socket(AF_INET, SOCK_RAW, IPPROTO_UDP)
+    except PermissionError:
+        pytest.skip("raw sockets need privileges")
+    rx = socket(AF_INET, SOCK_DGRAM)
+    with tx, rx:
+        rx.bind(("127.0.0.1", 0))
+        rx.settimeout(5)
+        port = rx.getsockname()[1]
+        # The kernel adds the IP header, so there is no destination in
+        # the packet, even where its bytes look like one.
+        payload = bytes(8) + bytes((127, 0, 0, 1))
+        segment = bytes(UDPHeader(src_port=1024, dst_port=port, header_len=8 + len(payload),
+                                  checksum=0, data=payload))
+        assert not _sender._includes_header(tx)
+        with pytest.raises(OSError):
+            Sender(tx).send([segment])
+        Sender(tx, ("127.0.0.1", 0)).send([segment])
+        assert receive(rx, 1) == [payload]
+        tx.connect(("127.0.0.1", 0))
+        Sender(tx).send([segment])
+        assert receive(rx, 1) == [payload]
+
+
+def test_includes_header():
+    try:
+        sockets = [socket(family, SOCK_RAW, proto) for family, proto in (
+            (AF_INET, IPPROTO_RAW), (AF_INET, IPPROTO_UDP), (AF_INET6, IPPROTO_RAW))]
+    except PermissionError:
+        pytest.skip("raw sockets need privileges")
+    raw, udp, raw6 = sockets
+    with raw, udp, raw6:
+        # IPPROTO_RAW implies the header option.
+        assert _sender._includes_header(raw) and _sender._includes_header(raw6)
+        assert not _sender._includes_header(udp)
+        udp.setsockopt(IPPROTO_IP, IP_HDRINCL, 1)
+        assert _sender._includes_header(udp)
+    with socket(AF_INET, SOCK_DGRAM) as sock:
+        assert not _sender._includes_header(sock)
+
+
+def test_errors():
+    tx, rx = socketpair(AF_UNIX, SOCK_DGRAM)
+    with tx, rx:
+        with pytest.raises(ValueError):
+            Sender(tx, batch_size=0)
+        with pytest.raises(ValueError):
+            Sender(tx).send([[b"x"] * 9])
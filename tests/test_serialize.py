@@ -0,0 +1,42 @@
+from protohdr import *
+
+from socket import IPPROTO_TCP, inet_aton
+from struct import pack
+
+import pytest
+
+
+IP = IPHeader(version=4, header_len=20, tos=0x10, total_len=60, identifier=0x1234,
+              flags=IPFlag.DONT_FRAG, frag_offset=5, ttl=64, protocol=IPPROTO_TCP,
+              checksum=0xBEEF, src_addr="10.0.0.1", dst_addr="10.0.0.2")
+TCP = TCPHeader(src_port=0x1234, dst_port=80, seq_num=0x12345678, ack_num=0x9ABCDEF0,
+                data_offset=32, flags=TCPFlag.SYN | TCPFlag.ECE, window=0xFFFF,
+                checksum=0x4321, urg_ptr=7, options=TCPOption.mss(1460), data=b"data")
+UDP = UDPHeader(src_port=5353, dst_port=53, header_len=12, checksum=0xABCD, data=b"abcd")
+ICMP = ICMPHeader(type=ICMPMessage.ECHO, code=0, checksum=0x1111, identifier=7, seq_num=9,
+                  data=b"ping")
+
+
+def test_ip_bytes():
+    assert bytes(IP) == pack("!BBHHHBBH4s4s", 0x45, 0x10, 60, 0x1234, 0x4000 | 5, 64,
+                             IPPROTO_TCP, 0xBEEF, inet_aton("10.0.0.1"), inet_aton("10.0.0.2"))
+
+
+def test_tcp_bytes():
+    # Options are zero-padded to a 32 byte header.
+    assert bytes(TCP) == pack("!HHIIHHHH", 0x1234, 80, 0x12345678, 0x9ABCDEF0,
+                              8 << 12 | TCPFlag.SYN | TCPFlag.ECE, 0xFFFF, 0x4321, 7) \
+        + TCPOption.mss(1460) + bytes(8) + b"data"
+
+
+def test_udp_and_icmp_bytes():
+    assert bytes(UDP) == pack("!HHHH", 5353, 53, 12, 0xABCD) + b"abcd"
+    assert bytes(ICMP) == pack("!BBHHH", 8, 0, 0x1111, 7, 9) + b"ping"
+
+
+@pytest.mark.parametrize("hdr", [IP, TCP, UDP, ICMP], ids=lambda h: type(h).__name__)
+def test_field_offsets(hdr):
+    data = bytes(hdr)
+    for name, (at, layout, convert) in hdr._field_offsets.items():
+        value = getattr(hdr, name)
+        assert layout.unpack_from(data, at)[0] == (value if convert is None else convert(value))
@@ -0,0 +1,186 @@
+from protohdr import *
+
+from ipaddress import IPv4Network
+from random import Random
+from socket import (
+    AF_INET, AF_UNIX, IPPROTO_ICMP, IPPROTO_IP, IP_HDRINCL, SOCK_DGRAM, SOCK_RAW, socket,
+    socketpair, timeout,
+)
+from threading import Event, Thread
+from time import sleep
+
+import pytest
+
+
+def test_wheel_expires_in_order():
+    wheel = TimerWheel(0.125, 8, now=0.0)
+    for deadline in (0.1, 0.25, 0.3, 0.9):
+        wheel.schedule(deadline, deadline)
+    assert len(wheel) == 4 and wheel.next_tick() == 0.125
+    assert wheel.expire(0.1) == []
+    assert wheel.expire(0.125) == [0.1]
+    assert wheel.expire(0.375) == [0.25, 0.3]
+    assert wheel.expire(0.375) == [] and wheel.next_tick() == 0.5
+    assert wheel.expire(1.0) == [0.9] and len(wheel) == 0
+
+
+def test_wheel_deadlines_beyond_size():
+    wheel = TimerWheel(0.125, 8, now=0.0)
+    # Ticks 2, 10 and 34 share a slot.
+    for deadline in (0.25, 1.25, 4.25):
+        wheel.schedule(deadline, deadline)
+    assert wheel.expire(0.25) == [0.25]
+    for now in (0.5, 1.0, 1.125):
+        assert wheel.expire(now) == []
+    assert wheel.expire(1.25) == [1.25]
+    assert wheel.expire(4.125) == [] and len(wheel) == 1
+    assert wheel.expire(4.25) == [4.25] and len(wheel) == 0
+
+
+def test_wheel_large_jumps():
+    wheel = TimerWheel(0.125, 8, now=0.0)
+    deadlines = [0.125 * i for i in range(1, 100)]
+    for deadline in deadlines:
+        wheel.schedule(deadline, deadline)
+    # One call long after every deadline visits each slot once.
+    assert sorted(wheel.expire(1000.0)) == deadlines and len(wheel) == 0
+    # Deadlines already passed fire on the next tick.
+    wheel.schedule(3.0, "late")
+    assert wheel.expire(1000.0) == [] and wheel.expire(1000.125) == ["late"]
+
+
+def test_wheel_matches_naive():
+    rng = Random(24)
+    wheel = TimerWheel(0.01, 16, now=5.0)
+    pending = []
+    now = 5.0
+    for step in range(2000):
+        for _ in range(rng.randrange(4)):
+            deadline = now + rng.choice((0.001, 0.05, 0.3, 2.0, rng.uniform(0, 1)))
+            wheel.schedule(deadline, (deadline, step))
+            pending.append((deadline, step))
+        now += rng.choice((0.0, 0.004, 0.01, 0.07, 0.5, 3.0))
+        expired = wheel.expire(now)
+        # Up to one tick late, never early.
+        assert all(deadline <= now for deadline, _ in expired)
+        pending = [item for item in pending if item not in expired]
+        assert all(deadline > now - 0.01 for deadline, _ in pending)
+        assert len(wheel) == len(pending)
+
+
+def test_wheel_invalid():
+    with pytest.raises(ValueError):
+        TimerWheel(0)
+    with pytest.raises(ValueError):
+        TimerWheel(0.01, 0)
+
+
+class Responder:
+    """ Other end of a socketpair answering echo requests. Hosts ending
+        in .1 never answer, .2 only to their second request, .3 from
+        another address and .4 after 50 ms. """
+
+    def __init__(self, sock: socket) -> None:
+        self.sock = sock
+        self.requests = {}
+        self.stop = Event()
+        self.thread = Thread(target=self.run)
+        self.thread.start()
+
+    def run(self) -> None:
+        self.sock.settimeout(0.01)
+        while not self.stop.is_set():
+            try:
+                data = self.sock.recv(65536)
+            except timeout:
+                continue
+            ip, icmp = decode_packet(data)
+            assert ip.protocol == IPPROTO_ICMP and icmp.type == ICMPMessage.ECHO
+            assert inet_checksum(data[:20]) == 0 and inet_checksum(data[20:]) == 0
+            host = ip.dst_addr.rsplit(".", 1)[1]
+            count = self.requests[ip.dst_addr] = self.requests.get(ip.dst_addr, 0) + 1
+            if host == "1" or host == "2" and count == 1:
+                continue
+            if host == "4":
+                sleep(0.05)
+            reply_ip = IPHeader(version=4, header_len=20, tos=0, total_len=0, identifier=0,
+                                flags=0, frag_offset=0, ttl=57, protocol=IPPROTO_ICMP,
+                                checksum=0, src_addr="192.0.2.99" if host == "3" else ip.dst_addr,
+                                dst_addr=ip.src_addr)
+            reply = ICMPHeader(type=ICMPMessage.ECHO_REPLY, code=0, checksum=0,
+                               identifier=icmp.identifier, seq_num=icmp.seq_num,
+                               data=bytes(icmp.data))
+            self.sock.send(bytes(reply_ip / reply))
+
+    def close(self) -> None:
+        self.stop.set()
+        self.thread.join()
+
+
+@pytest.fixture
+def pair():
+    a, b = socketpair(AF_UNIX, SOCK_DGRAM)
+    responder = Responder(b)
+    yield a, responder
+    responder.close()
+    a.close()
+    b.close()
+
+
+def test_sweep(pair):
+    sock, responder = pair
+    ip = IPHeader(version=4, header_len=20, tos=0, total_len=0, identifier=0, flags=0,
+                  frag_offset=0, ttl=64, protocol=IPPROTO_ICMP, checksum=0,
+                  src_addr="10.0.0.100", dst_addr="0.0.0.0")
+    sweeper = EchoSweeper(sock, ip, timeout=0.2, retries=2, batch_size=8, max_pending=10)
+    hosts = list(IPv4Network("10.0.0.0/28").hosts())
+    results = {result.addr: result for result in sweeper.sweep(hosts)}
+    # The caller's header is left alone.
+    assert ip.dst_addr == "0.0.0.0" and ip.total_len == 0
+
+    assert sorted(results) == sorted(map(str, hosts))
+    never = results["10.0.0.1"]
+    assert (never.rtt, never.attempts, never.ttl) == (None, 3, None)
+    retried = results["10.0.0.2"]
+    assert retried.attempts == 2 and 0 < retried.rtt < 0.2 and retried.ttl == 57
+    # Replies from another address do not count.
+    assert results["10.0.0.3"].rtt is None and responder.requests["10.0.0.3"] == 3
+    assert results["10.0.0.4"].rtt >= 0.05
+    for host in range(5, 15):
+        result = results[f"10.0.0.{host}"]
+        assert result.attempts == 1 and result.ttl == 57 and 0 < result.rtt < 0.2
+
+    stats = sweeper.stats
+    assert (stats.replies, stats.timeouts, stats.retries) == (12, 2, 5)
+    assert stats.sent == 14 + 5 == sum(responder.requests.values())
+    assert stats.unmatched == 3 and stats.hosts_per_second > 0
+
+
+def test_sweep_integer_targets(pair):
+    sock, responder = pair
+    sweeper = EchoSweeper(sock, timeout=0.1, retries=0, pacer=Pacer(pps=1000))
+    results = list(sweeper.sweep(range(0x0A000105, 0x0A000109)))
+    assert sorted(result.addr for result in results) == [f"10.0.1.{i}" for i in range(5, 9)]
+    assert all(result.rtt is not None for result in results)
+    assert list(sweeper.sweep([])) == [] and sweeper.stats.sent == 0
+
+
+@pytest.mark.parametrize("kwargs", [{"timeout": 0}, {"retries": -1}, {"max_pending": 0},
+                                    {"data_size": 7}])
+def test_invalid(kwargs):
+    with socket(AF_UNIX, SOCK_DGRAM) as sock:
+        with pytest.raises(ValueError):
+            EchoSweeper(sock, **kwargs)
+
+
+def test_loopback():
+    try:
+        sock = socket(AF_INET, SOCK_RAW, IPPROTO_ICMP)
+    except PermissionError:
+        pytest.skip("raw sockets need privileges")
+    with sock:
+        sock.setsockopt(IPPROTO_IP, IP_HDRINCL, 1)
+        sweeper = EchoSweeper(sock, timeout=0.5, retries=1)
+        results = list(sweeper.sweep(f"127.0.2.{i}" for i in range(1, 101)))
+    assert len(results) == 100
+    assert sum(result.rtt is not None for result in results) >= 99
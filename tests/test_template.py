@@ -0,0 +1,91 @@
+from protohdr import *
+
+from dataclasses import replace
+from random import Random
+from socket import IPPROTO_ICMP, IPPROTO_TCP, IPPROTO_UDP
+
+import pytest
+
+
+def headers(protocol: int, v6: bool = False):
+    if v6:
+        ip = IPv6Header(version=6, traffic_class=0, flow_label=0, payload_len=0, next_header=0,
+                        hop_limit=64, src_addr="2001:db8::1", dst_addr="2001:db8::2")
+    else:
+        ip = IPHeader(version=4, header_len=20, tos=0, total_len=0, identifier=1,
+                      flags=IPFlag.DONT_FRAG, frag_offset=0, ttl=64, protocol=protocol,
+                      checksum=0, src_addr="10.0.0.1", dst_addr="10.0.0.2")
+    if protocol == IPPROTO_TCP:
+        transport = TCPHeader(src_port=1000, dst_port=80, seq_num=0, ack_num=0, data_offset=0,
+                              flags=TCPFlag.SYN, window=1024, checksum=0, urg_ptr=0,
+                              options=TCPOption.mss(1460))
+        fields = ("src_port", "seq_num")
+    elif protocol == IPPROTO_UDP:
+        transport = UDPHeader(src_port=1000, dst_port=53, header_len=0, checksum=0, data=b"odd")
+        fields = ("src_port", "dst_port")
+    else:
+        transport = ICMPHeader(type=ICMPMessage.ECHO, code=0, checksum=0, identifier=0,
+                               seq_num=0, data=b"ping")
+        fields = ("identifier", "seq_num")
+    # Fill in the lengths once, as a template does not.
+    bytes(ip / transport)
+    return ip, transport, fields
+
+
+def random_values(rng: Random, v6: bool, fields: tuple[str, ...], tcp: bool) -> tuple:
+    if v6:
+        ip = (f"2001:db8::{rng.getrandbits(16):x}",)
+    else:
+        ip = (rng.getrandbits(16), f"192.168.{rng.randrange(256)}.{rng.randrange(256)}")
+    return ip + tuple(rng.getrandbits(32 if tcp and name == "seq_num" else 16) for name in fields)
+
+
+@pytest.mark.parametrize("v6", [False, True], ids=["ipv4", "ipv6"])
+@pytest.mark.parametrize("protocol", [IPPROTO_TCP, IPPROTO_UDP, IPPROTO_ICMP])
+def test_matches_packet(protocol, v6):
+    ip, transport, fields = headers(protocol, v6)
+    ip_fields = ("dst_addr",) if v6 else ("identifier", "dst_addr")
+    template = PacketTemplate(ip, transport, ip_fields, fields)
+    rng = Random(protocol)
+    buf = bytearray(len(template) + 5)
+    for _ in range(200):
+        values = random_values(rng, v6, fields, protocol == IPPROTO_TCP)
+        expected_ip = replace(ip, **dict(zip(ip_fields, values)))
+        expected_tp = replace(transport, **dict(zip(fields, values[len(ip_fields):])))
+        expected = bytes(Packet(expected_ip, expected_tp))
+        assert template.build(*values) == expected
+        assert template.pack_into(buf, 5, *values) == len(expected)
+        assert buf[5:] == expected
+
+
+def test_packets():
+    ip, transport, fields = headers(IPPROTO_TCP)
+    template = PacketTemplate(ip, transport, ("dst_addr",), ("seq_num",))
+    rows = [("10.0.0.3", 1), ("10.0.0.4", 2)]
+    assert list(template.packets(rows)) == [template.build(*row) for row in rows]
+
+
+def test_unpatchable_fields():
+    ip, transport, fields = headers(IPPROTO_TCP)
+    for ip_fields, tp_fields in ((("checksum",), ()), (("flags",), ()), ((), ("options",))):
+        with pytest.raises(ValueError):
+            PacketTemplate(ip, transport, ip_fields, tp_fields)
+    # The protocol is in the pseudo-header under the transport checksum.
+    for protocol in (IPPROTO_TCP, IPPROTO_UDP, IPPROTO_ICMP):
+        for v6 in (False, True):
+            ip, transport, fields = headers(protocol, v6)
+            with pytest.raises(ValueError):
+                PacketTemplate(ip, transport, ("next_header" if v6 else "protocol",))
+    ip, transport, fields = headers(IPPROTO_TCP)
+    template = PacketTemplate(ip, transport, ("ttl",))
+    with pytest.raises(ValueError):
+        template.build()
+    with pytest.raises(ValueError):
+        template.pack_into(bytearray(len(template) - 1), 0, 1)
+
+
+def test_headers_are_not_modified():
+    ip, transport, fields = headers(IPPROTO_UDP)
+    before = (replace(ip), replace(transport))
+    PacketTemplate(ip, transport, ("dst_addr",), fields).build("1.1.1.1", 1, 2)
+    assert (ip, transport) == before
@@ -0,0 +1,158 @@
+from protohdr import *
+
+from socket import (
+    AF_INET, AF_UNIX, IPPROTO_ICMP, IPPROTO_IP, IPPROTO_TCP, IPPROTO_UDP, IP_HDRINCL,
+    SOCK_DGRAM, SOCK_RAW, socket, socketpair, timeout,
+)
+from threading import Event, Thread
+
+import pytest
+
+
+HOPS = 5
+""" TTL at which the simulated destinations answer. """
+
+
+def ip_header(src_addr: str, dst_addr: str, protocol: int) -> IPHeader:
+    return IPHeader(version=4, header_len=20, tos=0, total_len=0, identifier=0, flags=0,
+                    frag_offset=0, ttl=60, protocol=protocol, checksum=0,
+                    src_addr=src_addr, dst_addr=dst_addr)
+
+
+class Network:
+    """ Other end of a socketpair routing probes over 5 hops: router
+        10.99.<ttl>.1 answers TTLs below 5, except the silent one at TTL
+        2, and the destination answers the rest. TCP answers go through
+        a second socketpair, as they arrive on another raw socket. """
+
+    def __init__(self, protocol: int) -> None:
+        self.protocol = protocol
+        self.probes, self.sock = socketpair(AF_UNIX, SOCK_DGRAM)
+        self.tcp, self.tcp_out = socketpair(AF_UNIX, SOCK_DGRAM)
+        self.stop = Event()
+        self.thread = Thread(target=self.run)
+        self.thread.start()
+
+    def run(self) -> None:
+        self.sock.settimeout(0.01)
+        while not self.stop.is_set():
+            try:
+                data = self.sock.recv(65536)
+            except timeout:
+                continue
+            ip, probe = decode_packet(data)
+            assert inet_checksum(data[:20]) == 0 and ip.total_len == len(data)
+            assert ip.protocol == self.protocol
+            quote = data[:28]
+            if ip.ttl == 2:
+                continue
+            out = self.sock
+            if ip.ttl < HOPS:
+                answer = ip_header(f"10.99.{ip.ttl}.1", ip.src_addr, IPPROTO_ICMP) / ICMPHeader(
+                    type=ICMPMessage.TIME_EXCEEDED, code=0, checksum=0, identifier=0, seq_num=0,
+                    data=quote)
+            elif self.protocol == IPPROTO_UDP:
+                answer = ip_header(ip.dst_addr, ip.src_addr, IPPROTO_ICMP) / ICMPHeader(
+                    type=ICMPMessage.DESTINATION_UNREACHABLE, code=3, checksum=0, identifier=0,
+                    seq_num=0, data=quote)
+            elif self.protocol == IPPROTO_ICMP:
+                answer = ip_header(ip.dst_addr, ip.src_addr, IPPROTO_ICMP) / ICMPHeader(
+                    type=ICMPMessage.ECHO_REPLY, code=0, checksum=0, identifier=probe.identifier,
+                    seq_num=probe.seq_num)
+            else:
+                answer = ip_header(ip.dst_addr, ip.src_addr, IPPROTO_TCP) / TCPHeader(
+                    src_port=probe.dst_port, dst_port=probe.src_port, seq_num=1,
+                    ack_num=(probe.seq_num + 1) & 0xFFFFFFFF, data_offset=0,
+                    flags=TCPFlag.RST | TCPFlag.ACK, window=0, checksum=0, urg_ptr=0)
+                out = self.tcp_out
+            out.send(bytes(answer))
+
+    def close(self) -> None:
+        self.stop.set()
+        self.thread.join()
+        for sock in (self.probes, self.sock, self.tcp, self.tcp_out):
+            sock.close()
+
+
+@pytest.fixture(params=[IPPROTO_UDP, IPPROTO_TCP, IPPROTO_ICMP])
+def network(request):
+    network = Network(request.param)
+    yield network
+    network.close()
+
+
+def test_trace(network):
+    ip = ip_header("10.0.0.1", "0.0.0.0", 0)
+    tracer = Tracer(network.probes, network.protocol, listen=(network.tcp,), ip=ip, max_ttl=8,
+                    timeout=0.2, retries=1, max_pending=40)
+    dsts = [f"10.1.{i}.{j}" for i in range(2) for j in range(1, 11)] + ["10.1.0.1"]
+    hops = list(tracer.trace(dsts))
+    assert ip.dst_addr == "0.0.0.0" and ip.ttl == 60
+
+    assert sorted(tracer.routes) == sorted(set(dsts))
+    for dst, route in tracer.routes.items():
+        assert route.reached == HOPS
+        assert route.path == ["10.99.1.1", None, "10.99.3.1", "10.99.4.1", dst]
+        assert route.hops[1].icmp_type == ICMPMessage.TIME_EXCEEDED
+        assert all(0 < hop.rtt < 0.2 for ttl, hop in route.hops.items() if ttl != 2)
+        reached = route.hops[HOPS]
+        assert reached.reached and reached.addr == dst
+        if network.protocol == IPPROTO_TCP:
+            assert reached.icmp_type is None
+    # The silent router times out once per destination, after a retry.
+    stats = tracer.stats
+    assert (stats.timeouts, stats.retries) == (20, 20)
+    assert stats.replies == 20 * (HOPS - 1) == sum(hop.addr is not None for hop in hops)
+    # Every TTL is probed up front, whatever the destination answers.
+    assert stats.sent == 20 * 8 + 20
+
+
+def test_foreign_answers(network):
+    tracer = Tracer(network.probes, network.protocol, listen=(network.tcp,),
+                    ip=ip_header("10.0.0.1", "0.0.0.0", 0), max_ttl=3, timeout=0.1)
+    other = Tracer(network.probes, network.protocol, ip=ip_header("10.0.0.1", "0.0.0.0", 0),
+                   max_ttl=3, timeout=0.1)
+    # Another tracer's probes quote its own ports and cookie.
+    network.probes.send(other._template.build(1, "10.0.0.1", "10.1.0.1", other._encode(1)))
+    hops = list(tracer.trace(["10.1.0.2"]))
+    assert len(hops) == 3 and tracer.routes["10.1.0.2"].path == ["10.99.1.1", None, "10.99.3.1"]
+    assert tracer.stats.unmatched == 1
+
+
+def test_probes():
+    with socket(AF_UNIX, SOCK_DGRAM) as sock:
+        tracer = Tracer(sock, IPPROTO_TCP, ip=ip_header("10.0.0.1", "0.0.0.0", 0), port=443)
+    probe = tracer._template.build(7, "10.0.0.1", "192.0.2.1", tracer._encode(7))
+    ip, tcp = decode_packet(probe)
+    # The template carries the lengths filled in by Packet.
+    assert (ip.ttl, ip.dst_addr, ip.protocol) == (7, "192.0.2.1", IPPROTO_TCP)
+    assert ip.total_len == len(probe) and tcp.data_offset == 32
+    assert tcp.dst_port == 443 and tcp.flags == TCPFlag.SYN and tcp.seq_num & 0xFF == 7
+    assert inet_checksum(probe[:20]) == 0 and inet_transport_checksum(probe[20:], ip) == 0
+
+
+@pytest.mark.parametrize("kwargs", [{"protocol": 47}, {"first_ttl": 0}, {"max_ttl": 256},
+                                    {"first_ttl": 5, "max_ttl": 4}, {"timeout": 0},
+                                    {"retries": -1}, {"max_pending": 29},
+                                    {"port": 65500, "max_ttl": 40}])
+def test_invalid(kwargs):
+    with socket(AF_UNIX, SOCK_DGRAM) as sock:
+        with pytest.raises(ValueError):
+            Tracer(sock, **kwargs)
+
+
+@pytest.mark.parametrize("protocol", [IPPROTO_UDP, IPPROTO_TCP, IPPROTO_ICMP])
+def test_loopback(protocol):
+    try:
+        sock = socket(AF_INET, SOCK_RAW, IPPROTO_ICMP)
+        tcp = socket(AF_INET, SOCK_RAW, IPPROTO_TCP)
+    except PermissionError:
+        pytest.skip("raw sockets need privileges")
+    with sock, tcp:
+        sock.setsockopt(IPPROTO_IP, IP_HDRINCL, 1)
+        tracer = Tracer(sock, protocol, listen=(tcp,), port=9 if protocol == IPPROTO_TCP else None,
+                        max_ttl=4, timeout=0.5)
+        list(tracer.trace(["127.0.0.1", "127.0.0.2"]))
+    # Loopback destinations answer at the first hop.
+    assert {dst: route.path for dst, route in tracer.routes.items()} == {
+        "127.0.0.1": ["127.0.0.1"], "127.0.0.2": ["127.0.0.2"]}
@@ -0,0 +1,66 @@
+from protohdr import *
+
+from random import Random
+from socket import AF_INET6, IPPROTO_ICMPV6, IPPROTO_TCP, IPPROTO_UDP, inet_aton, inet_pton
+from struct import pack
+
+import pytest
+
+
+def wire_checksum(data: bytes) -> int:
+    """ Checksum with an odd trailing byte padded as on the wire. """
+    return inet_checksum(data + b"\x00" * (len(data) & 1))
+
+
+def test_matches_pseudo_header_concatenation():
+    rng = Random(4)
+    for _ in range(300):
+        src = ".".join(str(rng.randrange(256)) for _ in range(4))
+        dst = ".".join(str(rng.randrange(256)) for _ in range(4))
+        protocol = rng.choice((IPPROTO_TCP, IPPROTO_UDP))
+        segment = rng.randbytes(rng.randrange(8, 200))
+        pseudo = inet_aton(src) + inet_aton(dst) + pack("!BBH", 0, protocol, len(segment))
+        expected = wire_checksum(pseudo + segment)
+        if protocol == IPPROTO_UDP and not expected:
+            expected = 0xFFFF
+        got = inet_transport_checksum(segment, src_addr=src, dst_addr=dst, protocol=protocol)
+        assert got == expected
+
+
+def test_ipv6_pseudo_header():
+    rng = Random(6)
+    src, dst = "2001:db8::1", "fe80::1234:5678"
+    for protocol in (IPPROTO_TCP, IPPROTO_UDP, IPPROTO_ICMPV6):
+        segment = rng.randbytes(77)
+        pseudo = (inet_pton(AF_INET6, src) + inet_pton(AF_INET6, dst)
+                  + pack("!I3xB", len(segment), protocol))
+        got = inet_transport_checksum(segment, src_addr=src, dst_addr=dst, protocol=protocol)
+        assert got == wire_checksum(pseudo + segment)
+
+
+def test_fields_from_ip_header():
+    ip = IPHeader(version=4, header_len=20, tos=0, total_len=0, identifier=0, flags=0,
+                  frag_offset=0, ttl=64, protocol=IPPROTO_TCP, checksum=0,
+                  src_addr="10.0.0.1", dst_addr="10.0.0.2")
+    segment = Random(1).randbytes(41)
+    expected = inet_transport_checksum(segment, src_addr="10.0.0.1", dst_addr="10.0.0.2",
+                                       protocol=IPPROTO_TCP)
+    assert inet_transport_checksum(segment, ip) == expected
+    # Explicit values override the header.
+    assert inet_transport_checksum(segment, ip, protocol=IPPROTO_UDP) == inet_transport_checksum(
+        segment, src_addr="10.0.0.1", dst_addr="10.0.0.2", protocol=IPPROTO_UDP)
+
+
+def test_zero_udp_checksum_sent_as_ones():
+    args = dict(src_addr="1.2.3.4", dst_addr="5.6.7.8")
+    for protocol, zero in ((IPPROTO_TCP, 0), (IPPROTO_UDP, 0xFFFF)):
+        # Storing the checksum in the segment makes it sum to zero.
+        segment = bytearray(Random(2).randbytes(20))
+        segment[-2:] = b"\x00\x00"
+        segment[-2:] = inet_transport_checksum(segment, protocol=protocol, **args).to_bytes(2, "big")
+        assert inet_transport_checksum(segment, protocol=protocol, **args) == zero
+
+
+def test_missing_pseudo_header_fields():
+    with pytest.raises(ValueError):
+        inet_transport_checksum(b"abcd", src_addr="1.2.3.4", dst_addr="5.6.7.8")
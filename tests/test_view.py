@@ -0,0 +1,81 @@
+from protohdr import *
+
+from random import Random
+from socket import IPPROTO_ICMP, IPPROTO_TCP, IPPROTO_UDP, inet_aton
+from struct import pack
+
+import pytest
+
+
+IP_FIELDS = ("version", "header_len", "tos", "total_len", "identifier", "flags",
+             "frag_offset", "ttl", "protocol", "checksum", "src_addr", "dst_addr")
+
+
+def random_packet(rng: Random, protocol: int) -> bytes:
+    ip = IPHeader(version=4, header_len=20, tos=rng.getrandbits(8), total_len=0,
+                  identifier=rng.getrandbits(16), flags=rng.getrandbits(2), frag_offset=0,
+                  ttl=rng.getrandbits(8), protocol=protocol, checksum=0,
+                  src_addr=f"10.{rng.randrange(256)}.0.1", dst_addr=f"172.16.0.{rng.randrange(256)}")
+    data = rng.randbytes(rng.randrange(64))
+    if protocol == IPPROTO_TCP:
+        transport = TCPHeader(src_port=rng.getrandbits(16), dst_port=rng.getrandbits(16),
+                              seq_num=rng.getrandbits(32), ack_num=rng.getrandbits(32),
+                              data_offset=0, flags=rng.getrandbits(9), window=rng.getrandbits(16),
+                              checksum=0, urg_ptr=rng.getrandbits(16),
+                              options=rng.randbytes(4 * rng.randrange(11)), data=data)
+    elif protocol == IPPROTO_UDP:
+        transport = UDPHeader(src_port=rng.getrandbits(16), dst_port=rng.getrandbits(16),
+                              header_len=0, checksum=0, data=data)
+    else:
+        transport = ICMPHeader(type=rng.getrandbits(8), code=rng.getrandbits(8), checksum=0,
+                               identifier=rng.getrandbits(16), seq_num=rng.getrandbits(16),
+                               data=data)
+    return bytes(ip / transport)
+
+
+def test_ip_view_network_order():
+    raw = pack("!BBHHHBBH4s4s", 0x45, 0x10, 40, 0x1234, 0x4000 | 185, 64, IPPROTO_TCP,
+               0xBEEF, inet_aton("10.0.0.1"), inet_aton("10.0.0.2"))
+    view = IPView(raw)
+    assert (view.total_len, view.identifier, view.flags, view.frag_offset, view.checksum) == (
+        40, 0x1234, IPFlag.DONT_FRAG, 185, 0xBEEF)
+    assert (view.src_addr, view.dst_addr) == ("10.0.0.1", "10.0.0.2")
+
+
+@pytest.mark.parametrize("protocol", [IPPROTO_TCP, IPPROTO_UDP, IPPROTO_ICMP])
+def test_views_match_decoded_headers(protocol):
+    rng = Random(protocol)
+    for _ in range(100):
+        pkt = b"\x00\x00" + random_packet(rng, protocol)
+        ip, transport = decode_packet(pkt, 2)
+        ip_view, transport_view = view_packet(pkt, 2)
+        for name in IP_FIELDS:
+            assert getattr(ip_view, name) == getattr(ip, name), name
+        for name in transport.__dataclass_fields__:
+            assert getattr(transport_view, name) == getattr(transport, name), name
+        assert ip_view.to_header() == ip
+        assert transport_view.to_header() == transport
+
+
+def test_view_reads_buffer_changes():
+    buf = bytearray(random_packet(Random(1), IPPROTO_UDP))
+    ip, udp = view_packet(buf)
+    buf[8] = 3
+    buf[22:24] = (4242).to_bytes(2, "big")
+    assert ip.ttl == 3 and udp.dst_port == 4242
+
+
+def test_view_packet_later_fragment():
+    buf = bytearray(random_packet(Random(2), IPPROTO_TCP))
+    buf[6:8] = (IPFlag.MORE_FRAGS << 13 | 0).to_bytes(2, "big")
+    assert type(view_packet(buf)[1]) is TCPView
+    buf[6:8] = (8).to_bytes(2, "big")
+    ip, transport = view_packet(buf)
+    assert ip.frag_offset == 8 and transport is None
+
+
+def test_view_truncated():
+    with pytest.raises(ValueError):
+        IPView(bytes(19))
+    with pytest.raises(ValueError):
+        TCPView(bytes(30), 11)